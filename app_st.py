@@ -1,9 +1,15 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import pickle
 import os
-from pages_charts.profile_wl import fig_wl_acc_type_count, fig_wl_acc_type_pct, fig_wl_country, fig_wl_country_pct
+from pages_charts.aggregate_cube import get_cube
+from pages_charts.data_table import render_paginated_table
+from pages_charts.filters import count_rows, render_sidebar_filters
+from pages_charts.page_builders import build_page_figures, build_period_figures
+from pages_charts.figure_registry import get_registry
+from pages_charts.prediction import render_prediction_page
+from pages_charts.assistant import render_assistant_page
+from pages_charts.cohort_analysis import render_cohort_page
+from pages_charts.export_panel import render_export_panel
+from pages_charts.instrumentation import finish_rerun, fragment, panel_enabled, render_perf_panel, span, start_rerun
 
 st.set_page_config(
     page_title="Sales Opportunities Dashboard (2024)",
@@ -12,73 +18,11 @@ st.set_page_config(
     initial_sidebar_state="expanded"
     )
 
+start_rerun()  # Timing spans, cache counters and memory of this rerun (see pages_charts/instrumentation.py)
+
 # Obter o caminho base do diretório onde o app.py está localizado
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# --------- Load the Charts -----------
-
-@st.cache_data  # Caches the function's output to optimize performance in Streamlit.
-def load_graphics():
-    graphics = {}  # Dictionary to store the loaded graphics.
-    file_paths = [
-        "charts/fig_dist_won_lost.pkl",
-        "charts/fig_wl_acc_type_count.pkl",
-        "charts/fig_wl_acc_type_pct.pkl",
-        "charts/fig_wl_country.pkl",
-        "charts/fig_wl_country_pct.pkl",
-        "charts/fig_wl_segment.pkl",
-        "charts/fig_wl_segment_pct.pkl",
-        "charts/fig_wl_month.pkl", 
-        "charts/fig_wl_month_pct.pkl",
-        "charts/fig_wl_quarter.pkl",
-        "charts/fig_wl_quarter_pct.pkl",
-        "charts/fig_month_value.pkl",
-        "charts/fig_month_value_pct.pkl",
-        "charts/fig_quarter_value.pkl",
-        "charts/fig_quarter_value_pct.pkl",
-
-        "charts/fig_wl_lead_source.pkl",
-        "charts/fig_wl_lead_source_pct.pkl",
-        "charts/fig_wl_type_business_count.pkl",
-        "charts/fig_wl_type_business_pct.pkl",
-        "charts/fig_won_wl_acc_type_pct.pkl",
-        "charts/fig_lost_wl_acc_type_pct.pkl",
-        "charts/fig_wl_close_reason_count.pkl",
-        "charts/fig_wl_close_reason_pct.pkl",
-        "charts/fig_quarter_value_pct.pkl",
-        
-        "charts/fig_wl_avg_ticket.pkl",
-        "charts/fig_wl_avg_ticket_account_type.pkl",
-        "charts/fig_wl_avg_ticket_country.pkl",
-        "charts/fig_wl_avg_ticket_segment.pkl",
-        
-        "charts/fig_wl_avg_time.pkl",
-        "charts/fig_wl_avg_time_account_type.pkl",
-        "charts/fig_wl_avg_time_type_business.pkl",
-        
-    ]
-
-    for path in file_paths:
-        full_path = os.path.join(BASE_DIR, path)  # Creates the absolute path to the file.
-        try:
-            if os.path.exists(full_path):  # Checks if the file exists.
-                with open(full_path, "rb") as file:  # Opens the file in read-binary mode.
-                    filename = os.path.basename(path)  # Extracts the filename.
-                    graphics[filename] = pickle.load(file)  # Loads the figure into the dictionary.
-            else:
-                st.warning(f"File {path} not found.")  # Displays a warning in Streamlit if the file is missing.
-        except Exception as e:
-            st.error(f"Error loading {path}: {e}")  # Displays an error message if loading fails.
-
-    return graphics  # Returns the dictionary containing the loaded graphics.
-
-graphics = load_graphics()  # Calls the function and stores the results in the `graphics` variable.
-
-# ------------- Load the Data ----------
-
-data = pd.read_csv("data/sales_preprocessed_data.csv")
-
-
 # ------ Merck Logo -------
 
 logo_path = os.path.join(BASE_DIR, "docs/merck_logo_blue.png")
@@ -97,11 +41,55 @@ page = st.sidebar.selectbox("Escolha uma página",
                              "Profile | WON vs. LOST",
                              "Average Ticket Analysis",
                              "Average Time to Close",
+                             "Cohort Analysis",
                              "Prediction",
                              "Agent Assistant"
                              ]
     )
 
+# Global filters (applied to every page)
+filters = render_sidebar_filters()
+
+# Background exports of the selected rows and of the page charts
+render_export_panel(filters)
+
+if filters:
+    st.info(f"Filters active: charts and tables use {count_rows(filters):,} of {count_rows():,} opportunities. The notes describe the full dataset.")
+
+
+# --------- Load the Charts -----------
+
+# Only the figures of the selected page are loaded (on first access, then kept in a bounded LRU).
+# With active filters, the page figures are rebuilt from the selected rows instead.
+registry = get_registry()
+with span("page_figures", page=page):
+    graphics = registry.page_figures(page) if not filters else build_page_figures(page, filters)
+
+for name, reason in registry.unreported_missing().items():
+    st.warning(reason)  # Reported once, not on every rerun.
+
+
+def plot_chart(name, figures=None):
+    # Displays a figure of the current page (or of the given figures), skipping the missing ones.
+    figures = graphics if figures is None else figures
+    if name in figures:
+        with span("chart", figure=name):
+            st.plotly_chart(figures[name], use_container_width=True)
+
+
+@fragment("Comment")
+def comment_box(key):
+    # Typing a comment reruns this box only
+    st.text_area("Comment about the charts:", "Add your observations..", key=f"comment_{key}")
+
+
+# Granularities of the Time Analysis charts: the default view shows the month and quarter
+# figures of the page, the others are built from the calendar rollup (no rows are read).
+TIME_VIEWS = ["Month and Quarter", "Week", "Month", "Quarter", "Year"]
+
+# Every chart / table section of the pages below is a fragment: its own widgets (granularity
+# radios, table pager, comment box) rerun that section only, from its cached inputs.
+
 
 # ----------- HOME PAGE --------------
 if page == "Home | Overview":
@@ -110,21 +98,29 @@ if page == "Home | Overview":
     st.header('Overview data')
     
     
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_dist_won_lost.pkl"], use_container_width=True)
-    with col2:
-        # Add notes:
-        st.markdown("""
-        **Notes:**
-        - As we can see, we have a balanced dataset between Won and Lost Opportunities to Analyse.
-        """)
-    
-    st.subheader("Dataset Details")
-    
-    st.dataframe(data)
+    @fragment("Overview")
+    def overview_section():
+        col1, col2 = st.columns(2)
+        with col1:
+            plot_chart("fig_dist_won_lost")
+        with col2:
+            # Add notes:
+            st.markdown("""
+            **Notes:**
+            - As we can see, we have a balanced dataset between Won and Lost Opportunities to Analyse.
+            """)
+
+    overview_section()
+
+    @fragment("Dataset Details")
+    def dataset_section():
+        st.subheader("Dataset Details")
+
+        render_paginated_table(selection=filters)  # Only the visible page is sent to the browser.
 
-    st.text_area("Comment about the charts:", "Add your observations..")
+    dataset_section()
+
+    comment_box(page)
         
         
 # ----------- PROFILE PAGE --------------
@@ -146,174 +142,222 @@ elif page == "Profile | WON vs. LOST":
     
     
     ### -----------  Close Reasons --------------
-    st.subheader('Close Reason Analysis')
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_wl_close_reason_count.pkl"], use_container_width=True)
-        
-    with col2:
-        st.plotly_chart(graphics["fig_wl_close_reason_pct.pkl"], use_container_width=True)
-        
-    st.markdown("""
-    Notes | Close Reason:
-    "Automatically" was main for both. However, doesn't considerin it, we have:
+    @fragment("Close Reason")
+    def close_reason_section():
+        st.subheader('Close Reason Analysis')
+
+        col1, col2 = st.columns(2)
+        with col1:
+            plot_chart("fig_wl_close_reason_count")
+
+        with col2:
+            plot_chart("fig_wl_close_reason_pct")
+
+        st.markdown("""
+        Notes | Close Reason:
+        "Automatically" was main for both. However, doesn't considerin it, we have:
+
+        - The Top 3 Closed Lost reasons: Project/Budget Cancelled/Out of Business (6.92%), Price (5.97%), Unable to confirm Sale (3.56%)
+        - The Top 3 Closed Won reasons: Brand Recognition/Supplier Reputation (13.01%), Customer Relationship (11.22%), Price (9.19%)
+        - Insight: These patterns suggest that strong brand recognition and supplier reputation are key drivers for success, while price plays a significant role in both won and lost opportunities. 
+        The higher impact of customer relationships on closed-won deals highlights the importance of maintaining strong connections with clients.
+        """)
+
+    close_reason_section()
+
 
-    - The Top 3 Closed Lost reasons: Project/Budget Cancelled/Out of Business (6.92%), Price (5.97%), Unable to confirm Sale (3.56%)
-    - The Top 3 Closed Won reasons: Brand Recognition/Supplier Reputation (13.01%), Customer Relationship (11.22%), Price (9.19%)
-    - Insight: These patterns suggest that strong brand recognition and supplier reputation are key drivers for success, while price plays a significant role in both won and lost opportunities. 
-    The higher impact of customer relationships on closed-won deals highlights the importance of maintaining strong connections with clients.
-    """)
-   
-    
 
     ### -----------  Account Type --------------
-    st.subheader('Account Type')
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_wl_acc_type_count.pkl"], use_container_width=True)
-        
-    with col2:
-        st.plotly_chart(graphics["fig_wl_acc_type_pct.pkl"], use_container_width=True)
-        
-    st.markdown("""
-    Notes | Account Type:
-    - Small Accounts account for the highest proportion of LOST deals, with 51.89% LOST compared to 48.11% WON.
-    - Top 1 Accounts, on the other hand, have a lower loss rate, with only 38.98% resulting in a loss and 61.02% being successfully closed.
-    - This suggests that larger accounts have a higher chance of success, while small accounts face more challenges in closing deals.
-    """)
-    
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_won_wl_acc_type_pct.pkl"], use_container_width=True)
-    with col2:
-        st.plotly_chart(graphics["fig_lost_wl_acc_type_pct.pkl"], use_container_width=True)
-    
-    
-    
+    @fragment("Account Type")
+    def account_type_section():
+        st.subheader('Account Type')
+
+        col1, col2 = st.columns(2)
+        with col1:
+            plot_chart("fig_wl_acc_type_count")
+
+        with col2:
+            plot_chart("fig_wl_acc_type_pct")
+
+        st.markdown("""
+        Notes | Account Type:
+        - Small Accounts account for the highest proportion of LOST deals, with 51.89% LOST compared to 48.11% WON.
+        - Top 1 Accounts, on the other hand, have a lower loss rate, with only 38.98% resulting in a loss and 61.02% being successfully closed.
+        - This suggests that larger accounts have a higher chance of success, while small accounts face more challenges in closing deals.
+        """)
+
+
+        col1, col2 = st.columns(2)
+        with col1:
+            plot_chart("fig_won_wl_acc_type_pct")
+        with col2:
+            plot_chart("fig_lost_wl_acc_type_pct")
+
+    account_type_section()
+
+
+
     ### -----------  Country --------------
-    st.subheader('Country')
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_wl_country.pkl"], use_container_width=True)
-    with col2:
-        st.plotly_chart(graphics["fig_wl_country_pct.pkl"], use_container_width=True)
-    
-    st.markdown("""
-    Notes | Country:
-    - Country 5: Best results, with 83.13% of deals won, indicating strong performance.
-    - Country 2: Worst results, with 57.05% of opportunities lost, reflecting poor performance.
-    - Country 1: Moderate results, with 59.23% of deals won, indicating average performance.
-    - Insight: The data suggests that Country 5 is the strongest performer in numer of deals, while Country 2 requires attention to improve its conversion rates. 
-    Country 1 shows average results, indicating potential for growth with targeted strategies.
-    """)
+    @fragment("Country")
+    def country_section():
+        st.subheader('Country')
+
+        col1, col2 = st.columns(2)
+        with col1:
+            plot_chart("fig_wl_country")
+        with col2:
+            plot_chart("fig_wl_country_pct")
+
+        st.markdown("""
+        Notes | Country:
+        - Country 5: Best results, with 83.13% of deals won, indicating strong performance.
+        - Country 2: Worst results, with 57.05% of opportunities lost, reflecting poor performance.
+        - Country 1: Moderate results, with 59.23% of deals won, indicating average performance.
+        - Insight: The data suggests that Country 5 is the strongest performer in numer of deals, while Country 2 requires attention to improve its conversion rates. 
+        Country 1 shows average results, indicating potential for growth with targeted strategies.
+        """)
+
+    country_section()
+
 
-    
     ### -----------  Segment --------------
-    st.subheader('Segment')
-    
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_wl_segment.pkl"], use_container_width=True)
-    with col2:
-        st.plotly_chart(graphics["fig_wl_segment_pct.pkl"], use_container_width=True) 
-    
-    # Add notes:
-    st.markdown("""
-    Notes | Segments:
-    - Segment 1: 46.27% LOST vs. 29.58% WON – Dominates in LOST opportunities, indicating potential for improvement.
-    - Segment 2: 25.13% LOST vs. 33.41% WON – Shows balanced performance, with a higher proportion of WON deals. This represents the Segment that we have better performance among the segments
-    """)
-    
-    
+    @fragment("Segment")
+    def segment_section():
+        st.subheader('Segment')
+
+
+        col1, col2 = st.columns(2)
+        with col1:
+            plot_chart("fig_wl_segment")
+        with col2:
+            plot_chart("fig_wl_segment_pct") 
+
+        # Add notes:
+        st.markdown("""
+        Notes | Segments:
+        - Segment 1: 46.27% LOST vs. 29.58% WON – Dominates in LOST opportunities, indicating potential for improvement.
+        - Segment 2: 25.13% LOST vs. 33.41% WON – Shows balanced performance, with a higher proportion of WON deals. This represents the Segment that we have better performance among the segments
+        """)
+
+    segment_section()
+
+
     ### -----------  Time Analysis in Number --------------
     
-    st.subheader('Time Analysis')
+    @fragment("Time Analysis")
+    def time_section():
+        st.subheader('Time Analysis')
+
+        time_view = st.radio("Granularity", TIME_VIEWS, horizontal=True, key="time_view")
+        col1, col2 = st.columns(2)
+        if time_view == TIME_VIEWS[0]:
+            with col1:
+                plot_chart("fig_wl_month")
+                plot_chart("fig_wl_quarter")
+
+            with col2:
+                plot_chart("fig_wl_month_pct")
+                plot_chart("fig_wl_quarter_pct")
+        else:
+            period_figures = build_period_figures(time_view, filters)
+            with col1:
+                plot_chart("fig_wl_period", period_figures)
+            with col2:
+                plot_chart("fig_wl_period_pct", period_figures)
 
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_wl_month.pkl"], use_container_width=True)
-        st.plotly_chart(graphics["fig_wl_quarter.pkl"], use_container_width=True)
-        
-    with col2:
-        st.plotly_chart(graphics["fig_wl_month_pct.pkl"], use_container_width=True)
-        st.plotly_chart(graphics["fig_wl_quarter_pct.pkl"], use_container_width=True)
-    
-    # Add notes:
-    st.markdown("""
-    Notes | Time Analysis:
-    - The month with more deals closed WON was March (4553 deals), representing 59.1% of the deals closed in the month. Followed by September (4166) (54.2%) and June (4091) (54.2%)
-    - In percentage february was the best, followed by March and April.
+        # Add notes:
+        st.markdown("""
+        Notes | Time Analysis:
+        - The month with more deals closed WON was March (4553 deals), representing 59.1% of the deals closed in the month. Followed by September (4166) (54.2%) and June (4091) (54.2%)
+        - In percentage february was the best, followed by March and April.
 
-    - In terms of Total Numer of deals, the best Quarter is the Q1, with 11.7K deals WONs
-    - Proportionaly, the Q2 is better, with 54.9% deals WON
+        - In terms of Total Numer of deals, the best Quarter is the Q1, with 11.7K deals WONs
+        - Proportionaly, the Q2 is better, with 54.9% deals WON
+
+        - January was the month with most LOSTs (5728), representing (59.4% of the deals closed on the month)
+        - In terms of Total Number of Deals and Proportionaly, the Q4 is the worse quarter. With 10.893 deals Lost, representing 53.3% of the total in the quarter
+        """)
+
+    time_section()
 
-    - January was the month with most LOSTs (5728), representing (59.4% of the deals closed on the month)
-    - In terms of Total Number of Deals and Proportionaly, the Q4 is the worse quarter. With 10.893 deals Lost, representing 53.3% of the total in the quarter
-    """)
-    
     ### -----------  Time Analysis in EUR (€) --------------
     
-    st.subheader('Time Analysis in EUR (€)')
+    @fragment("Time Analysis in EUR")
+    def time_value_section():
+        st.subheader('Time Analysis in EUR (€)')
+
+        value_time_view = st.radio("Granularity", TIME_VIEWS, horizontal=True, key="value_time_view")
+        col1, col2 = st.columns(2)
+        if value_time_view == TIME_VIEWS[0]:
+            with col1:
+                plot_chart("fig_month_value")
+                plot_chart("fig_quarter_value")
+
+            with col2:
+                plot_chart("fig_month_value_pct")
+                plot_chart("fig_quarter_value_pct")
+        else:
+            period_figures = build_period_figures(value_time_view, filters)
+            with col1:
+                plot_chart("fig_period_value", period_figures)
+            with col2:
+                plot_chart("fig_period_value_pct", period_figures)
+
+        # Add notes:
+        st.markdown("""
+        Notes | Time Analysis in EUR (€):
+        - Here we have similar comparisions, but in monetary terms.
+        """)
+
+    time_value_section()
+
 
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_month_value.pkl"], use_container_width=True)
-        st.plotly_chart(graphics["fig_quarter_value.pkl"], use_container_width=True)
-        
-    with col2:
-        st.plotly_chart(graphics["fig_month_value_pct.pkl"], use_container_width=True)
-        st.plotly_chart(graphics["fig_quarter_value_pct.pkl"], use_container_width=True)
-    
-    # Add notes:
-    st.markdown("""
-    Notes | Time Analysis in EUR (€):
-    - Here we have similar comparisions, but in monetary terms.
-    """)
-    
-    
     ### -----------  Business Type --------------
-    st.subheader('Type of Business')
-    
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_wl_type_business_count.pkl"], use_container_width=True)
-    with col2:
-        st.plotly_chart(graphics["fig_wl_type_business_pct.pkl"], use_container_width=True) 
-        
-    # Add notes:
-    st.markdown("""
-    Notes | Business type:
-    - Overall, the majority of opportunities stem from Existing Business.
-    - Among WON opportunities, 79.78% are from Existing Business, while 20.21% come from New Business.
-    - Among LOST opportunities, 75.55% are from Existing Business, with 22.68% coming from New Business. The difference between WON and LOST opportunities is minimal.
-    - This suggests that Existing Business plays a crucial role in both successful and unsuccessful deals, with a slight advantage in winning opportunities.
-    """)
-    
-     
+    @fragment("Business Type")
+    def business_type_section():
+        st.subheader('Type of Business')
+
+
+        col1, col2 = st.columns(2)
+        with col1:
+            plot_chart("fig_wl_type_business_count")
+        with col2:
+            plot_chart("fig_wl_type_business_pct") 
+
+        # Add notes:
+        st.markdown("""
+        Notes | Business type:
+        - Overall, the majority of opportunities stem from Existing Business.
+        - Among WON opportunities, 79.78% are from Existing Business, while 20.21% come from New Business.
+        - Among LOST opportunities, 75.55% are from Existing Business, with 22.68% coming from New Business. The difference between WON and LOST opportunities is minimal.
+        - This suggests that Existing Business plays a crucial role in both successful and unsuccessful deals, with a slight advantage in winning opportunities.
+        """)
+
+    business_type_section()
+
+
     ### -----------  Lead Source --------------
-    st.subheader('Lead Source')
-    
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_wl_lead_source.pkl"], use_container_width=True)
-    with col2:
-        st.plotly_chart(graphics["fig_wl_lead_source_pct.pkl"], use_container_width=True) 
-        
-    # Add notes:
-    st.markdown("""
-    Notes | Lead Source:
-    Note that we have a lot of Unknow data in Lead Source, however we bring the numbers that we have for abalysis:
-    - Top 3 WON: Referral, Sales Visit/Demo, Customer Events (!)
-    - Top 3 LOST:Referral, Sales Visit/Demo, Field Service.
-    """)
-    
+    @fragment("Lead Source")
+    def lead_source_section():
+        st.subheader('Lead Source')
+
+
+        col1, col2 = st.columns(2)
+        with col1:
+            plot_chart("fig_wl_lead_source")
+        with col2:
+            plot_chart("fig_wl_lead_source_pct") 
+
+        # Add notes:
+        st.markdown("""
+        Notes | Lead Source:
+        Note that we have a lot of Unknow data in Lead Source, however we bring the numbers that we have for abalysis:
+        - Top 3 WON: Referral, Sales Visit/Demo, Customer Events (!)
+        - Top 3 LOST:Referral, Sales Visit/Demo, Field Service.
+        """)
+
+    lead_source_section()
+
     # Add notes:
     st.markdown("""
     **Summary | WON vs. LOST Profiles**
@@ -344,7 +388,7 @@ elif page == "Profile | WON vs. LOST":
 
     
     
-    st.text_area("Comment about the charts:", "Add your observations..")
+    comment_box(page)
     
     
 # ----------- AVERAGE TICKET PAGE --------------   
@@ -359,90 +403,113 @@ elif page == "Average Ticket Analysis":
     - Is the average value of the won opportunities higher or lower than that of the lost opportunities?
     """)
     
+    # Stage x dimension aggregates behind the describe() tables, built once per dataset version and filter state:
+    # every section looks the cube up itself, so it can rerun alone.
+
     ### -----------  GENERAL --------------
-    st.subheader('General')
+    @fragment("Average Ticket")
+    def ticket_general_section():
+        cube = get_cube(filters=filters)
+        st.subheader('General')
+
+        # Display the stats table in Streamlit
+        stats_wl_at = cube.describe(' Opp Value (EUR)', 'Stage')    
+
+        col1, col2 = st.columns(2)
+        with col1:
+            plot_chart("fig_wl_avg_ticket")
+        with col2:
+            st.markdown("### Descriptive Statistics by Stage")
+            st.dataframe(stats_wl_at)
+            st.write("\n\n\n")
+            # Add notes:
+            st.markdown("""         
+            **Notes | General:**
+            In geraneral,
+            - The LOST Opportunities have a mean of 123.97 and the stand deviation of 161, lower than Wons
+            - The median of LOSTs is 61 EUR, lower than WONs (Median is better to analyse because is less sensitive to Outliers)
+            - The average value of WON ops are 166.29, bigger than Losts
+            - In general, the value of WON Opps are higher than LOST Opps
+            """)
+
+    ticket_general_section()
 
-    # Display the stats table in Streamlit
-    stats_wl_at = data.groupby('Stage')[' Opp Value (EUR)'].describe()    
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_wl_avg_ticket.pkl"], use_container_width=True)
-    with col2:
-        st.markdown("### Descriptive Statistics by Stage")
-        st.dataframe(stats_wl_at)
-        st.write("\n\n\n")
-        # Add notes:
-        st.markdown("""         
-        **Notes | General:**
-        In geraneral,
-        - The LOST Opportunities have a mean of 123.97 and the stand deviation of 161, lower than Wons
-        - The median of LOSTs is 61 EUR, lower than WONs (Median is better to analyse because is less sensitive to Outliers)
-        - The average value of WON ops are 166.29, bigger than Losts
-        - In general, the value of WON Opps are higher than LOST Opps
-        """)
-    
     ### -----------  DEEP DIVE BY ACCOUNT TYPE --------------
-    st.subheader('Deep Dive in Account Type')
+    @fragment("Average Ticket by Account Type")
+    def ticket_account_type_section():
+        cube = get_cube(filters=filters)
+        st.subheader('Deep Dive in Account Type')
+
+        # Display the stats table in Streamlit
+        stats_wl_at_account_type = cube.describe(' Opp Value (EUR)', [' Account Type', 'Stage'])
+
+
+        col1, col2 = st.columns(2)
+        with col1:
+            plot_chart("fig_wl_avg_ticket_account_type")
+        with col2:
+            st.markdown("### Descriptive Statistics by Account Type per Stage")
+            st.dataframe(stats_wl_at_account_type)
+            st.write("\n\n\n")
+            # Add notes:
+            st.markdown("""
+            **Notes | Account Type:**
+            - On LOST Opps, Small business have a higher mean Opp Value (EUR)
+            - On WON Opps, Top 2 business have a higher mean Opp Value (EUR) - Top 2 seems to bring more value for the company, in general
+            """)
+
+    ticket_account_type_section()
+
 
-    # Display the stats table in Streamlit
-    stats_wl_at_account_type = data.groupby([' Account Type', 'Stage'])[' Opp Value (EUR)'].describe()
-    
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_wl_avg_ticket_account_type.pkl"], use_container_width=True)
-    with col2:
-        st.markdown("### Descriptive Statistics by Account Type per Stage")
-        st.dataframe(stats_wl_at_account_type)
-        st.write("\n\n\n")
-        # Add notes:
-        st.markdown("""
-        **Notes | Account Type:**
-        - On LOST Opps, Small business have a higher mean Opp Value (EUR)
-        - On WON Opps, Top 2 business have a higher mean Opp Value (EUR) - Top 2 seems to bring more value for the company, in general
-        """)
-        
-        
     ### -----------  DEEP DIVE BY COUNTRY --------------
-    st.subheader('Deep Dive in Country')
+    @fragment("Average Ticket by Country")
+    def ticket_country_section():
+        cube = get_cube(filters=filters)
+        st.subheader('Deep Dive in Country')
+
+        # Display the stats table in Streamlit
+        stats_wl_at_country = cube.describe(' Opp Value (EUR)', ['Country', 'Stage'])
+
+        col1, col2 = st.columns(2)
+        with col1:
+            plot_chart("fig_wl_avg_ticket_country")
+        with col2:
+            st.markdown("### Descriptive Statistics by Contry per Stage")
+            st.dataframe(stats_wl_at_country)
+            st.write("\n\n\n")
+            # Add notes:
+            st.markdown("""
+            **Notes | Country:**
+            - The Mean Mean of WON Opportunities Occour on Country 1 - Mean of 211 EUR. However, is the country that we Sell less.
+            - The Major Mean of LOST Opportunities Occour on Country 5 - Mean of 209 EUR; Despite this, Country 5 is where our results proportionally is better in WONs (83% are WONs)
+            """)
+
+    ticket_country_section()
 
-    # Display the stats table in Streamlit
-    stats_wl_at_country = data.groupby(['Country', 'Stage'])[' Opp Value (EUR)'].describe()
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_wl_avg_ticket_country.pkl"], use_container_width=True)
-    with col2:
-        st.markdown("### Descriptive Statistics by Contry per Stage")
-        st.dataframe(stats_wl_at_country)
-        st.write("\n\n\n")
-        # Add notes:
-        st.markdown("""
-        **Notes | Country:**
-        - The Mean Mean of WON Opportunities Occour on Country 1 - Mean of 211 EUR. However, is the country that we Sell less.
-        - The Major Mean of LOST Opportunities Occour on Country 5 - Mean of 209 EUR; Despite this, Country 5 is where our results proportionally is better in WONs (83% are WONs)
-        """)
-        
     ### -----------  DEEP DIVE BY SEGMENT --------------
-    st.subheader('Deep Dive in Segment')
+    @fragment("Average Ticket by Segment")
+    def ticket_segment_section():
+        cube = get_cube(filters=filters)
+        st.subheader('Deep Dive in Segment')
+
+        # Display the stats table in Streamlit
+        stats_wl_at_segment = cube.describe(' Opp Value (EUR)', ['Segment', 'Stage'])
+
+        col1, col2 = st.columns(2)
+        with col1:
+            plot_chart("fig_wl_avg_ticket_segment")
+        with col2:
+            st.markdown("### Descriptive Statistics by Segment per Stage")
+            st.dataframe(stats_wl_at_segment)
+            st.write("\n\n\n")
+            # Add notes:
+            st.markdown("""
+            **Notes | Country:**
+            - On WON opportunities, Segment 4 represents the highest mean, with 233.90 EUR, suggesting that this segment has higher-value deals when successfully closed. Segment 4 has the highest variability (std 270.07 EUR for Won), which suggests that deals in this segment might range from very small to extremely large values.
+            - Segment 1 has the highest mean among LOST opportunities (127.18 EUR), meaning that this segment represents the largest volume of lost deals in terms of value.
+            """)
 
-    # Display the stats table in Streamlit
-    stats_wl_at_segment = data.groupby(['Segment', 'Stage'])[' Opp Value (EUR)'].describe()
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_wl_avg_ticket_segment.pkl"], use_container_width=True)
-    with col2:
-        st.markdown("### Descriptive Statistics by Segment per Stage")
-        st.dataframe(stats_wl_at_segment)
-        st.write("\n\n\n")
-        # Add notes:
-        st.markdown("""
-        **Notes | Country:**
-        - On WON opportunities, Segment 4 represents the highest mean, with 233.90 EUR, suggesting that this segment has higher-value deals when successfully closed. Segment 4 has the highest variability (std 270.07 EUR for Won), which suggests that deals in this segment might range from very small to extremely large values.
-        - Segment 1 has the highest mean among LOST opportunities (127.18 EUR), meaning that this segment represents the largest volume of lost deals in terms of value.
-        """)
+    ticket_segment_section()
 
 
 
@@ -458,95 +525,145 @@ elif page == "Average Time to Close":
     - Is there a pattern of lost opportunities by product type?
     """)
     
+    # Same cube as the Average Ticket page, looked up by every section
+
      ### -----------  GENERAL --------------
-    st.subheader('General')
+    @fragment("Average Time")
+    def time_general_section():
+        cube = get_cube(filters=filters)
+        st.subheader('General')
+
+        # Display the stats table in Streamlit
+        stats_wl_avg_time = cube.describe('Deal Opened (Days)', 'Stage')  
+
+        col1, col2 = st.columns(2)
+        with col1:
+            plot_chart("fig_wl_avg_time")
+        with col2:
+            st.markdown("### Descriptive Statistics by Stage")
+            st.dataframe(stats_wl_avg_time)
+            st.write("\n\n\n")
+            # Add notes:
+            st.markdown("""         
+            **Notes | General:**
+            - What is the average time for won opportunities and lost opportunities?
+            In general:
+            - Closed Lost	~ 76 days
+            - Closed Won - ~ 35 days
+
+            What is the difference between the times for won and lost opportunities?
+            - The mean duration for won opportunities differs from that of lost opportunities by 40 days. This suggests that when an opportunity remains open for too long, the chances of it not closing successfully—or taking longer to close—increase.
+            - It is more expressive for small opportunities
+            - Among the different Account Types, 'Top2' has the shortest average closing time for successful deals, at 31 days.
+            """)
+
+    time_general_section()
 
-    # Display the stats table in Streamlit
-    stats_wl_avg_time = data.groupby('Stage')['Deal Opened (Days)'].describe()  
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_wl_avg_time.pkl"], use_container_width=True)
-    with col2:
-        st.markdown("### Descriptive Statistics by Stage")
-        st.dataframe(stats_wl_avg_time)
-        st.write("\n\n\n")
-        # Add notes:
-        st.markdown("""         
-        **Notes | General:**
-        - What is the average time for won opportunities and lost opportunities?
-        In general:
-        - Closed Lost	~ 76 days
-        - Closed Won - ~ 35 days
-        
-        What is the difference between the times for won and lost opportunities?
-        - The mean duration for won opportunities differs from that of lost opportunities by 40 days. This suggests that when an opportunity remains open for too long, the chances of it not closing successfully—or taking longer to close—increase.
-        - It is more expressive for small opportunities
-        - Among the different Account Types, 'Top2' has the shortest average closing time for successful deals, at 31 days.
-        """)
-    
     ### -----------  DEEP DIVE BY ACCOUNT TYPE --------------
-    st.subheader('Deep Dive in Account Type')
+    @fragment("Average Time by Account Type")
+    def time_account_type_section():
+        cube = get_cube(filters=filters)
+        st.subheader('Deep Dive in Account Type')
+
+        # Display the stats table in Streamlit
+        stats_wl_avg_time_account_type = cube.describe('Deal Opened (Days)', ['Stage', " Account Type"])
+
+
+        col1, col2 = st.columns(2)
+        with col1:
+            plot_chart("fig_wl_avg_time_account_type")
+        with col2:
+            st.markdown("### Descriptive Statistics by Account Type per Stage")
+            st.dataframe(stats_wl_avg_time_account_type)
+            st.write("\n\n\n")
+            # Add notes:
+            st.markdown("""
+            **Notes | Account Type:**
+            - WON Deals Close Faster Than LOST Deals
+                - The average number of days to close a WON deal is significantly lower across all account types compared to LOST deals.
+                - For example, Small Accounts take 34 days (WON) vs. 80 days (LOST) on average.
+
+            -Top 2 Accounts Have the Fastest WON Deals
+                - Among WON deals, Top 2 Accounts close the fastest, with a mean of 31.06 days, followed by Top 3 (34 days) and Small Accounts (34 days).
+                - This suggests that Top 2 Accounts may have a more streamlined decision-making process or higher deal urgency.
+
+            - Small LOST Accounts Take the Longest to Close:
+                - Small Accounts have the highest average duration for LOST deals (80 days). This could indicate higher indecision or more budget constraints.
+
+            - Higher Standard Deviation in LOST Deals Suggests Unpredictability, possibly due to prolonged negotiations or reconsiderations deals.
+
+            """)
+
+    time_account_type_section()
+
 
-    # Display the stats table in Streamlit
-    stats_wl_avg_time_account_type = data.groupby(['Stage', " Account Type"])['Deal Opened (Days)'].describe()
-    
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_wl_avg_time_account_type.pkl"], use_container_width=True)
-    with col2:
-        st.markdown("### Descriptive Statistics by Account Type per Stage")
-        st.dataframe(stats_wl_avg_time_account_type)
-        st.write("\n\n\n")
-        # Add notes:
-        st.markdown("""
-        **Notes | Account Type:**
-        - WON Deals Close Faster Than LOST Deals
-            - The average number of days to close a WON deal is significantly lower across all account types compared to LOST deals.
-            - For example, Small Accounts take 34 days (WON) vs. 80 days (LOST) on average.
-
-        -Top 2 Accounts Have the Fastest WON Deals
-            - Among WON deals, Top 2 Accounts close the fastest, with a mean of 31.06 days, followed by Top 3 (34 days) and Small Accounts (34 days).
-            - This suggests that Top 2 Accounts may have a more streamlined decision-making process or higher deal urgency.
-        
-        - Small LOST Accounts Take the Longest to Close:
-            - Small Accounts have the highest average duration for LOST deals (80 days). This could indicate higher indecision or more budget constraints.
-        
-        - Higher Standard Deviation in LOST Deals Suggests Unpredictability, possibly due to prolonged negotiations or reconsiderations deals.
-            
-        """)
-        
-        
     ### -----------  DEEP DIVE BY TYPE OF BUSINESS --------------
-    st.subheader('Deep Dive in Existing Business')
+    @fragment("Average Time by Type of Business")
+    def time_type_business_section():
+        cube = get_cube(filters=filters)
+        st.subheader('Deep Dive in Existing Business')
+
+        # Display the stats table in Streamlit
+        stats_wl_avg_time_type_business = cube.describe('Deal Opened (Days)', ['Stage', "Type"])
+
+        col1, col2 = st.columns(2)
+        with col1:
+            plot_chart("fig_wl_avg_time_type_business")
+        with col2:
+            st.markdown("### Descriptive Statistics by Type of Business per Stage")
+            st.dataframe(stats_wl_avg_time_type_business)
+            st.write("\n\n\n")
+            # Add notes:
+            st.markdown("""
+            **Notes | Type of Business:**
+            - In LOST opportunities, New Business deals take an average of 104 days to close, whereas Existing Business deals take 58 days on average. This suggests that new business opportunities tend to remain open for longer before being lost, potentially indicating higher uncertainty, longer decision-making processes, or greater difficulty in conversion compared to existing clients.
+            - Additionally, salespeople tend to receive a lost decision faster from existing business accounts than from new business accounts, making forecasts for existing business opportunities faster compared to new business.
+            """)
+
+    time_type_business_section()
+
+
+
+# ----------- COHORT PAGE --------------
+
+elif page == "Cohort Analysis":
+    st.title("Cohort Analysis")
+    st.markdown("""
+    **Created vs. closed opportunities:** each cohort groups the opportunities created in a month.
+    The heatmap shows how many of them closed, and with which win rate and EUR value, by how long they were open (Deal Opened days).
+    """)
+
+    fragment("Cohort Analysis")(render_cohort_page)(filters)
 
-    # Display the stats table in Streamlit
-    stats_wl_avg_time_type_business = data.groupby(['Stage', "Type"])['Deal Opened (Days)'].describe()
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(graphics["fig_wl_avg_time_type_business.pkl"], use_container_width=True)
-    with col2:
-        st.markdown("### Descriptive Statistics by Type of Business per Stage")
-        st.dataframe(stats_wl_avg_time_type_business)
-        st.write("\n\n\n")
-        # Add notes:
-        st.markdown("""
-        **Notes | Type of Business:**
-        - In LOST opportunities, New Business deals take an average of 104 days to close, whereas Existing Business deals take 58 days on average. This suggests that new business opportunities tend to remain open for longer before being lost, potentially indicating higher uncertainty, longer decision-making processes, or greater difficulty in conversion compared to existing clients.
-        - Additionally, salespeople tend to receive a lost decision faster from existing business accounts than from new business accounts, making forecasts for existing business opportunities faster compared to new business.
-        """)
-    
 
- 
 # ----------- PREDICTION PAGE -------------- 
    
 elif page == "Prediction":
     st.title("Stage Prediction")
+    st.markdown("""
+    **Win / loss prediction of open opportunities:**
+    Upload a file of open opportunities to get, for each one, the probability of closing WON or LOST.
+    The model learns from the closed opportunities of the dataset (Country, Segment, Account Type, Type, Lead Source, Opp Value, created month and age).
+    """)
+
+    fragment("Prediction")(render_prediction_page)()
     
     
 # ----------- AGENT PAGE --------------    
     
 elif page == "Agent Assistant":
     st.title("Agent Assistant")
+    st.markdown("""
+    **Ask the sales data:** win rates, counts, values and time to close, for any segment, country, account type, period...
+    Questions are answered locally from pre-computed aggregates (no data leaves the app).
+    """)
+
+    render_assistant_page(filters)
+
+
+# ----------- PERFORMANCE PANEL --------------
+# Logged on every rerun; shown only with ?perf=1 in the URL.
+
+rerun_summary = finish_rerun(page)
+if panel_enabled():
+    render_perf_panel(rerun_summary)
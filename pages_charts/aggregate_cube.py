@@ -0,0 +1,239 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+import streamlit as st
+from pages_charts.data_loader import DATA_PATH, OUT_OF_CORE, dataset_version
+from pages_charts.filters import filtered_data
+from pages_charts import out_of_core
+from pages_charts.instrumentation import cache_lookup, cache_miss, span
+from pages_charts.quantile_sketch import SKETCH_FILE, KLLSketch, group_sketches, load_sketches
+
+# ------------- Aggregate Cube ----------
+# Materialized Stage x Account Type x Country x Segment x Type cells, built once per
+# dataset version. For every measure each cell keeps count, sum, sum of squares, min
+# and max, plus a mergeable KLL quantile sketch (see quantile_sketch.py) of size
+# O(k log(n / k)) whatever its number of rows. Every describe() table of the Average
+# Ticket / Time pages (and any other roll-up over these dimensions) is answered from
+# the cells, without touching row data; the cells and sketches of row batches merge
+# (out-of-core mode), so the cube stays bounded by cells x k as the data grows.
+# count / mean / std / min / max are exact. A quartile of a group comes from the
+# merged sketch of its cells: exact (interpolated like pandas) while that sketch never
+# compacted, otherwise its rank is within about +-0.4% of the exact one at
+# k=CUBE_SKETCH_K (e.g. 220 vs 220-221 for the 75% of Closed Won Opp Value).
+# Out-of-core on the ingest partitions, the cell sketches are the ones ingest.py keeps
+# per partition (_sketches.json), merged: the scan only adds up the cell statistics.
+
+CUBE_DIMENSIONS = ["Stage", " Account Type", "Country", "Segment", "Type"]
+
+CUBE_MEASURES = [" Opp Value (EUR)", "Deal Opened (Days)"]
+
+CUBE_SKETCH_K = 1000  # Quartile rank error ~1/k: +-0.4% here (+-1.7% at the sketch default of 200)
+
+DESCRIBE_PERCENTILES = [0.25, 0.5, 0.75]
+
+BOX_MAX_OUTLIERS = 100  # Outlier points kept per box (spread over their ranks, extremes included)
+
+CELL_AGGREGATES = {"count": "sum", "sum": "sum", "sumsq": "sum", "min": "min", "max": "max"}
+
+
+def cell_stats(data, dimensions=CUBE_DIMENSIONS, measures=CUBE_MEASURES):
+    # {measure: DataFrame(count, sum, sumsq, min, max) per cell} of the non-missing values
+    keys = data[dimensions].astype(object)
+    cells = {}
+    for measure in measures:
+        values = data[measure].to_numpy(dtype="float64")
+        frame = keys.assign(count=~np.isnan(values), sum=values, sumsq=values ** 2, min=values, max=values)
+        stats = frame.groupby(dimensions, sort=True).agg(CELL_AGGREGATES)
+        cells[measure] = stats[stats["count"] > 0]
+    return cells
+
+
+class AggregateCube:
+
+    def __init__(self, cells, sketches, dimensions=CUBE_DIMENSIONS):
+        self.dimensions = list(dimensions)
+        self.measures = list(cells)
+        self.cells = cells  # measure -> DataFrame(count, sum, sumsq, min, max) indexed by the dimensions
+        self.sketches = sketches  # measure -> {cell key: KLLSketch}
+        self._tables = {}  # (measure, by) -> describe() table already answered
+
+    @classmethod
+    def from_data(cls, data, dimensions=CUBE_DIMENSIONS, measures=CUBE_MEASURES, k=CUBE_SKETCH_K):
+        sketches = {measure: group_sketches(data, dimensions, measure, k) for measure in measures}
+        return cls(cell_stats(data, dimensions, measures), sketches, dimensions)
+
+    def merge(self, other):
+        # Adds the cube of other rows (e.g. the next record batch); other is consumed
+        for measure in self.measures:
+            cells = pd.concat([self.cells[measure], other.cells[measure]])
+            self.cells[measure] = cells.groupby(level=self.dimensions, sort=True).agg(CELL_AGGREGATES)
+            sketches = self.sketches[measure]
+            for key, sketch in other.sketches[measure].items():
+                if key in sketches:
+                    sketches[key].merge(sketch)
+                else:
+                    sketches[key] = sketch
+        self._tables.clear()
+        return self
+
+    def rollup(self, measure, by):
+        # count / sum / sumsq / min / max / mean / std of a measure for any subset of the dimensions
+        by = [by] if isinstance(by, str) else list(by)
+        stats = self.cells[measure].groupby(level=by, observed=True).agg(
+            {"count": "sum", "sum": "sum", "sumsq": "sum", "min": "min", "max": "max"}
+        )
+        stats["count"] = stats["count"].astype("float64")
+        stats["mean"] = stats["sum"] / stats["count"]
+        variance = (stats["sumsq"] - stats["sum"] ** 2 / stats["count"]) / (stats["count"] - 1)
+        stats["std"] = np.sqrt(variance.clip(lower=0))
+        return stats
+
+    def cell_sketches(self, measure, by, where=()):
+        # {group key: [sketches of its cells]} of a measure for any subset of the dimensions (none: one
+        # group, 0). where: ((dimension, values), ...) selects the cells.
+        by = [by] if isinstance(by, str) else list(by)
+        positions = [self.dimensions.index(column) for column in by]
+        selected = [(self.dimensions.index(dimension), set(values)) for dimension, values in where]
+        groups = {}
+        for key, sketch in self.sketches[measure].items():
+            if all(key[i] in values for i, values in selected):
+                group = tuple(key[i] for i in positions)
+                groups.setdefault(group if len(by) > 1 else group[0] if by else 0, []).append(sketch)
+        return groups
+
+    def merged_sketches(self, measure, by, where=()):
+        # {group key: one sketch of the cells of the group}
+        return {group: KLLSketch.merged(sketches) for group, sketches in self.cell_sketches(measure, by, where).items()}
+
+    def quantiles(self, measure, by, percentiles=DESCRIBE_PERCENTILES, where=()):
+        rows = {key: sketch.quantiles(percentiles) for key, sketch in self.merged_sketches(measure, by, where).items()}
+        columns = [f"{q * 100:g}%" for q in percentiles]
+        table = pd.DataFrame.from_dict(rows, orient="index", columns=columns)
+        return table.reindex(self.rollup(measure, by).index) if by and not where else table
+
+    def box_stats(self, measure, by, max_outliers=BOX_MAX_OUTLIERS):
+        # Box plot statistics per group: quartiles, whiskers (furthest values within 1.5 IQR of
+        # the box, as plotly draws them) and a sample of at most max_outliers values beyond them
+        by = [by] if isinstance(by, str) else list(by)
+        stats = self.rollup(measure, by)
+        quartiles = self.quantiles(measure, by)
+        cells = self.cell_sketches(measure, by)
+        rows = []
+        for key in stats.index:
+            q1, median, q3 = quartiles.loc[key, ["25%", "50%", "75%"]]
+            low, high = stats.loc[key, "min"], stats.loc[key, "max"]
+            iqr = q3 - q1
+            # Retained values of the cells (every value of a cell that never compacted)
+            items, weights = (np.concatenate(parts) for parts in zip(*(sketch.items() for sketch in cells[key])))
+            order = np.argsort(items, kind="stable")
+            items, weights = items[order], weights[order]
+            inside = items[(items >= q1 - 1.5 * iqr) & (items <= q3 + 1.5 * iqr)]
+            # The exact min / max are the whiskers when no value lies beyond the fences
+            lowerfence = low if low >= q1 - 1.5 * iqr else min(inside.min(initial=q1), q1)
+            upperfence = high if high <= q3 + 1.5 * iqr else max(inside.max(initial=q3), q3)
+            beyond = (items < lowerfence) | (items > upperfence)
+            outliers, outlier_weights = items[beyond], weights[beyond]
+            if len(outliers) > max_outliers:  # Evenly spaced ranks among the outliers
+                targets = np.linspace(0, outlier_weights.sum(), max_outliers)
+                positions = np.searchsorted(np.cumsum(outlier_weights), targets, side="left")
+                outliers = outliers[np.unique(np.clip(positions, 0, len(outliers) - 1))]
+            extremes = [value for value in (low, high) if value < lowerfence or value > upperfence]
+            rows.append({
+                "q1": q1, "median": median, "q3": q3,
+                "lowerfence": lowerfence, "upperfence": upperfence,
+                "count": stats.loc[key, "count"],
+                "outliers": np.unique(np.concatenate([outliers, extremes])),
+            })
+        return pd.DataFrame(rows, index=stats.index)
+
+    def describe(self, measure, by):
+        # Same layout as data.groupby(by, observed=True)[measure].describe() (sketched quartiles)
+        key = (measure, by if isinstance(by, str) else tuple(by))
+        label = "/".join(column.strip() for column in ([by] if isinstance(by, str) else by))
+        with span("describe", measure=measure.strip(), by=label):
+            if key not in self._tables:
+                stats = self.rollup(measure, by)
+                quantiles = self.quantiles(measure, by)
+                table = pd.concat([stats[["count", "mean", "std", "min"]], quantiles, stats[["max"]]], axis=1)
+                table.index.names = stats.index.names
+                self._tables[key] = table
+            return self._tables[key]
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)  # Built once per dataset version and filter state, shared by every session.
+def _build_cube(path, version, filters):
+    cache_miss()
+    return AggregateCube.from_data(filtered_data(filters, path))
+
+
+def stored_sketches(partitions_dir, filters=()):
+    # {measure: {cell: sketch}} of the selected cells, merged from the ingest sketches of every
+    # partition; None when they cannot stand for the selection (a filter on another column, a
+    # partition without sketches or sketched with another k)
+    if any(column not in CUBE_DIMENSIONS for column, _ in filters):
+        return None
+    selected = [(CUBE_DIMENSIONS.index(column), set(values)) for column, values in filters]
+    parts = {measure: {} for measure in CUBE_MEASURES}  # measure -> cell -> [sketch per partition]
+    partition_dirs = sorted(glob.glob(os.path.join(partitions_dir, f"{out_of_core.PARTITION_COLUMN}=*")))
+    for partition_dir in partition_dirs:
+        stored = load_sketches(os.path.join(partition_dir, SKETCH_FILE))
+        if any(measure not in stored for measure in CUBE_MEASURES):
+            return None
+        for measure in CUBE_MEASURES:
+            for key, sketch in stored[measure].items():
+                if sketch.k != CUBE_SKETCH_K:
+                    return None
+                if all(key[i] in values for i, values in selected):
+                    parts[measure].setdefault(key, []).append(sketch)
+    if not partition_dirs:
+        return None
+    return {measure: {key: KLLSketch.merged(sketches) for key, sketches in cells.items()} for measure, cells in parts.items()}
+
+
+def _scan(source, filters, sketched=True):
+    # Cube of the selected rows, merged batch by batch (cell statistics only when not sketched)
+    def batch_cube(batch):
+        if sketched:
+            return AggregateCube.from_data(batch)
+        return AggregateCube(cell_stats(batch), {measure: {} for measure in CUBE_MEASURES})
+
+    cube = batch_cube(out_of_core.empty_frame(CUBE_DIMENSIONS + CUBE_MEASURES, source))
+    for batch in out_of_core.scan_batches(CUBE_DIMENSIONS + CUBE_MEASURES, filters, source):
+        cube.merge(batch_cube(batch))
+    return cube
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _scan_cube(source, version, filters):
+    # Out-of-core: the cube of each record batch is merged as the scan goes
+    cache_miss()
+    sketches = stored_sketches(source, filters) if os.path.isdir(source) else None
+    if sketches is None:
+        return _scan(source, filters)
+    cube = _scan(source, filters, sketched=False)
+    # Kept up to date by ingest.py; a cell count that disagrees means stale sketches: sketch the rows
+    for measure in CUBE_MEASURES:
+        counts = cube.cells[measure]["count"]
+        if len(sketches[measure]) != len(counts) or any(
+            key not in sketches[measure] or sketches[measure][key].n != count for key, count in counts.items()
+        ):
+            return _scan(source, filters)
+    cube.sketches = sketches
+    return cube
+
+
+def get_cube(path=DATA_PATH, filters=()):
+    # Cube of the rows selected by a frozen filter state (see filters.py)
+    with cache_lookup("cube", filters=len(filters)):
+        if OUT_OF_CORE:
+            source = out_of_core.scan_source()
+            return _scan_cube(source, out_of_core.source_version(source), filters)
+        return _build_cube(path, dataset_version(path), filters)
+
+
+if __name__ == "__main__":
+    # This will execute when the script is run directly
+    cube = get_cube()
+    print(cube.describe(" Opp Value (EUR)", ["Country", "Stage"]))
+    print(cube.describe("Deal Opened (Days)", "Stage"))
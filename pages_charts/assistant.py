@@ -0,0 +1,53 @@
+import time
+import streamlit as st
+from pages_charts.question_engine import EXAMPLE_QUESTIONS, MIN_RANKED_SUPPORT, QUESTION_DIMENSIONS, ask
+
+# ------------- Agent Assistant Page ----------
+# Chat over the question engine (see question_engine.py): every question is parsed
+# and answered locally from the cached aggregates, under the sidebar filters.
+# The conversation is kept in the session; repeated or reworded questions are
+# answered from the answer cache.
+
+HISTORY_SIZE = 20  # Questions kept in the conversation
+
+
+def _render_answer(entry):
+    with st.chat_message("user"):
+        st.markdown(entry["question"])
+    with st.chat_message("assistant"):
+        answer = entry["answer"]
+        if answer is None:
+            st.markdown("I could not turn this into a query. Try one of the examples above: a metric "
+                        "(win rate, count, average / median / total value, days to close), values such as "
+                        "*Segment 2*, *Q1*, *Small accounts*, and optionally *by* or *top* a dimension.")
+            return
+        st.markdown(answer["text"])
+        if answer["table"] is not None:
+            st.dataframe(answer["table"], use_container_width=True, hide_index=True)
+        st.caption(f"{answer['query']} · {entry['ms']:.0f} ms")
+
+
+def render_assistant_page(filters=(), key="assistant"):
+    history = st.session_state.setdefault(f"{key}_history", [])
+
+    with st.expander("What can I ask?"):
+        st.markdown(
+            "Questions about **win / loss rates**, **counts**, and the **average, median, percentiles, total, "
+            "min / max** of the Opp Value (EUR) or of the days to close, for any combination of "
+            + ", ".join(dimension.strip() for dimension in QUESTION_DIMENSIONS)
+            + ". Add *by <dimension>* for a breakdown, or *top / best / worst* for a ranking "
+            f"(groups of fewer than {MIN_RANKED_SUPPORT} opportunities are not ranked). Examples:\n"
+            + "\n".join(f"- {question}" for question in EXAMPLE_QUESTIONS)
+        )
+    if filters:
+        st.caption("Answers use the rows selected by the sidebar filters.")
+
+    question = st.chat_input("Ask a question about the sales opportunities", key=f"{key}_input")
+    if question:
+        start = time.perf_counter()
+        answer = ask(question, filters=filters)
+        history.append({"question": question, "answer": answer, "ms": (time.perf_counter() - start) * 1000})
+        del history[:-HISTORY_SIZE]
+
+    for entry in history:
+        _render_answer(entry)
@@ -1,22 +1,102 @@
-import plotly.express as px
-import pandas as pd
-from pages_charts.charts_config import elegant_colors, colors_won_vs_lost, data
+import numpy as np
+import plotly.graph_objects as go
+from pages_charts.charts_config import elegant_colors, colors_won_vs_lost
+
+# WON vs. LOST - Opp Value (EUR) distributions (box plots built from the aggregate cube)
+
+stage_order = ["Closed Lost", "Closed Won"]  # Ensure Lost is before Won
+
+BOX_GAP = 0.3  # plotly default, also used to place the outlier points on their box
+
+
+def style_box(fig, title, xaxis_title, yaxis_title, log=False):
+    # Common look of the box plots of the Average pages
+    fig.update_layout(
+        title=dict(text=title, font=dict(size=16)),
+        xaxis_title=xaxis_title,
+        yaxis_title=yaxis_title,
+        boxmode='group',
+        width=1000,
+        height=600,
+        font=dict(family="Arial", size=14, color="black"),
+        plot_bgcolor="white",
+        legend_title="Stage",
+    )
+    fig.update_xaxes(tickangle=45, showgrid=True, gridwidth=1, gridcolor="LightGray")
+    fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor="LightGray")
+    if log:
+        fig.update_yaxes(type="log")
+    return fig
+
+
+def box_figure(cube, measure, column=None):
+    # Won / Lost boxes of a measure (per category of `column`) from the cube's box statistics:
+    # quartiles, whiskers and a capped sample of outliers, so the figure does not grow with the rows
+    stats = cube.box_stats(measure, ["Stage"] if column is None else [column, "Stage"])
+    fig = go.Figure()
+    for stage, color in zip(stage_order, colors_won_vs_lost):
+        if stage not in stats.index.get_level_values("Stage"):
+            continue
+        boxes = stats.loc[[stage]] if column is None else stats.xs(stage, level="Stage")
+        x = np.asarray(boxes.index, dtype=object)
+        groups = dict(name=stage, legendgroup=stage, offsetgroup=stage, alignmentgroup="True")
+        fig.add_trace(go.Box(
+            x=x, q1=boxes["q1"].to_numpy(), median=boxes["median"].to_numpy(), q3=boxes["q3"].to_numpy(),
+            lowerfence=boxes["lowerfence"].to_numpy(), upperfence=boxes["upperfence"].to_numpy(),
+            marker_color=color, boxpoints=False, **groups,
+        ))
+        sizes = [len(points) for points in boxes["outliers"]]
+        fig.add_trace(go.Scatter(
+            x=np.repeat(x, sizes), y=np.concatenate([[]] + list(boxes["outliers"])),
+            mode="markers", marker=dict(color=color), showlegend=False,
+            hovertemplate=f"Stage={stage}<br>%{{x}}<br>{measure.strip()}=%{{y}}<extra></extra>", **groups,
+        ))
+    mode = "overlay" if column is None else "group"
+    fig.update_layout(boxmode=mode, scattermode=mode, boxgap=BOX_GAP, scattergap=BOX_GAP)
+    return fig
+
+
+def box_by(cube, column, measure, title, xaxis_title, yaxis_title, log=False):
+    return style_box(box_figure(cube, measure, column), title, xaxis_title, yaxis_title, log)
+
+
+### -----------  General --------------
+
+def build_fig_wl_avg_ticket(cube):
+    fig = box_figure(cube, ' Opp Value (EUR)')
+    fig.update_layout(title='Distribution of Opportunity Values by Stage (Won vs Lost)',
+                      width=1200, height=700, xaxis_title="Stage", yaxis_title="Opportunity Value (EUR)", showlegend=True)
+    return fig
 
-# WON vs. LOST
 
 ### -----------  Account Type --------------
 
+def build_fig_wl_avg_ticket_account_type(cube):
+    return box_by(cube, ' Account Type', ' Opp Value (EUR)', "Opp Value (EUR) Distribution by Account Type", "Account Type", "Opp Value (EUR)")
 
 
 ### -----------  Country --------------
 
+def build_fig_wl_avg_ticket_country(cube):
+    return box_by(cube, 'Country', ' Opp Value (EUR)', "Opp Value (EUR) Distribution by Country", "Country", "Opp Value (EUR)")
+
 
 ### -----------  Segment --------------
 
+def build_fig_wl_avg_ticket_segment(cube):
+    return box_by(cube, 'Segment', ' Opp Value (EUR)', "Opp Value (EUR) Distribution by Segment", "Segment", "Opp Value (EUR)")
 
 
+# Builders of every chart of the Average Ticket page (name of the chart artifact -> builder)
+AVERAGE_TICKET_BUILDERS = {
+    "fig_wl_avg_ticket": build_fig_wl_avg_ticket,
+    "fig_wl_avg_ticket_account_type": build_fig_wl_avg_ticket_account_type,
+    "fig_wl_avg_ticket_country": build_fig_wl_avg_ticket_country,
+    "fig_wl_avg_ticket_segment": build_fig_wl_avg_ticket_segment,
+}
 
 
 if __name__ == "__main__":
     # This will execute when the script is run directly
-    print(data.head())  # You can replace this with other code you need to execute
+    from pages_charts.aggregate_cube import get_cube
+    print(build_fig_wl_avg_ticket(get_cube()).layout.title.text)  # You can replace this with other code you need to execute
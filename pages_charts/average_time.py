@@ -0,0 +1,35 @@
+from pages_charts.average_ticket import box_by, box_figure, style_box
+
+# WON vs. LOST - Deal Opened (Days) distributions (box plots built from the aggregate cube)
+
+### -----------  General --------------
+
+def build_fig_wl_avg_time(cube):
+    fig = style_box(box_figure(cube, 'Deal Opened (Days)'), "Deal Opened (Days) Distribution by Stage", None, "Deal Opened (Days)", log=True)
+    return fig.update_layout(boxmode="overlay")  # One box per Stage category
+
+
+### -----------  Account Type --------------
+
+def build_fig_wl_avg_time_account_type(cube):
+    return box_by(cube, ' Account Type', 'Deal Opened (Days)', "Deal Opened (Days) Distribution by Account Type (Log Scale)", "Account Type", "Deal Opened (Days) (Log Scale)", log=True)
+
+
+### -----------  Type of Business --------------
+
+def build_fig_wl_avg_time_type_business(cube):
+    return box_by(cube, 'Type', 'Deal Opened (Days)', "Deal Opened (Days) Distribution by Type (Log Scale)", "Type", "Deal Opened (Days) (Log Scale)", log=True)
+
+
+# Builders of every chart of the Average Time page (name of the chart artifact -> builder)
+AVERAGE_TIME_BUILDERS = {
+    "fig_wl_avg_time": build_fig_wl_avg_time,
+    "fig_wl_avg_time_account_type": build_fig_wl_avg_time_account_type,
+    "fig_wl_avg_time_type_business": build_fig_wl_avg_time_type_business,
+}
+
+
+if __name__ == "__main__":
+    # This will execute when the script is run directly
+    from pages_charts.aggregate_cube import get_cube
+    print(build_fig_wl_avg_time(get_cube()).layout.title.text)  # You can replace this with other code you need to execute
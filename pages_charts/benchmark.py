@@ -0,0 +1,354 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import threading
+import subprocess
+import http.client
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from pages_charts.data_loader import BASE_DIR
+from pages_charts.startup import STARTUP_BUDGET_SECONDS, import_failures, measure_first_page, measure_import, measure_served
+
+# ------------- Benchmark Suite ----------
+#   python -m pages_charts.benchmark [--scales 1 10 100 1000] [--repeat 3] [--threshold 1.25]
+#
+# Times the data layer, the aggregates, the calendar rollup and cohort views, the figure
+# builders, the Agent Assistant answers (uncached), cached query API requests and full page renders (Streamlit AppTest) on the dataset
+# replicated 1x / 10x / 100x / 1000x (or, with --synthetic, on generated rows with
+# the same distributions). Every scale runs in its own process (SALES_DATA_PATH
+# points the app at the scaled file), so the caches start cold. Wall time is the best of --repeat runs; peak memory is
+# the tracemalloc peak of one extra run (Python and numpy/pandas allocations).
+# Startup metrics are taken in fresh processes (see startup.py); a first page served
+# later than the startup budget after the server process start also fails the run, as do import-time work or
+# plotly.express loaded by the app imports, and a failing chart build
+# (python -m pages_charts.build_charts --check).
+# Results are appended to benchmarks/history.json; the command exits with status 1
+# when a metric is slower / bigger than --threshold x the median of the previous
+# runs on the same machine.
+
+BENCHMARK_DIR = os.path.join(BASE_DIR, "benchmarks")
+
+HISTORY_PATH = os.path.join(BENCHMARK_DIR, "history.json")
+
+SCALED_DATA_DIR = os.path.join(BENCHMARK_DIR, ".data")  # Generated, not versioned
+
+BASE_DATA_PATH = os.path.join(BASE_DIR, "data", "sales_preprocessed_data.parquet")
+
+SCALES = [1, 10, 100, 1000]
+
+THRESHOLD = 1.25
+
+BASELINE_RUNS = 5  # Previous runs whose median is the baseline of a metric
+
+# Differences below these are noise, never regressions
+MIN_SECONDS = 0.005
+MIN_PEAK_MB = 1.0
+
+CSV_MAX_SCALE = 100  # The CSV copy of the 1000x dataset would take tens of GB
+
+RESULT_PREFIX = "BENCHMARK_RESULT "
+
+# The describe() blocks of app_st.py (measure, by)
+DESCRIBE_BLOCKS = [
+    (" Opp Value (EUR)", ["Stage"]),
+    (" Opp Value (EUR)", [" Account Type", "Stage"]),
+    (" Opp Value (EUR)", ["Country", "Stage"]),
+    (" Opp Value (EUR)", ["Segment", "Stage"]),
+    ("Deal Opened (Days)", ["Stage"]),
+    ("Deal Opened (Days)", ["Stage", " Account Type"]),
+    ("Deal Opened (Days)", ["Stage", "Type"]),
+]
+
+API_REQUESTS = 1000  # Cached query API requests per measurement
+
+PAGES = [
+    "Home | Overview",
+    "Profile | WON vs. LOST",
+    "Average Ticket Analysis",
+    "Average Time to Close",
+    "Cohort Analysis",
+    "Prediction",
+    "Agent Assistant",
+]
+
+
+# ---- Scaled datasets ----
+
+def scaled_dataset(scale, with_csv=True, synthetic=False, data_dir=SCALED_DATA_DIR):
+    # (parquet path, csv path or None) of a dataset `scale` times the base one, written in streaming:
+    # the base rows repeated, or new rows from the synthetic generator (see synthetic.py)
+    os.makedirs(data_dir, exist_ok=True)
+    name = f"sales_{'synthetic' if synthetic else 'x'}{scale}"
+    parquet_path = os.path.join(data_dir, f"{name}.parquet")
+    csv_path = os.path.join(data_dir, f"{name}.csv") if with_csv else None
+    if not os.path.exists(parquet_path):
+        base = pq.read_table(BASE_DATA_PATH)
+        base = base.drop([name for name in base.column_names if name.startswith("__index_level")]).replace_schema_metadata()
+        if synthetic:
+            from pages_charts.ingest import compact
+            from pages_charts.synthetic import generate
+
+            partitions_dir = os.path.join(data_dir, f"{name}_partitions")
+            generate(base.num_rows * scale, partitions_dir)
+            compact(partitions_dir, f"{parquet_path}.tmp")
+        else:
+            with pq.ParquetWriter(f"{parquet_path}.tmp", base.schema) as writer:
+                for _ in range(scale):
+                    writer.write_table(base)
+        os.replace(f"{parquet_path}.tmp", parquet_path)
+    if csv_path and not os.path.exists(csv_path):
+        parquet_file = pq.ParquetFile(parquet_path)
+        with pacsv.CSVWriter(f"{csv_path}.tmp", parquet_file.schema_arrow) as writer:
+            for batch in parquet_file.iter_batches():
+                writer.write_batch(batch)
+        os.replace(f"{csv_path}.tmp", csv_path)
+    return parquet_path, csv_path
+
+
+# ---- Measurement ----
+
+def measure(function, repeat=3, setup=None):
+    # Best wall time of `repeat` runs and the tracemalloc peak of one more run
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": round(min(times), 6), "peak_mb": round(peak / 1e6, 3)}
+
+
+def measure_process(function, repeat=3):
+    # Best of `repeat` measurements made in fresh processes (their memory is not this process's)
+    return {"seconds": round(min(function() for _ in range(repeat)), 6), "peak_mb": 0.0}
+
+
+def run_scale(parquet_path, csv_path, repeat=3, pages=True):
+    # Runs in the worker process of one scale (SALES_DATA_PATH = parquet_path)
+    import pandas as pd
+    import streamlit as st
+    from pages_charts.data_loader import apply_schema, read_data
+    from pages_charts.aggregate_cube import AggregateCube
+    from pages_charts.profile_engine import build_profile
+    from pages_charts.profile_wl import PROFILE_BUILDERS
+    from pages_charts.average_ticket import AVERAGE_TICKET_BUILDERS
+    from pages_charts.average_time import AVERAGE_TIME_BUILDERS
+    from pages_charts.calendar_rollup import GRANULARITIES, daily_rollup, period_view
+    from pages_charts.cohort_engine import COHORT_METRICS, CohortCube
+    from pages_charts.query_api import make_server
+    from pages_charts.question_engine import EXAMPLE_QUESTIONS, answer_query, build_question_cube, cube_vocabulary
+    from pages_charts.figure_registry import PAGE_FIGURES, FigureRegistry
+
+    metrics = {}
+    served = [measure_served() for _ in range(repeat)]  # Each in a fresh server process
+    for metric, field in (("startup/ready", "ready"), ("startup/served", "first_page")):
+        metrics[metric] = {"seconds": round(min(run[field] for run in served), 6), "peak_mb": 0.0}
+    metrics["startup/import"] = measure_process(lambda: measure_import()["seconds"], repeat)
+    if pages:
+        metrics["startup/first_page"] = measure_process(lambda: measure_first_page()["seconds"], repeat)
+        metrics["startup/first_page_warm"] = measure_process(lambda: measure_first_page(warm=True)["seconds"], repeat)
+
+    metrics["load/parquet"] = measure(lambda: read_data(parquet_path), repeat)
+    if csv_path:
+        metrics["load/csv"] = measure(lambda: apply_schema(pd.read_csv(csv_path)), repeat)
+
+    from pages_charts.shared_dataset import DATA_FILE, frame_from_table, map_arrays, publish
+
+    def map_shared(directory):
+        table, metadata = map_arrays(os.path.join(directory, DATA_FILE))
+        return frame_from_table(table, metadata["columns"])
+
+    shared_directory = publish(parquet_path, shared_dir=os.path.join(SCALED_DATA_DIR, "shared"))
+    metrics["load/shared_map"] = measure(lambda: map_shared(shared_directory), repeat)
+
+    data = read_data(parquet_path)
+    metrics["cube/build"] = measure(lambda: AggregateCube.from_data(data), repeat)
+    cube = AggregateCube.from_data(data)
+    for measure_name, by in DESCRIBE_BLOCKS:
+        label = f"{measure_name.strip()} by {'/'.join(column.strip() for column in by)}"
+        metrics[f"describe/cube/{label}"] = measure(lambda: cube.describe(measure_name, by), repeat, setup=cube._tables.clear)
+        metrics[f"describe/pandas/{label}"] = measure(lambda: data.groupby(by, observed=True)[measure_name].describe(), repeat)
+
+    metrics["profile/build"] = measure(lambda: build_profile(data), repeat)
+    profile = build_profile(data)
+    for name, builder in PROFILE_BUILDERS.items():
+        metrics[f"figure/{name}"] = measure(lambda: builder(profile), repeat)
+    for name, builder in {**AVERAGE_TICKET_BUILDERS, **AVERAGE_TIME_BUILDERS}.items():
+        metrics[f"figure/{name}"] = measure(lambda: builder(cube), repeat)  # Box plots from the cube
+
+    metrics["rollup/build"] = measure(lambda: daily_rollup(data), repeat)
+    daily = daily_rollup(data)
+    metrics["rollup/views"] = measure(lambda: [period_view(daily, granularity) for granularity in GRANULARITIES], repeat)
+
+    metrics["cohort/build"] = measure(lambda: CohortCube.from_data(data), repeat)
+    cohorts = CohortCube.from_data(data)
+    metrics["cohort/views"] = measure(lambda: [cohorts.grid(metric) for metric in COHORT_METRICS] + [cohorts.funnel()], repeat)
+
+    metrics["assistant/build"] = measure(lambda: build_question_cube(data), repeat)
+    question_cube = build_question_cube(data)
+    queries = [cube_vocabulary(question_cube).parse(question) for question in EXAMPLE_QUESTIONS]
+    metrics["assistant/answers"] = measure(lambda: [answer_query(question_cube, query) for query in queries], repeat)
+
+    # Query API: cached responses over one keep-alive connection to a local server
+    server = make_server(port=0, path=parquet_path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    connection = http.client.HTTPConnection(*server.server_address[:2])
+
+    def api_requests(query, count=API_REQUESTS):
+        for _ in range(count):
+            connection.request("GET", query)
+            response = connection.getresponse()
+            response.read()
+
+    api_requests("/describe?measure=ticket&by=Country", 1)  # Fills the response cache
+    metrics[f"api/cached_x{API_REQUESTS}"] = measure(lambda: api_requests("/describe?measure=ticket&by=Country"), repeat)
+    server.shutdown()
+    server.server_close()
+
+    for page, names in PAGE_FIGURES.items():
+        if names:  # Cold registry: the figures of the page are read from charts/
+            metrics[f"registry/{page}"] = measure(lambda: FigureRegistry().page_figures(page), repeat)
+
+    if pages:
+        from streamlit.testing.v1 import AppTest
+
+        def render(page):
+            app = AppTest.from_file(os.path.join(BASE_DIR, "app_st.py"), default_timeout=600)
+            app.run()
+            if page != PAGES[0]:
+                app.sidebar.selectbox[0].select(page)
+                app.run()
+            if app.exception:
+                raise RuntimeError(f"{page}: {app.exception[0].message}")
+
+        for page in PAGES:
+            # Cold caches: data load, aggregates and figures of the page are included
+            metrics[f"page/{page}"] = measure(lambda: render(page), repeat, setup=st.cache_resource.clear)
+    return metrics
+
+
+# ---- History / regressions ----
+
+def load_history(path=HISTORY_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_history(history, path=HISTORY_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(history, file, indent=1)
+    os.replace(tmp_path, path)
+
+
+def find_regressions(run, history, threshold=THRESHOLD):
+    # [(metric, field, baseline, value)] of the metrics past the threshold
+    previous = [
+        entry for entry in history
+        if entry["scale"] == run["scale"] and entry["host"] == run["host"] and entry.get("data") == run["data"]
+    ][-BASELINE_RUNS:]
+    regressions = []
+    for metric, values in run["metrics"].items():
+        for field, noise in (("seconds", MIN_SECONDS), ("peak_mb", MIN_PEAK_MB)):
+            baseline = [entry["metrics"][metric][field] for entry in previous if metric in entry["metrics"]]
+            if not baseline:
+                continue
+            baseline = float(np.median(baseline))
+            if values[field] > baseline * threshold and values[field] - baseline > noise:
+                regressions.append((metric, field, baseline, values[field]))
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def run_benchmarks(scales=SCALES, repeat=3, threshold=THRESHOLD, pages=True, record=True, synthetic=False, history_path=HISTORY_PATH):
+    history = load_history(history_path)
+    failed = []
+    # Smoke test of the chart build command (every builder, temporary output directory)
+    build = subprocess.run([sys.executable, "-m", "pages_charts.build_charts", "--check"], cwd=BASE_DIR, capture_output=True, text=True)
+    if build.returncode:
+        failed.append(f"build_charts --check failed: {(build.stderr.strip().splitlines() or ['no output'])[-1]}")
+    # Cold-start invariants (see startup.py): they are flags, not timings, so any breach fails the run
+    failed += [f"startup: {failure}" for failure in import_failures()]
+    for scale in scales:
+        parquet_path, csv_path = scaled_dataset(scale, with_csv=scale <= CSV_MAX_SCALE, synthetic=synthetic)
+        command = [sys.executable, "-m", "pages_charts.benchmark", "--worker", parquet_path, "--repeat", str(repeat)]
+        if csv_path:
+            command += ["--csv", csv_path]
+        if not pages:
+            command.append("--no-pages")
+        env = {**os.environ, "SALES_DATA_PATH": parquet_path}
+        print(f"Scale {scale}x ({parquet_path})", flush=True)
+        output = subprocess.run(command, cwd=BASE_DIR, env=env, capture_output=True, text=True)
+        lines = [line for line in output.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+        if output.returncode or not lines:
+            sys.stderr.write(output.stderr)
+            raise RuntimeError(f"Benchmark worker failed at scale {scale}x")
+
+        run = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "scale": scale,
+            "data": "synthetic" if synthetic else "replicated",
+            "metrics": json.loads(lines[-1][len(RESULT_PREFIX):]),
+        }
+        for metric, values in run["metrics"].items():
+            print(f"  {metric:<60} {values['seconds'] * 1000:>10.1f} ms {values['peak_mb']:>10.1f} MB")
+        for metric, field, baseline, value in find_regressions(run, history, threshold):
+            failed.append(f"{scale}x {metric} {field}: {value:.3f} vs baseline {baseline:.3f}")
+        if run["metrics"]["startup/served"]["seconds"] > STARTUP_BUDGET_SECONDS:
+            failed.append(f"{scale}x startup/served: {run['metrics']['startup/served']['seconds']:.3f} over the budget of {STARTUP_BUDGET_SECONDS}s")
+        history.append(run)
+
+    if record:
+        save_history(history, history_path)
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark suite of the dashboard")
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Allowed ratio to the baseline")
+    parser.add_argument("--no-pages", action="store_true", help="Skip the AppTest page renders")
+    parser.add_argument("--no-record", action="store_true", help="Do not append the run to the history")
+    parser.add_argument("--synthetic", action="store_true", help="Scale with generated rows instead of repeating the dataset")
+    parser.add_argument("--worker", metavar="PARQUET", help=argparse.SUPPRESS)
+    parser.add_argument("--csv", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        metrics = run_scale(args.worker, args.csv, args.repeat, pages=not args.no_pages)
+        print(RESULT_PREFIX + json.dumps(metrics))
+        sys.exit(0)
+
+    failed = run_benchmarks(args.scales, args.repeat, args.threshold, pages=not args.no_pages, record=not args.no_record, synthetic=args.synthetic)
+    if failed:
+        print("Regressions:\n  " + "\n  ".join(failed))
+        sys.exit(1)
+    print("No regression")
@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import time
+import glob
+import hashlib
+import inspect
+import argparse
+import tempfile
+import importlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import plotly
+import plotly.io as pio
+from pages_charts.data_loader import DATA_PATH, OUT_OF_CORE
+from pages_charts import out_of_core
+from pages_charts.aggregate_cube import AggregateCube, cell_stats
+from pages_charts.figure_store import CHARTS_DIR, FORMAT_VERSION, prune_arrays, save_figure
+from pages_charts.page_builders import builder_input
+from pages_charts.profile_engine import build_profile
+from pages_charts.quantile_sketch import KLLSketch, group_sketches
+
+# ------------- Chart Build Command ----------
+#   python -m pages_charts.build_charts [names...] [--force] [--workers N] [--dry-run | --check]
+#
+# Discovers the figure builders (functions named build_fig_<name> in pages_charts/,
+# artifact charts/fig_<name>.json) and fingerprints each one by its source code,
+# the source of the helpers / constants it uses, the code of its input (profile
+# engine or aggregate cube) and a content hash of the data (file bytes, not modification
+# times: a fresh checkout matches the committed manifest). Figures whose fingerprint matches the
+# manifest are skipped; the others are built in a process pool (one input per
+# worker process, reused by all its figures). The first parameter of a builder names
+# its input: "profile" or "cube", anything else is an error. --check builds every
+# figure into a temporary directory (charts/ is left as is), as a smoke test.
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MANIFEST_PATH = os.path.join(CHARTS_DIR, ".build_manifest.json")  # Dot file: not listed as a figure
+
+BUILDER_PREFIX = "build_fig_"
+
+BUILDER_KINDS = ["profile", "cube"]  # Name of the first parameter of a builder = its input
+
+
+def discover_builders():
+    # {artifact name: (module name, function name, input kind)}
+    builders = {}
+    for path in sorted(glob.glob(os.path.join(PACKAGE_DIR, "*.py"))):
+        with open(path) as file:
+            if f"def {BUILDER_PREFIX}" not in file.read():  # Only modules that define builders are imported
+                continue
+        module_name = f"pages_charts.{os.path.basename(path)[:-3]}"
+        module = importlib.import_module(module_name)
+        for function_name, function in inspect.getmembers(module, inspect.isfunction):
+            if function_name.startswith(BUILDER_PREFIX) and function.__module__ == module_name:
+                # Builders take either the profile engine tables ("profile") or the aggregate cube ("cube")
+                kind = next(iter(inspect.signature(function).parameters), None)
+                if kind not in BUILDER_KINDS:
+                    raise TypeError(f"{module_name}.{function_name}: the first parameter of a builder must be "
+                                    f"one of {', '.join(BUILDER_KINDS)}, not {kind!r}")
+                builders[function_name[len("build_"):]] = (module_name, function_name, kind)
+    return builders
+
+
+def _referenced_names(code):
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if inspect.iscode(constant):  # Nested functions / comprehensions
+            names |= _referenced_names(constant)
+    return names
+
+
+def source_parts(function, seen=None):
+    # Source of a function plus the project functions and plain constants it references
+    seen = set() if seen is None else seen
+    seen.add(function)
+    parts = [inspect.getsource(function)]
+    for name in sorted(_referenced_names(function.__code__)):
+        value = function.__globals__.get(name)
+        if inspect.isfunction(value) and value.__module__.startswith("pages_charts") and value not in seen:
+            parts += source_parts(value, seen)
+        elif isinstance(value, (str, int, float, list, tuple, dict)):
+            parts.append(f"{name} = {value!r}")
+    return parts
+
+
+def data_digest():
+    # sha256 of the parquet data behind the queries (every part file in out-of-core mode)
+    source = out_of_core.scan_source() if OUT_OF_CORE else DATA_PATH
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, "**", "*.parquet"), recursive=True))
+    else:
+        source, paths = os.path.dirname(source), [source]
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.relpath(path, source).encode())
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(module_name, function_name, kind, version):
+    builder = getattr(importlib.import_module(module_name), function_name)
+    if kind == "profile":
+        parts = source_parts(builder) + source_parts(build_profile)
+    else:
+        parts = source_parts(builder) + source_parts(cell_stats) + source_parts(group_sketches) + [inspect.getsource(AggregateCube), inspect.getsource(KLLSketch)]
+    parts += [f"data={version}", f"plotly={plotly.__version__}", f"format={FORMAT_VERSION}"]
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _build_one(name, module_name, function_name, kind, charts_dir):
+    # Runs in a worker process; the builder input is cached per process
+    builder = getattr(importlib.import_module(module_name), function_name)
+    pio.templates.default = "plotly"  # Importing streamlit selects its own template; artifacts keep the plotly one
+    save_figure(builder(builder_input(kind)), name, charts_dir)
+    return name
+
+
+def build_charts(names=None, force=False, workers=None, charts_dir=CHARTS_DIR, dry_run=False):
+    builders = discover_builders()
+    unknown = sorted(set(names or []) - set(builders))
+    if unknown:
+        raise KeyError(f"No builder for: {', '.join(unknown)}")
+    selected = {name: builders[name] for name in (names or builders)}
+
+    manifest_path = os.path.join(charts_dir, os.path.basename(MANIFEST_PATH))
+    manifest = load_manifest(manifest_path)
+    version = data_digest()
+    fingerprints = {name: fingerprint(*spec, version) for name, spec in selected.items()}
+    stale = sorted(
+        name for name in selected
+        if force
+        or manifest.get(name, {}).get("fingerprint") != fingerprints[name]
+        or not os.path.exists(os.path.join(charts_dir, f"{name}.json"))
+    )
+    print(f"{len(stale)} of {len(selected)} figures to build (data {version[:12]})")
+    if dry_run or not stale:
+        return stale
+
+    os.makedirs(charts_dir, exist_ok=True)
+    start = time.perf_counter()
+    workers = min(workers or os.cpu_count() or 1, len(stale))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_build_one, name, *selected[name], charts_dir): name for name in stale}
+        for future in as_completed(futures):
+            name = future.result()
+            module_name, function_name, _ = selected[name]
+            manifest[name] = {"fingerprint": fingerprints[name], "builder": f"{module_name}.{function_name}"}
+            save_manifest(manifest, manifest_path)  # Progress survives an interrupted build
+            print(f"Built {name}")
+
+    removed = prune_arrays(charts_dir)
+    print(f"Built {len(stale)} figures with {workers} processes in {time.perf_counter() - start:.1f}s ({removed} unused arrays removed)")
+    return stale
+
+
+def check_build(names=None, workers=None):
+    # Builds the figures into a temporary directory; raises on the first failing builder
+    with tempfile.TemporaryDirectory() as charts_dir:
+        return build_charts(names, force=True, workers=workers, charts_dir=charts_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the chart artifacts that changed")
+    parser.add_argument("names", nargs="*", help="Artifact names (default: every discovered builder)")
+    parser.add_argument("--force", action="store_true", help="Rebuild even when the fingerprint is unchanged")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the figures that would be built")
+    parser.add_argument("--check", action="store_true", help="Build into a temporary directory (smoke test)")
+    args = parser.parse_args()
+
+    try:
+        if args.check:
+            built = check_build(args.names, workers=args.workers)
+            print(f"Build check passed: {len(built)} figures")
+            sys.exit(0)
+        stale = build_charts(args.names, force=args.force, workers=args.workers, dry_run=args.dry_run)
+    except (KeyError, TypeError) as error:
+        sys.exit(error.args[0])
+    if args.dry_run:
+        print("\n".join(stale))
@@ -0,0 +1,153 @@
+import os
+import glob
+import json
+import pandas as pd
+import streamlit as st
+from pages_charts.data_loader import DATA_PATH, OUT_OF_CORE, dataset_version
+from pages_charts.filters import filtered_data
+from pages_charts import out_of_core
+from pages_charts.profile_engine import CLOSED_STAGES, STAGE_COLUMN, VALUE_COLUMN, table_from_counts
+from pages_charts.instrumentation import cache_lookup, cache_miss
+
+# ------------- Calendar Rollup ----------
+# Closed deals per (Close Date day, Stage): count and EUR sum. The rollup is
+# additive, so ingest.py keeps one per Close Date month partition (_daily_rollup.json,
+# updated with the new rows, rebuilt for rewritten partitions) and the partitions
+# are combined by adding them up. Week / month / quarter / year views of any date
+# range are re-aggregations of its few hundred rows per year, in the layout of the
+# profile engine tables (period-end labels, like pd.Grouper), so the Time Analysis
+# charts change granularity without reading rows.
+
+DATE_COLUMN = "Close Date"
+
+ROLLUP_COLUMNS = [DATE_COLUMN, STAGE_COLUMN, VALUE_COLUMN]
+
+ROLLUP_FILE = "_daily_rollup.json"  # "_" prefix: ignored by the parquet dataset readers
+
+# Granularity -> (profile table dimension, pandas period frequency)
+GRANULARITIES = {
+    "Day": ("Close Day", "D"),
+    "Week": ("Close Week", "W"),
+    "Month": ("Close Month", "M"),
+    "Quarter": ("Close Quarter", "Q"),
+    "Year": ("Close Year", "Y"),
+}
+
+
+def daily_rollup(data):
+    # DataFrame(Close Date, Stage, count, eur) of the closed deals of a frame of rows
+    closed = data[data[STAGE_COLUMN].isin(CLOSED_STAGES)]
+    frame = pd.DataFrame({
+        DATE_COLUMN: closed[DATE_COLUMN].dt.normalize(),
+        STAGE_COLUMN: closed[STAGE_COLUMN].astype(str),
+        "eur": closed[VALUE_COLUMN].to_numpy(dtype="float64"),
+    })
+    rollup = frame.groupby([DATE_COLUMN, STAGE_COLUMN], sort=True)["eur"].agg(count="size", eur="sum")
+    return rollup.reset_index()
+
+
+def merge_rollups(rollups):
+    # Adds up partial rollups (e.g. one per partition or record batch)
+    frame = pd.concat(rollups, ignore_index=True)
+    return frame.groupby([DATE_COLUMN, STAGE_COLUMN], sort=True)[["count", "eur"]].sum().reset_index()
+
+
+def period_view(daily, granularity, start=None, end=None):
+    # Stage x period table (profile engine layout) of the days between start and end (inclusive)
+    dimension, freq = GRANULARITIES[granularity]
+    if start is not None:
+        daily = daily[daily[DATE_COLUMN] >= pd.Timestamp(start)]
+    if end is not None:
+        daily = daily[daily[DATE_COLUMN] <= pd.Timestamp(end)]
+    labels = daily[DATE_COLUMN].dt.to_period(freq).dt.end_time.dt.normalize().rename(dimension)
+    cells = daily.groupby([labels, daily[STAGE_COLUMN]], sort=True)[["count", "eur"]].sum()
+    counts = cells["count"].unstack(fill_value=0)
+    eur = cells["eur"].unstack(fill_value=0.0)
+    return table_from_counts(counts.to_numpy(), eur.to_numpy(), counts.index, counts.columns, dimension)
+
+
+# ---- Stored rollups (one per partition, written by ingest.py) ----
+
+def save_rollup(path, rollup):
+    state = {
+        "date": rollup[DATE_COLUMN].dt.strftime("%Y-%m-%d").tolist(),
+        "stage": rollup[STAGE_COLUMN].tolist(),
+        "count": rollup["count"].astype(int).tolist(),
+        "eur": rollup["eur"].astype(float).tolist(),
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(state, file)
+    os.replace(tmp_path, path)
+
+
+def load_rollup(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        state = json.load(file)
+    return pd.DataFrame({
+        DATE_COLUMN: pd.to_datetime(pd.Series(state["date"], dtype=object)),
+        STAGE_COLUMN: pd.Series(state["stage"], dtype=object),
+        "count": pd.Series(state["count"], dtype="int64"),
+        "eur": pd.Series(state["eur"], dtype="float64"),
+    })
+
+
+def load_partition_rollups(partitions_dir):
+    # Rollup of every partition added up; None when a partition has none (e.g. synthetic data)
+    rollups = []
+    for partition_dir in sorted(glob.glob(os.path.join(partitions_dir, f"{out_of_core.PARTITION_COLUMN}=*"))):
+        rollup = load_rollup(os.path.join(partition_dir, ROLLUP_FILE))
+        if rollup is None:
+            return None
+        rollups.append(rollup)
+    return merge_rollups(rollups) if rollups else None
+
+
+# ---- Cached rollup of the selected rows ----
+
+@st.cache_resource(show_spinner=False, max_entries=16)  # Built once per dataset version and filter state, shared by every session.
+def _build_cached(path, version, filters):
+    cache_miss()
+    return daily_rollup(filtered_data(filters, path)[ROLLUP_COLUMNS])
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _scan_cached(source, version, filters):
+    cache_miss()
+    if not filters and os.path.isdir(source):
+        stored = load_partition_rollups(source)
+        if stored is not None:  # Kept up to date by ingest.py: no scan
+            return stored
+    partials = [daily_rollup(batch) for batch in out_of_core.scan_batches(ROLLUP_COLUMNS, filters, source)]
+    return merge_rollups(partials) if partials else daily_rollup(out_of_core.empty_frame(ROLLUP_COLUMNS, source))
+
+
+def get_daily_rollup(path=DATA_PATH, filters=()):
+    # Daily rollup of the rows selected by a frozen filter state (see filters.py). The Close
+    # Date range is applied to the rollup of the other filters, so changing it reads no rows.
+    date_range = dict(filters).get(DATE_COLUMN)
+    others = tuple(item for item in filters if item[0] != DATE_COLUMN)
+    with cache_lookup("daily_rollup", filters=len(others)):
+        if OUT_OF_CORE:
+            source = out_of_core.scan_source()
+            daily = _scan_cached(source, out_of_core.source_version(source), others)
+        else:
+            daily = _build_cached(path, dataset_version(path), others)
+    if date_range:
+        start, end = (pd.Timestamp(value) for value in date_range)
+        daily = daily[(daily[DATE_COLUMN] >= start) & (daily[DATE_COLUMN] <= end)]
+    return daily
+
+
+def get_period_view(granularity, path=DATA_PATH, filters=()):
+    return period_view(get_daily_rollup(path, filters), granularity)
+
+
+if __name__ == "__main__":
+    # This will execute when the script is run directly
+    daily = get_daily_rollup()
+    print(f"{len(daily)} (day, stage) rows")
+    for granularity in GRANULARITIES:
+        print(period_view(daily, granularity).head(4), "\n")
@@ -1,19 +1,9 @@
-import plotly.express as px
 import pandas as pd
-import os
-print("Current working directory:", os.getcwd())
+from pages_charts.data_loader import load_data
 
 def load_and_process_data():
-    # Load the data from one directory level up
-    data = pd.read_csv("data/sales_preprocessed_data.csv")
-
-    # Convert date columns to datetime
-    data["Created Date"] = pd.to_datetime(data["Created Date"], errors="coerce")
-    data["Close Date"] = pd.to_datetime(data["Close Date"], errors="coerce")
-
-    return data
-
-data = load_and_process_data()
+    # Shared, typed frame from the data layer (dates are already native datetimes)
+    return load_data()
 
 elegant_colors = [
     "#1F77B4",  # Muted Blue
@@ -38,6 +28,17 @@ colors_won_vs_lost = [
     "blue",  # Muted Blue
 ]
 
+# Display names of the profile engine table columns (hover labels and default axis titles)
+profile_labels = {
+    " Account Type": "Account Type",
+    "count": "Count",
+    "eur": "Opp Value (EUR)",
+    "pct_within_dimension": "Percentage (%)",
+    "pct_within_stage": "Percentage (%)",
+    "eur_pct_within_dimension": "Value Percentage (%)",
+    "eur_pct_within_stage": "Value Percentage (%)",
+}
+
 if __name__ == "__main__":
     # This will execute when the script is run directly
     data = load_and_process_data()
@@ -0,0 +1,101 @@
+import plotly.graph_objects as go
+import streamlit as st
+from pages_charts.charts_config import colors_won_vs_lost
+from pages_charts.cohort_engine import COHORT_METRICS, get_cohorts
+from pages_charts.instrumentation import span
+
+# ------------- Cohort Analysis Page ----------
+# Win rate and EUR value by creation cohort (Created Date month) and time open,
+# from the cached cohort cube (see cohort_engine.py): changing the metric or the
+# cohort range re-derives small cohort x lag tables, the rows are not read again.
+
+METRIC_FORMATS = {"count": ",.0f", "win_rate": ".1f", "won_eur": ",.0f", "cumulative_won_eur": ",.0f", "cumulative_won_pct": ".1f"}
+
+CELL_TEXT_MAX_COHORTS = 36  # Values are written in the cells of smaller heatmaps
+
+
+def cohort_heatmap_figure(grid, metric):
+    labels = grid.index.strftime("%Y-%m")
+    fig = go.Figure(go.Heatmap(
+        z=grid.to_numpy(),
+        x=list(grid.columns),
+        y=list(labels),
+        colorscale="Blues",
+        colorbar_title=COHORT_METRICS[metric],
+        texttemplate=f"%{{z:{METRIC_FORMATS[metric]}}}" if len(grid) <= CELL_TEXT_MAX_COHORTS else None,
+        hovertemplate=f"Cohort %{{y}}<br>%{{x}} open<br>{COHORT_METRICS[metric]}: %{{z:{METRIC_FORMATS[metric]}}}<extra></extra>",
+    ))
+    fig.update_layout(
+        title=f"{COHORT_METRICS[metric]} by Creation Cohort and Days Open",
+        height=max(500, 22 * len(grid) + 200),
+        xaxis_title="Days open (Deal Opened)",
+        yaxis_title="Created month",
+        yaxis_autorange="reversed",
+    )
+    return fig
+
+
+def cohort_win_rate_figure(funnel):
+    labels = funnel.index.strftime("%Y-%m")
+    fig = go.Figure()
+    fig.add_bar(x=labels, y=funnel["won"], name="Won", marker_color=colors_won_vs_lost[1])
+    fig.add_bar(x=labels, y=funnel["closed"] - funnel["won"], name="Lost", marker_color=colors_won_vs_lost[0])
+    fig.add_scatter(x=labels, y=funnel["win_rate"], name="Win rate (%)", yaxis="y2", mode="lines+markers", line_color="black")
+    fig.update_layout(
+        title="Closed Opportunities and Win Rate by Creation Cohort",
+        barmode="stack",
+        height=600,
+        xaxis_title="Created month",
+        yaxis_title="Closed opportunities",
+        yaxis2=dict(title="Win rate (%)", overlaying="y", side="right", range=[0, 100]),
+        legend_title="Stage",
+    )
+    return fig
+
+
+def cohort_funnel_figure(funnel):
+    totals = funnel[["created", "closed", "won"]].sum()
+    fig = go.Figure(go.Funnel(
+        y=["Created", "Closed", "Won"],
+        x=totals.to_numpy(),
+        textinfo="value+percent initial",
+        marker_color=["#7F7F7F", colors_won_vs_lost[0], colors_won_vs_lost[1]],
+    ))
+    fig.update_layout(title="Opportunity Funnel of the Selected Cohorts", height=450)
+    return fig
+
+
+def render_cohort_page(filters=(), key="cohort"):
+    with span("cohorts"):
+        cube = get_cohorts(filters=filters)
+        funnel = cube.funnel()
+    if funnel.empty:
+        st.info("No opportunities match the filters.")
+        return
+
+    cohorts = list(funnel.index.strftime("%Y-%m"))
+    start, end = cohorts[0], cohorts[-1]
+    if len(cohorts) > 1:
+        start, end = st.select_slider("Creation cohorts", cohorts, value=(cohorts[0], cohorts[-1]), key=f"{key}_range")
+    selected = (funnel.index >= start) & (funnel.index <= f"{end}-01")
+    funnel = funnel[selected]
+
+    col1, col2, col3 = st.columns(3)
+    created, closed, won = (int(funnel[column].sum()) for column in ("created", "closed", "won"))
+    col1.metric("Opportunities created", f"{created:,}")
+    col2.metric("Win rate (closed)", f"{won / closed:.1%}" if closed else "—")
+    col3.metric("Won EUR", f"{funnel['won_eur'].sum():,.0f}")
+
+    metric = st.radio("Heatmap", list(COHORT_METRICS), format_func=COHORT_METRICS.get, horizontal=True, key=f"{key}_metric")
+    grid = cube.grid(metric)
+    grid = grid[(grid.index >= start) & (grid.index <= f"{end}-01")]
+    with span("chart", figure="fig_cohort_heatmap"):
+        st.plotly_chart(cohort_heatmap_figure(grid, metric), use_container_width=True)
+    with span("chart", figure="fig_cohort_win_rate"):
+        st.plotly_chart(cohort_win_rate_figure(funnel), use_container_width=True)
+    with span("chart", figure="fig_cohort_funnel"):
+        st.plotly_chart(cohort_funnel_figure(funnel), use_container_width=True)
+
+    with st.expander("Cohort table"):
+        table = funnel.set_axis(funnel.index.strftime("%Y-%m")).rename_axis("Cohort")
+        st.dataframe(table.round({"win_rate": 1, "eur": 0, "won_eur": 0}), use_container_width=True)
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from pages_charts.data_loader import DATA_PATH, OUT_OF_CORE, dataset_version, load_data
+from pages_charts.filters import select_rows
+from pages_charts import out_of_core
+from pages_charts.profile_engine import STAGE_COLUMN, VALUE_COLUMN
+from pages_charts.instrumentation import cache_lookup, cache_miss
+
+# ------------- Cohort Engine ----------
+# Opportunities binned by creation cohort (Created Date month) and by time open
+# (Deal Opened (Days), in LAG_BINS), split by outcome (won / lost / open): counts
+# and EUR sums of every (cohort, lag, outcome) cell, computed with one np.bincount
+# on integer codes (no groupby, a few array passes over the rows). The cells are
+# additive (record batches in out-of-core mode are merged), and the cohort tables of
+# the Cohort Analysis page (win rate, cumulative won EUR, funnel) are derived from
+# them without reading rows.
+
+CREATED_COLUMN = "Created Date"
+
+LAG_COLUMN = "Deal Opened (Days)"
+
+COHORT_COLUMNS = [CREATED_COLUMN, LAG_COLUMN, STAGE_COLUMN, VALUE_COLUMN]
+
+# Lower edge (days) -> label of the lag bins; the last bin is open-ended
+LAG_BINS = {0: "0-14 d", 15: "15-29 d", 30: "30-59 d", 60: "60-89 d", 90: "90-179 d", 180: "180-364 d", 365: "365+ d"}
+
+OUTCOMES = ["Won", "Lost", "Open"]
+
+OUTCOME_STAGES = {"Closed Won": 0, "Closed Lost": 1}  # Any other stage is open
+
+# Metric -> label of the cohort x lag grids
+COHORT_METRICS = {
+    "count": "Opportunities",
+    "win_rate": "Win rate (%)",
+    "won_eur": "Won EUR",
+    "cumulative_won_eur": "Cumulative won EUR",
+    "cumulative_won_pct": "Cumulative share won (%)",
+}
+
+
+def _month_codes(dates):
+    # Months since 1970-01 of a datetime column (-1 for missing dates)
+    values = dates.to_numpy()
+    months = values.astype("datetime64[M]").astype(np.int64)
+    return np.where(np.isnat(values), -1, months)
+
+
+def _outcome_codes(stages):
+    # Stage -> index in OUTCOMES, from the category codes (-1 for a missing stage)
+    if not isinstance(stages.dtype, pd.CategoricalDtype):
+        stages = stages.astype("category")
+    lookup = np.array([OUTCOME_STAGES.get(stage, 2) for stage in stages.cat.categories] + [-1], dtype=np.int64)
+    return lookup[stages.cat.codes.to_numpy()]  # Code -1 picks the trailing -1
+
+
+class CohortCube:
+
+    def __init__(self, first_month, counts, eur):
+        self.first_month = first_month  # Months since 1970-01 of cohort 0
+        self.counts = counts  # int64 [cohort, lag, outcome]
+        self.eur = eur  # float64 [cohort, lag, outcome]
+
+    @classmethod
+    def from_data(cls, data):
+        months = _month_codes(data[CREATED_COLUMN])
+        lags = np.searchsorted(np.array(list(LAG_BINS)), data[LAG_COLUMN].to_numpy(), side="right") - 1
+        outcomes = _outcome_codes(data[STAGE_COLUMN])
+        valid = (months >= 0) & (lags >= 0) & (outcomes >= 0)
+        if not valid.any():
+            return cls.empty()
+
+        first_month = int(months[valid].min())
+        n_cohorts = int(months[valid].max()) - first_month + 1
+        n_lags, n_outcomes = len(LAG_BINS), len(OUTCOMES)
+        cell = ((months[valid] - first_month) * n_lags + lags[valid]) * n_outcomes + outcomes[valid]
+        shape = (n_cohorts, n_lags, n_outcomes)
+        values = np.nan_to_num(data[VALUE_COLUMN].to_numpy(dtype="float64")[valid])
+        counts = np.bincount(cell, minlength=np.prod(shape)).reshape(shape)
+        eur = np.bincount(cell, weights=values, minlength=np.prod(shape)).reshape(shape)
+        return cls(first_month, counts, eur)
+
+    @classmethod
+    def empty(cls):
+        shape = (0, len(LAG_BINS), len(OUTCOMES))
+        return cls(0, np.zeros(shape, dtype=np.int64), np.zeros(shape))
+
+    @classmethod
+    def merge(cls, cubes):
+        # Adds up the cells of partial cubes (e.g. one per record batch), aligned on the cohort month
+        cubes = [cube for cube in cubes if len(cube.counts)]
+        if not cubes:
+            return cls.empty()
+        first_month = min(cube.first_month for cube in cubes)
+        n_cohorts = max(cube.first_month + len(cube.counts) for cube in cubes) - first_month
+        counts = np.zeros((n_cohorts,) + cubes[0].counts.shape[1:], dtype=np.int64)
+        eur = np.zeros(counts.shape)
+        for cube in cubes:
+            offset = cube.first_month - first_month
+            counts[offset:offset + len(cube.counts)] += cube.counts
+            eur[offset:offset + len(cube.eur)] += cube.eur
+        return cls(first_month, counts, eur)
+
+    @property
+    def cohorts(self):
+        # Month start of every cohort
+        months = np.arange(self.first_month, self.first_month + len(self.counts)).astype("datetime64[M]")
+        return pd.DatetimeIndex(months.astype("datetime64[ns]"), name="Cohort")
+
+    def grid(self, metric):
+        # Cohort x lag table of a metric (cohorts without opportunities are dropped)
+        won, lost = self.counts[..., 0], self.counts[..., 1]
+        total = self.counts.sum(axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if metric == "count":
+                values = total
+            elif metric == "win_rate":
+                values = won / (won + lost) * 100
+            elif metric == "won_eur":
+                values = self.eur[..., 0]
+            elif metric == "cumulative_won_eur":
+                values = self.eur[..., 0].cumsum(axis=1)
+            elif metric == "cumulative_won_pct":
+                values = won.cumsum(axis=1) / total.sum(axis=1, keepdims=True) * 100
+            else:
+                raise ValueError(f"Unknown cohort metric: {metric}")
+        table = pd.DataFrame(values, index=self.cohorts, columns=pd.Index(LAG_BINS.values(), name="Days open"))
+        return table[total.sum(axis=1) > 0]
+
+    def funnel(self):
+        # Per cohort: created -> closed -> won, win rate and EUR
+        counts, eur = self.counts.sum(axis=1), self.eur.sum(axis=1)
+        created = counts.sum(axis=1)
+        closed = counts[:, 0] + counts[:, 1]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            table = pd.DataFrame({
+                "created": created,
+                "closed": closed,
+                "won": counts[:, 0],
+                "win_rate": counts[:, 0] / closed * 100,
+                "eur": eur.sum(axis=1),
+                "won_eur": eur[:, 0],
+            }, index=self.cohorts)
+        return table[created > 0]
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)  # Built once per dataset version and filter state, shared by every session.
+def _build_cached(path, version, filters):
+    cache_miss()
+    data = load_data(path)[COHORT_COLUMNS]
+    mask = select_rows(filters, path)
+    return CohortCube.from_data(data if mask is None else data[mask])
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _scan_cached(source, version, filters):
+    # Out-of-core: one partial cube per record batch of the selected rows
+    cache_miss()
+    return CohortCube.merge([CohortCube.from_data(batch) for batch in out_of_core.scan_batches(COHORT_COLUMNS, filters, source)])
+
+
+def get_cohorts(path=DATA_PATH, filters=()):
+    # Cohort cube of the rows selected by a frozen filter state (see filters.py)
+    with cache_lookup("cohorts", filters=len(filters)):
+        if OUT_OF_CORE:
+            source = out_of_core.scan_source()
+            return _scan_cached(source, out_of_core.source_version(source), filters)
+        return _build_cached(path, dataset_version(path), filters)
+
+
+if __name__ == "__main__":
+    # This will execute when the script is run directly
+    cube = get_cohorts()
+    print(cube.funnel().tail(12), "\n")
+    for metric in COHORT_METRICS:
+        print(cube.grid(metric).tail(6).round(1), "\n")
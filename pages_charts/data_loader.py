@@ -0,0 +1,124 @@
+import os
+import pandas as pd
+import streamlit as st
+from pages_charts.instrumentation import cache_lookup, cache_miss, span
+
+# Base directory of the project (one level up from pages_charts/)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# SALES_DATA_PATH points the app at another processed parquet file (e.g. a scaled benchmark dataset)
+DATA_PATH = os.environ.get("SALES_DATA_PATH", os.path.join(BASE_DIR, "data", "sales_preprocessed_data.parquet"))
+
+# Close Date month partitions written by pages_charts/ingest.py (or pages_charts/synthetic.py via SALES_PARTITIONS_DIR)
+PARTITIONS_DIR = os.environ.get("SALES_PARTITIONS_DIR", os.path.join(BASE_DIR, "data", "partitions"))
+
+# ------------- Query Mode ----------
+# "memory" (default): the parquet file is loaded once per process as a pandas frame.
+# "out_of_core": the pages query the partitioned parquet with pyarrow scans and
+# never hold the full table (see out_of_core.py). Set with QUERY_MODE=out_of_core.
+# "shared": the frame is memory-mapped from an Arrow file published once per dataset
+# version, shared by every server process of the host (see shared_dataset.py).
+QUERY_MODE = os.environ.get("QUERY_MODE", "memory")
+
+OUT_OF_CORE = QUERY_MODE == "out_of_core"
+
+SHARED = QUERY_MODE == "shared"
+
+# ------------- Declared Schema ----------
+# Only the columns listed here are read from the parquet file (column projection).
+# Low-cardinality text columns are stored as categoricals, numerics are downcast
+# and the date columns are kept as native datetimes.
+
+CATEGORICAL_COLUMNS = [
+    "Stage",
+    "Country",
+    "Segment",
+    " Account Type",
+    "Type",
+    "Lead Source",
+    "Close Reason",
+    "Region",
+    "Business Type",
+    "Opportunity Owner",
+    "Primary Campaign Source",
+    " Account Name",
+]
+
+DATE_COLUMNS = ["Created Date", "Close Date"]
+
+SCHEMA = {
+    "Opportunity Name": "string",
+    "Created Date": "datetime64[ns]",
+    "Close Date": "datetime64[ns]",
+    " Account Name": "category",
+    " Account Type": "category",
+    " Opp Value (EUR)": "float32",
+    "Stage": "category",
+    "Opportunity Owner": "category",
+    "Country": "category",
+    "Region": "category",
+    "Segment": "category",
+    "Lead Source": "category",
+    "Type": "category",
+    "Primary Campaign Source": "category",
+    "Close Reason": "category",
+    "Business Type": "category",
+    "Deal Opened (Days)": "int16",
+}
+
+
+def dataset_version(path=DATA_PATH):
+    # Identifies the current content of the data file (changes whenever the file is rewritten)
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def apply_schema(data):
+    # Casts a raw frame to the declared schema (missing columns are ignored)
+    for column, dtype in SCHEMA.items():
+        if column not in data.columns:
+            continue
+        if column in DATE_COLUMNS:
+            data[column] = pd.to_datetime(data[column], errors="coerce")
+        elif dtype == "float32":
+            data[column] = pd.to_numeric(data[column], errors="coerce", downcast="float")
+        elif dtype.startswith("int"):
+            data[column] = pd.to_numeric(data[column], errors="coerce", downcast="integer")
+        else:
+            data[column] = data[column].astype(dtype)
+    return data
+
+
+def read_data(path=DATA_PATH, columns=None):
+    # Reads the parquet file with column projection and applies the schema
+    if columns is None:
+        columns = list(SCHEMA)
+    data = pd.read_parquet(path, columns=list(columns), engine="pyarrow")
+    return apply_schema(data.reset_index(drop=True))
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)  # One frame per process, shared by every session and chart builder.
+def _load_cached(path, version, columns):
+    cache_miss()
+    with span("read_parquet", path=os.path.basename(path)):
+        return read_data(path, columns)
+
+
+def load_data(path=DATA_PATH, columns=None):
+    # Returns the shared, typed sales frame. The cache key includes the dataset
+    # version, so a rewritten parquet file is picked up on the next rerun.
+    # The returned frame is shared: callers must not modify it in place.
+    columns = tuple(columns) if columns is not None else None
+    with cache_lookup("data"):
+        if SHARED:
+            from pages_charts.shared_dataset import shared_data  # (circular import)
+
+            return shared_data(path, columns)
+        return _load_cached(path, dataset_version(path), columns)
+
+
+if __name__ == "__main__":
+    # This will execute when the script is run directly
+    data = load_data()
+    print(data.dtypes)
+    print(f"Memory usage: {data.memory_usage(deep=True).sum() / 1e6:.1f} MB")
@@ -0,0 +1,104 @@
+import numpy as np
+import streamlit as st
+from pages_charts.data_loader import CATEGORICAL_COLUMNS, DATA_PATH, OUT_OF_CORE, SCHEMA, dataset_version, load_data
+from pages_charts.filters import select_rows
+from pages_charts import out_of_core
+from pages_charts.instrumentation import span
+
+# ------------- Paginated Dataset Table ----------
+# Filters, sorting and pagination are applied on the server; only the visible page
+# is sent to the browser. The row order of each (filters, sort) state is cached
+# once, and the page slices are cached per filter state. In out-of-core mode the
+# filters are pushed down to the scan and only the rows of the page are read.
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+# Columns offered as filters in the table (low-cardinality categoricals)
+FILTER_COLUMNS = ["Stage", "Country", "Segment", " Account Type", "Type", "Lead Source", "Close Reason"]
+
+
+def _freeze(filters):
+    # Hashable, order-independent version of {column: [values]}
+    return tuple(sorted((column, tuple(sorted(values))) for column, values in filters.items() if values))
+
+
+def filter_mask(data, filters):
+    mask = np.ones(len(data), dtype=bool)
+    for column, values in filters:
+        mask &= data[column].isin(values).to_numpy()
+    return mask
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _row_order(path, version, filters, sort_by, ascending, selection):
+    # Positions of the filtered rows, in display order (selection = global sidebar filters)
+    data = load_data(path)
+    mask = filter_mask(data, filters)
+    selected = select_rows(selection, path)
+    if selected is not None:
+        mask &= selected
+    positions = np.flatnonzero(mask)
+    if sort_by:
+        column = data[sort_by].iloc[positions].reset_index(drop=True)
+        order = column.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+        positions = positions[order]
+    return positions
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _page_slice(path, version, filters, sort_by, ascending, selection, page, page_size):
+    positions = _row_order(path, version, filters, sort_by, ascending, selection)
+    start = page * page_size
+    return load_data(path).iloc[positions[start:start + page_size]]
+
+
+def query_page(filters=None, sort_by=None, ascending=True, page=0, page_size=PAGE_SIZES[0], selection=(), path=DATA_PATH):
+    # (rows of the requested page, total number of rows after the filters)
+    frozen = _freeze(filters or {})
+    if OUT_OF_CORE:
+        return out_of_core.scan_page(frozen + tuple(selection), sort_by, ascending, page, page_size)
+    version = dataset_version(path)
+    total = len(_row_order(path, version, frozen, sort_by, ascending, selection))
+    return _page_slice(path, version, frozen, sort_by, ascending, selection, page, page_size), total
+
+
+def render_paginated_table(key="dataset", selection=(), path=DATA_PATH):
+    # Streamlit component: filter / sort / page controls and the visible slice only
+    if OUT_OF_CORE:
+        summary = out_of_core.get_summary(FILTER_COLUMNS)
+        all_columns, categories = list(SCHEMA), summary.categories
+    else:
+        data = load_data(path)
+        all_columns = list(data.columns)
+        categories = {column: list(data[column].cat.categories) if column in CATEGORICAL_COLUMNS else sorted(data[column].dropna().unique()) for column in FILTER_COLUMNS}
+
+    with st.expander("Filters"):
+        filters = {}
+        columns = st.columns(4)
+        for i, column in enumerate(FILTER_COLUMNS):
+            with columns[i % 4]:
+                options = categories[column]
+                filters[column] = st.multiselect(column.strip(), options, key=f"{key}_filter_{column}")
+
+    col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
+    with col1:
+        sort_by = st.selectbox("Sort by", [None] + all_columns, format_func=lambda c: "—" if c is None else c.strip(), key=f"{key}_sort")
+    with col2:
+        ascending = st.toggle("Ascending", value=True, key=f"{key}_ascending")
+    with col3:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size")
+
+    _, total = query_page(filters, sort_by, ascending, 0, page_size, selection, path)
+    n_pages = max(1, -(-total // page_size))
+    # The page number lives in the session state only (no value=): it is clamped when the filters leave fewer pages
+    if st.session_state.setdefault(f"{key}_page", 1) > n_pages:
+        st.session_state[f"{key}_page"] = n_pages
+    with col4:
+        page = st.number_input("Page", min_value=1, max_value=n_pages, step=1, key=f"{key}_page") - 1
+
+    with span("table_query", page=page, page_size=page_size):
+        rows, total = query_page(filters, sort_by, ascending, page, page_size, selection, path)
+    with span("table_emit", rows=len(rows)):
+        st.dataframe(rows, use_container_width=True)
+    first = page * page_size + 1 if total else 0
+    st.caption(f"Rows {first}–{min(total, (page + 1) * page_size)} of {total} (page {page + 1} of {n_pages})")
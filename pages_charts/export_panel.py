@@ -0,0 +1,78 @@
+import os
+import streamlit as st
+from pages_charts.data_loader import dataset_version
+from pages_charts.export_service import DATA_FORMATS, FIGURE_FORMATS, get_export_service, image_export_available
+from pages_charts.instrumentation import fragment
+
+# ------------- Export Panel ----------
+# Sidebar panel of the export service (see export_service.py): the export runs in
+# the background while the pages stay usable; the panel polls the progress of its
+# running exports once a second (a fragment, so the page is not rerun) and offers
+# the download when they are done. Exports already made are downloadable at once.
+# The file of a finished export is read once (per file version) and its bytes are
+# reused by the reruns and sessions that show it.
+
+POLL_SECONDS = 1.0
+
+JOBS_SHOWN = 4  # Exports listed in the panel (most recent first)
+
+DOWNLOAD_LIMIT = 200 * 1024 * 1024  # Larger files are not sent through the browser, their path is shown
+
+
+@st.cache_resource(show_spinner=False, max_entries=JOBS_SHOWN)  # Per export file and version, shared by every session.
+def _file_bytes(path, version):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def _render_job(job, key):
+    if job.error:
+        st.error(f"{job.label}: {job.error}")
+    elif not job.finished:
+        total = f" of {job.total:,}" if job.total else ""
+        st.progress(job.progress, text=f"{job.label}: {job.done:,}{total}")
+    elif not os.path.exists(job.path):
+        st.caption(f"{job.label}: removed from the export cache, export it again.")
+    elif os.path.getsize(job.path) > DOWNLOAD_LIMIT:
+        st.caption(f"{job.label}: {job.path}")
+    else:
+        st.download_button(f"Download {job.label}", _file_bytes(job.path, dataset_version(job.path)),
+                           file_name=os.path.basename(job.path),
+                           key=f"{key}_download_{os.path.basename(job.path)}", use_container_width=True)
+        status = "from the export cache" if job.cached else f"in {job.seconds:.1f}s"
+        st.caption(f"{os.path.getsize(job.path) / 1e6:.1f} MB, {status}")
+
+
+def _export_panel(filters, key):
+    service = get_export_service()
+    job_keys = st.session_state.setdefault(f"{key}_jobs", [])
+
+    kind = st.radio("Export", ["Dataset", "Charts"], horizontal=True, key=f"{key}_kind")
+    formats = DATA_FORMATS if kind == "Dataset" else FIGURE_FORMATS
+    if kind == "Charts" and not image_export_available():
+        formats = ["html"]  # PNG / SVG need kaleido
+    fmt = st.selectbox("Format", formats, format_func=str.upper, key=f"{key}_format_{kind}")
+    if filters:
+        st.caption("The export uses the sidebar filters.")
+    if st.button("Export", key=f"{key}_start", use_container_width=True):
+        job_key = service.submit("data" if kind == "Dataset" else "figures", fmt, filters)
+        if job_key in job_keys:
+            job_keys.remove(job_key)
+        job_keys.insert(0, job_key)
+        del job_keys[JOBS_SHOWN:]
+
+    jobs = [job for job in map(service.job, job_keys) if job is not None]
+    for job in jobs:
+        _render_job(job, key)
+
+    running = any(not job.finished for job in jobs)
+    if running != st.session_state.get(f"{key}_polling", False):
+        # Starts / stops polling: the fragment is redefined with (or without) run_every on a full rerun
+        st.session_state[f"{key}_polling"] = running
+        st.rerun()
+
+
+def render_export_panel(filters=(), key="export"):
+    polling = st.session_state.get(f"{key}_polling", False)
+    with st.sidebar.expander("Export"):
+        fragment("Export", run_every=POLL_SECONDS if polling else None)(_export_panel)(filters, key)
@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import zipfile
+import argparse
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+from pages_charts.data_loader import BASE_DIR, DATA_PATH, OUT_OF_CORE, SCHEMA, load_data
+from pages_charts.filters import data_version, select_rows
+from pages_charts import out_of_core
+
+# ------------- Export Service ----------
+#   python -m pages_charts.export_service data|figures [--format F]
+#
+# Exports of the (filtered) dataset as parquet / CSV and of the figures of every
+# page as a zip of HTML / PNG / SVG files. Exports run on a small thread pool, so the
+# script thread only submits them and polls their progress (see export_panel.py):
+#   - the rows are written one chunk at a time (slices of the selected rows, or
+#     record batches of the scan in out-of-core mode), never as one result frame;
+#   - the bundle is written one figure at a time (the figures are those shown by the
+#     pages: chart artifacts, or rebuilt from the aggregates when filters are active).
+# An export is stored under exports/ with a name derived from (kind, format, dataset
+# version, filters): the same export of the same data is served from that file.
+# Only the last EXPORT_CACHE_FILES files are kept. PNG / SVG need kaleido.
+
+EXPORT_DIR = os.environ.get("SALES_EXPORT_DIR", os.path.join(BASE_DIR, "exports"))
+
+EXPORT_WORKERS = 2
+
+EXPORT_CACHE_FILES = 20
+
+CHUNK_ROWS = 64 * 1024
+
+DATA_FORMATS = ["parquet", "csv"]
+
+FIGURE_FORMATS = ["html", "png", "svg"]
+
+FORMATS = {"data": DATA_FORMATS, "figures": FIGURE_FORMATS}
+
+# Storage types of the exported columns (categories are written as plain text)
+EXPORT_TYPES = {"category": pa.string(), "string": pa.string(), "datetime64[ns]": pa.timestamp("ns"),
+                "float32": pa.float32(), "int16": pa.int16()}
+
+EXPORT_SCHEMA = pa.schema([(column, EXPORT_TYPES[dtype]) for column, dtype in SCHEMA.items()])
+
+
+def image_export_available():
+    # PNG / SVG figures are rendered by kaleido (optional dependency)
+    return importlib.util.find_spec("kaleido") is not None
+
+
+def export_key(kind, fmt, version, filters):
+    state = json.dumps([kind, fmt, version, filters], default=str)
+    return hashlib.sha1(state.encode()).hexdigest()[:16]
+
+
+def export_path(kind, fmt, key, export_dir=EXPORT_DIR):
+    extension = fmt if kind == "data" else f"{fmt}.zip"
+    return os.path.join(export_dir, f"sales-{kind}-{key}.{extension}")
+
+
+# ---- Streamed writers ----
+
+def data_chunks(filters=(), path=DATA_PATH, chunk_rows=CHUNK_ROWS):
+    # (total rows, generator of typed frames of at most chunk_rows selected rows)
+    if OUT_OF_CORE:
+        return out_of_core.count_rows(filters), out_of_core.scan_batches(list(SCHEMA), filters)
+    data = load_data(path)
+    mask = select_rows(filters, path)
+    positions = np.arange(len(data)) if mask is None else np.flatnonzero(mask)
+    chunks = (data.iloc[positions[start:start + chunk_rows]] for start in range(0, len(positions), chunk_rows))
+    return len(positions), chunks
+
+
+def write_data(output, fmt, filters=(), path=DATA_PATH, progress=None):
+    total, chunks = data_chunks(filters, path)
+    done = 0
+    if progress:
+        progress(done, total)
+    if fmt == "parquet":
+        with pq.ParquetWriter(output, EXPORT_SCHEMA) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pandas(chunk, schema=EXPORT_SCHEMA, preserve_index=False))
+                done += len(chunk)
+                if progress:
+                    progress(done, total)
+            if not total:  # A file with the columns and no rows
+                writer.write_table(EXPORT_SCHEMA.empty_table())
+    elif fmt == "csv":
+        with open(output, "w", newline="", encoding="utf-8") as file:
+            pd.DataFrame(columns=list(SCHEMA)).to_csv(file, index=False)  # Header, also without rows
+            for chunk in chunks:
+                chunk.to_csv(file, header=False, index=False)
+                done += len(chunk)
+                if progress:
+                    progress(done, total)
+    else:
+        raise ValueError(f"Unknown data format: {fmt}")
+    return done
+
+
+def page_figures(page, filters=()):
+    # Figures of a page as displayed: artifacts, or rebuilt for the filters
+    from pages_charts.figure_registry import get_registry
+    from pages_charts.page_builders import build_page_figures
+
+    return build_page_figures(page, filters) if filters else get_registry().page_figures(page)
+
+
+def write_figures(output, fmt, filters=(), progress=None):
+    from pages_charts.figure_registry import PAGE_FIGURES
+
+    if fmt not in FIGURE_FORMATS:
+        raise ValueError(f"Unknown figure format: {fmt}")
+    if fmt != "html" and not image_export_available():
+        raise RuntimeError("PNG / SVG export needs kaleido (pip install kaleido)")
+    total = sum(len(names) for names in PAGE_FIGURES.values())
+    done = 0
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as bundle:
+        if fmt == "html":  # One copy of plotly.js for every page of the bundle
+            from plotly.offline import get_plotlyjs
+
+            bundle.writestr("plotly.min.js", get_plotlyjs())
+        for page in PAGE_FIGURES:
+            figures = page_figures(page, filters)
+            for name in PAGE_FIGURES[page]:
+                if name in figures:
+                    figure = figures[name]
+                    if fmt == "html":
+                        bundle.writestr(f"{name}.html", figure.to_html(include_plotlyjs="directory"))
+                    else:
+                        bundle.writestr(f"{name}.{fmt}", figure.to_image(format=fmt))
+                done += 1
+                if progress:
+                    progress(done, total)
+    return done
+
+
+# ---- Background jobs ----
+
+class ExportJob:
+
+    def __init__(self, kind, fmt, filters, path):
+        self.kind = kind
+        self.fmt = fmt
+        self.filters = filters
+        self.path = path
+        self.done = 0
+        self.total = None
+        self.error = None
+        self.finished = False
+        self.cached = False
+        self.seconds = None
+
+    @property
+    def label(self):
+        what = "Dataset" if self.kind == "data" else "Charts"
+        return f"{what} · {self.fmt.upper()}" + (" · filtered" if self.filters else "")
+
+    @property
+    def progress(self):
+        if self.finished:
+            return 1.0
+        return min(self.done / self.total, 1.0) if self.total else 0.0
+
+    def update(self, done, total):
+        self.done, self.total = done, total
+
+
+class ExportService:
+    # Process-wide: one pool and one job per export key, shared by every session
+
+    def __init__(self, export_dir=EXPORT_DIR, workers=EXPORT_WORKERS):
+        self.export_dir = export_dir
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self._jobs = {}  # export key -> ExportJob
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fmt, filters=(), path=DATA_PATH):
+        if fmt not in FORMATS[kind]:
+            raise ValueError(f"Unknown {kind} format: {fmt}")
+        key = export_key(kind, fmt, data_version(path), filters)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.error is None and (not job.finished or os.path.exists(job.path)):
+                return key  # Running, or done and still on disk
+            job = ExportJob(kind, fmt, filters, export_path(kind, fmt, key, self.export_dir))
+            self._jobs[key] = job
+            if os.path.exists(job.path):  # Exported before (possibly by an earlier process)
+                job.finished = job.cached = True
+                os.utime(job.path)  # Most recently used
+                return key
+            self._pool.submit(self._run, job, path)
+        return key
+
+    def job(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def _run(self, job, path):
+        # Worker thread: the cached dataset / aggregates are shared with the sessions
+        start = time.perf_counter()
+        os.makedirs(self.export_dir, exist_ok=True)
+        tmp_path = f"{job.path}.{uuid.uuid4().hex}.tmp"
+        try:
+            if job.kind == "data":
+                write_data(tmp_path, job.fmt, job.filters, path, progress=job.update)
+            else:
+                write_figures(tmp_path, job.fmt, job.filters, progress=job.update)
+            os.replace(tmp_path, job.path)  # The cache only holds complete files
+        except Exception as error:
+            job.error = str(error)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        finally:
+            job.seconds = time.perf_counter() - start
+            job.finished = True
+        self._prune()
+
+    def _prune(self):
+        files = [entry.path for entry in os.scandir(self.export_dir) if entry.is_file() and not entry.name.endswith(".tmp")]
+        files.sort(key=os.path.getmtime, reverse=True)
+        for file in files[EXPORT_CACHE_FILES:]:
+            os.remove(file)
+
+
+@st.cache_resource(show_spinner=False)  # One service (pool + jobs) per process, shared by every session.
+def get_export_service():
+    return ExportService()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the dataset or the figures of every page")
+    parser.add_argument("kind", choices=sorted(FORMATS))
+    parser.add_argument("--format", help="parquet / csv for data, html / png / svg for figures")
+    parser.add_argument("--output", help="Output file (default: the export cache)")
+    args = parser.parse_args()
+
+    fmt = args.format or FORMATS[args.kind][0]
+    if fmt not in FORMATS[args.kind]:
+        sys.exit(f"Unknown {args.kind} format: {fmt}")
+    if args.kind == "figures" and fmt != "html" and not image_export_available():
+        sys.exit("PNG / SVG export needs kaleido (pip install kaleido)")
+    output = args.output or export_path(args.kind, fmt, export_key(args.kind, fmt, data_version(), ()))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    start = time.perf_counter()
+    write = write_data if args.kind == "data" else write_figures
+    count = write(output, fmt)
+    print(f"Exported {count} {'rows' if args.kind == 'data' else 'figures'} to {output} "
+          f"({os.path.getsize(output) / 1e6:.1f} MB) in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,174 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+import streamlit as st
+from pages_charts.instrumentation import cache_lookup, cache_miss, span
+from pages_charts.figure_store import CHARTS_DIR, StaleFigureError, artifact_size, artifact_version, load_figure
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for the figures kept in memory (estimated by their size on disk)
+FIGURE_BUDGET_BYTES = int(os.environ.get("FIGURE_BUDGET_MB", "16")) * 1024 * 1024
+
+# ------------- Page -> Figures ----------
+
+PAGE_FIGURES = {
+    "Home | Overview": [
+        "fig_dist_won_lost",
+    ],
+    "Profile | WON vs. LOST": [
+        "fig_wl_close_reason_count",
+        "fig_wl_close_reason_pct",
+        "fig_wl_acc_type_count",
+        "fig_wl_acc_type_pct",
+        "fig_won_wl_acc_type_pct",
+        "fig_lost_wl_acc_type_pct",
+        "fig_wl_country",
+        "fig_wl_country_pct",
+        "fig_wl_segment",
+        "fig_wl_segment_pct",
+        "fig_wl_month",
+        "fig_wl_quarter",
+        "fig_wl_month_pct",
+        "fig_wl_quarter_pct",
+        "fig_month_value",
+        "fig_quarter_value",
+        "fig_month_value_pct",
+        "fig_quarter_value_pct",
+        "fig_wl_type_business_count",
+        "fig_wl_type_business_pct",
+        "fig_wl_lead_source",
+        "fig_wl_lead_source_pct",
+    ],
+    "Average Ticket Analysis": [
+        "fig_wl_avg_ticket",
+        "fig_wl_avg_ticket_account_type",
+        "fig_wl_avg_ticket_country",
+        "fig_wl_avg_ticket_segment",
+    ],
+    "Average Time to Close": [
+        "fig_wl_avg_time",
+        "fig_wl_avg_time_account_type",
+        "fig_wl_avg_time_type_business",
+    ],
+    "Cohort Analysis": [],
+    "Prediction": [],
+    "Agent Assistant": [],
+}
+
+
+class FigureRegistry:
+    # Loads figures on first access and keeps the most recently used ones in a
+    # bounded LRU. Missing or stale artifacts are remembered, so they are only reported once.
+    # Every entry carries the version (mtime, size) of its artifact: an artifact rewritten
+    # by build_charts, or created after being reported missing, is loaded again.
+
+    def __init__(self, charts_dir=CHARTS_DIR, budget_bytes=FIGURE_BUDGET_BYTES):
+        self.charts_dir = charts_dir
+        self.budget_bytes = budget_bytes
+        self._figures = OrderedDict()  # name -> (figure, size in bytes, artifact version)
+        self._used_bytes = 0
+        self._missing = {}  # name -> (reason (not found / stale artifact), artifact version)
+        self._reported = set()
+        self._lock = threading.Lock()
+
+    def _load_file(self, name):
+        with span("figure_load", figure=name) as record:
+            figure = load_figure(name, self.charts_dir)
+            size = artifact_size(name, self.charts_dir)
+            if record is not None:
+                record["bytes"] = size
+        return figure, size
+
+    def get(self, name):
+        with cache_lookup("figures", figure=name):
+            return self._get(name)
+
+    def _get(self, name):
+        version = artifact_version(name, self.charts_dir)
+        with self._lock:
+            if name in self._figures:
+                figure, size, loaded_version = self._figures[name]
+                if loaded_version == version:
+                    self._figures.move_to_end(name)  # Mark as most recently used
+                    return figure
+                del self._figures[name]  # Rebuilt (or removed) since it was loaded
+                self._used_bytes -= size
+            if name in self._missing:
+                if self._missing[name][1] == version:
+                    return None
+                del self._missing[name]  # The artifact changed: try again, report again
+                self._reported.discard(name)
+
+        cache_miss()
+        try:
+            figure, size = self._load_file(name)
+        except FileNotFoundError:
+            reason = f"Figure {name} not found in {self.charts_dir}."
+        except StaleFigureError as error:
+            reason = f"{error}. Rebuild the chart artifacts."
+        else:
+            reason = None
+        if reason is not None:
+            with self._lock:
+                self._missing[name] = (reason, version)
+            logger.warning(reason)
+            return None
+
+        with self._lock:
+            if name not in self._figures:
+                self._figures[name] = (figure, size, version)
+                self._used_bytes += size
+            self._evict(keep=name)
+        return figure
+
+    def _evict(self, keep):
+        # Drop least recently used figures until the budget is respected
+        while self._used_bytes > self.budget_bytes and len(self._figures) > 1:
+            oldest = next(iter(self._figures))
+            if oldest == keep:
+                break
+            _, size, _ = self._figures.pop(oldest)
+            self._used_bytes -= size
+
+    def page_figures(self, page):
+        # Returns {name: figure} for the figures of a page (missing ones are left out)
+        figures = {}
+        for name in PAGE_FIGURES.get(page, []):
+            figure = self.get(name)
+            if figure is not None:
+                figures[name] = figure
+        return figures
+
+    def unreported_missing(self):
+        # {name: reason} for unavailable figures not reported yet (each one is returned only once)
+        with self._lock:
+            names = sorted(set(self._missing) - self._reported)
+            self._reported.update(names)
+        return {name: self._missing[name][0] for name in names}
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+            self._used_bytes = 0
+            self._missing.clear()
+            self._reported.clear()
+
+    @property
+    def used_bytes(self):
+        return self._used_bytes
+
+
+@st.cache_resource(show_spinner=False)  # One registry per process, shared by every session.
+def get_registry():
+    return FigureRegistry()
+
+
+if __name__ == "__main__":
+    # This will execute when the script is run directly
+    registry = FigureRegistry()
+    for page in PAGE_FIGURES:
+        figures = registry.page_figures(page)
+        print(f"{page}: {len(figures)} figures, {registry.used_bytes / 1e6:.1f} MB cached")
+    print("Missing:", registry.unreported_missing())
@@ -0,0 +1,221 @@
+import os
+import sys
+import json
+import glob
+import hashlib
+import numpy as np
+import plotly
+import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
+
+# Base directory of the project (one level up from pages_charts/)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHARTS_DIR = os.path.join(BASE_DIR, "charts")
+
+# Bump when the artifact layout changes; older artifacts are then reported as stale.
+FORMAT_VERSION = 1
+
+# Arrays with at least this many items are stored as separate .npy files
+ARRAY_MIN_SIZE = 64
+
+# ------------- Figure Store ----------
+# Each figure is stored as:
+#   charts/<name>.json           -> figure spec (layout + traces) with array placeholders
+#   charts/arrays/<sha1>.npy     -> data arrays, deduplicated by content hash
+# String arrays are dictionary encoded (categories in the spec, integer codes in the .npy),
+# numeric arrays are narrowed to the smallest lossless dtype. The .npy files are
+# uncompressed on purpose, so they can be memory-mapped on load, and are read with
+# allow_pickle=False: nothing is unpickled. Each spec records the format version and
+# the plotly version it was written with; an artifact that does not match is stale
+# (StaleFigureError, reported by the figure registry).
+
+
+class StaleFigureError(ValueError):
+    # Raised when an artifact was written by another format or plotly version
+    pass
+
+
+def _arrays_dir(charts_dir):
+    return os.path.join(charts_dir, "arrays")
+
+
+def _narrow(values):
+    # Smallest dtype that keeps every value exactly
+    if values.dtype.kind == "f" and np.isfinite(values).all() and (values == np.round(values)).all():
+        values = values.astype(np.int64)
+    if values.dtype.kind in "iu" and values.size:
+        for dtype in (np.int8, np.int16, np.int32):
+            info = np.iinfo(dtype)
+            if values.min() >= info.min and values.max() <= info.max:
+                return values.astype(dtype)
+    return values
+
+
+def _encode_array(values):
+    # Returns (array to store, extra placeholder fields) or None when the array stays inline
+    try:
+        values = np.asarray(values)
+    except ValueError:  # Ragged nested lists
+        return None
+    if values.ndim != 1 or values.size < ARRAY_MIN_SIZE:
+        return None
+    if values.dtype.kind in "iuf":
+        return _narrow(values), {}
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]"), {}
+    if values.dtype.kind in "OU" and all(isinstance(v, str) for v in values):
+        categories, codes = np.unique(values.astype(str), return_inverse=True)
+        return _narrow(codes), {"categories": categories.tolist()}
+    return None
+
+
+def _write_array(values, charts_dir):
+    values = np.ascontiguousarray(values)
+    digest = hashlib.sha1(str(values.dtype).encode() + values.tobytes()).hexdigest()
+    path = os.path.join(_arrays_dir(charts_dir), f"{digest}.npy")
+    if not os.path.exists(path):  # Shared arrays are written only once
+        tmp_path = f"{path}.{os.getpid()}.tmp"  # Several build processes may write the same array
+        with open(tmp_path, "wb") as file:
+            np.save(file, values, allow_pickle=False)
+        os.replace(tmp_path, path)
+    return digest
+
+
+def _extract_arrays(node, charts_dir):
+    # Replaces large arrays in a plotly JSON tree by {"__array__": <hash>} placeholders
+    if isinstance(node, dict):
+        return {key: _extract_arrays(value, charts_dir) for key, value in node.items()}
+    if isinstance(node, (list, tuple, np.ndarray)):
+        encoded = _encode_array(node) if len(node) >= ARRAY_MIN_SIZE else None
+        if encoded is not None:
+            values, extra = encoded
+            return {"__array__": _write_array(values, charts_dir), **extra}
+        if isinstance(node, np.ndarray) and node.dtype.kind in "biufM":
+            # Small typed arrays stay inline but keep their dtype (plotly treats them differently from lists)
+            return {"__ndarray__": node.tolist(), "dtype": str(node.dtype)}
+        if isinstance(node, np.ndarray):
+            return node
+        return [_extract_arrays(value, charts_dir) for value in node]
+    return node
+
+
+def _restore_arrays(node, charts_dir, mmap):
+    if isinstance(node, dict):
+        if "__array__" in node:
+            path = os.path.join(_arrays_dir(charts_dir), f"{node['__array__']}.npy")
+            values = np.load(path, mmap_mode="r" if mmap else None, allow_pickle=False)
+            if "categories" in node:
+                values = np.asarray(node["categories"], dtype=object)[values]
+            return values
+        if "__ndarray__" in node:
+            return np.array(node["__ndarray__"], dtype=node["dtype"])
+        return {key: _restore_arrays(value, charts_dir, mmap) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_restore_arrays(value, charts_dir, mmap) for value in node]
+    return node
+
+
+def save_figure(figure, name, charts_dir=CHARTS_DIR):
+    # Writes a plotly figure to the store under charts/<name>.json
+    os.makedirs(_arrays_dir(charts_dir), exist_ok=True)
+    spec = _extract_arrays(figure.to_plotly_json(), charts_dir)
+    artifact = {
+        "format_version": FORMAT_VERSION,
+        "plotly_version": plotly.__version__,
+        "figure": spec,
+    }
+    path = os.path.join(charts_dir, f"{name}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(artifact, file, cls=PlotlyJSONEncoder)
+    os.replace(tmp_path, path)  # Readers never see a half-written artifact
+    return path
+
+
+def read_artifact(name, charts_dir=CHARTS_DIR):
+    with open(os.path.join(charts_dir, f"{name}.json")) as file:
+        return json.load(file)
+
+
+def check_artifact(artifact, name=""):
+    # Raises StaleFigureError when the artifact does not match this code / plotly version
+    if artifact.get("format_version") != FORMAT_VERSION:
+        raise StaleFigureError(f"Figure {name} has format version {artifact.get('format_version')}, expected {FORMAT_VERSION}")
+    major = plotly.__version__.split(".")[0]
+    if str(artifact.get("plotly_version", "")).split(".")[0] != major:
+        raise StaleFigureError(f"Figure {name} was built with plotly {artifact.get('plotly_version')}, running {plotly.__version__}")
+
+
+def load_figure(name, charts_dir=CHARTS_DIR, mmap=True):
+    # Loads a figure from the store (raises FileNotFoundError / StaleFigureError)
+    artifact = read_artifact(name, charts_dir)
+    check_artifact(artifact, name)
+    spec = _restore_arrays(artifact["figure"], charts_dir, mmap)
+    return go.Figure(spec)
+
+
+def artifact_version(name, charts_dir=CHARTS_DIR):
+    # Changes whenever the artifact is rewritten (None while it does not exist)
+    try:
+        stat = os.stat(os.path.join(charts_dir, f"{name}.json"))
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def artifact_size(name, charts_dir=CHARTS_DIR):
+    # Bytes on disk used by a figure (spec + referenced arrays)
+    size = os.path.getsize(os.path.join(charts_dir, f"{name}.json"))
+    for digest in referenced_arrays(read_artifact(name, charts_dir)["figure"]):
+        size += os.path.getsize(os.path.join(_arrays_dir(charts_dir), f"{digest}.npy"))
+    return size
+
+
+def referenced_arrays(node):
+    if isinstance(node, dict):
+        if "__array__" in node:
+            return {node["__array__"]}
+        return set().union(*(referenced_arrays(value) for value in node.values()))
+    if isinstance(node, list):
+        return set().union(*(referenced_arrays(value) for value in node))
+    return set()
+
+
+def prune_arrays(charts_dir=CHARTS_DIR):
+    # Deletes .npy files that no figure references anymore
+    used = set()
+    for path in glob.glob(os.path.join(charts_dir, "*.json")):
+        with open(path) as file:
+            used |= referenced_arrays(json.load(file)["figure"])
+    removed = 0
+    for path in glob.glob(os.path.join(_arrays_dir(charts_dir), "*.npy")):
+        if os.path.basename(path)[:-4] not in used:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def convert_pickles(charts_dir=CHARTS_DIR, remove=False):
+    # One-off migration of the legacy charts/*.pkl files (trusted, produced by this project)
+    import pickle
+
+    for path in sorted(glob.glob(os.path.join(charts_dir, "*.pkl"))):
+        with open(path, "rb") as file:
+            figure = pickle.load(file)
+        name = os.path.basename(path)[:-4]
+        save_figure(figure, name, charts_dir)
+        if remove:
+            os.remove(path)
+        print(f"Converted {name}")
+    prune_arrays(charts_dir)
+
+
+if __name__ == "__main__":
+    # python -m pages_charts.figure_store convert [--remove]
+    if len(sys.argv) > 1 and sys.argv[1] == "convert":
+        convert_pickles(remove="--remove" in sys.argv)
+    else:
+        for path in sorted(glob.glob(os.path.join(CHARTS_DIR, "*.json"))):
+            name = os.path.basename(path)[:-5]
+            print(f"{name}: {artifact_size(name) / 1024:.1f} KB")
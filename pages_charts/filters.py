@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from pages_charts.data_loader import DATA_PATH, OUT_OF_CORE, SHARED, dataset_version, load_data
+from pages_charts import out_of_core, shared_dataset
+from pages_charts.instrumentation import cache_lookup, cache_miss
+
+# ------------- Global Cross-Filters ----------
+# Sidebar filters applied to every page. A FilterIndex is built once per dataset
+# version: one packed bitmap per category of each filter column and a sorted
+# index of each date column. Any combination of filters resolves to a row
+# selection with bitwise ANDs of the bitmaps (plus a binary search per date range).
+
+CATEGORY_FILTERS = ["Country", "Segment", " Account Type", "Type", "Lead Source"]
+
+DATE_FILTERS = ["Created Date", "Close Date"]
+
+
+class FilterIndex:
+
+    def __init__(self, data):
+        self.n_rows = len(data)
+        self.bitmaps = {}  # column -> {category: packed bitmap}
+        self.categories = {}
+        for column in CATEGORY_FILTERS:
+            codes = data[column].cat.codes.to_numpy()
+            self.categories[column] = list(data[column].cat.categories)
+            self.bitmaps[column] = {
+                category: np.packbits(codes == code) for code, category in enumerate(self.categories[column])
+            }
+
+        self.date_order = {}  # column -> row positions sorted by date
+        self.sorted_dates = {}
+        for column in DATE_FILTERS:
+            values = data[column].to_numpy(dtype="datetime64[ns]")
+            order = np.argsort(values, kind="stable")
+            self.date_order[column] = order
+            self.sorted_dates[column] = values[order]
+
+    @classmethod
+    def from_parts(cls, n_rows, categories, bitmaps, date_order, sorted_dates):
+        # Index over arrays built elsewhere (memory-mapped by shared_dataset.py)
+        index = cls.__new__(cls)
+        index.n_rows = n_rows
+        index.categories = categories
+        index.bitmaps = bitmaps
+        index.date_order = date_order
+        index.sorted_dates = sorted_dates
+        return index
+
+    def date_bounds(self, column):
+        dates = self.sorted_dates[column]
+        dates = dates[~np.isnat(dates)]
+        return pd.Timestamp(dates[0]).date(), pd.Timestamp(dates[-1]).date()
+
+    def _date_bitmap(self, column, start, end):
+        dates = self.sorted_dates[column]
+        first = np.searchsorted(dates, np.datetime64(pd.Timestamp(start)), side="left")
+        last = np.searchsorted(dates, np.datetime64(pd.Timestamp(end) + pd.Timedelta(days=1)), side="left")
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.date_order[column][first:last]] = True
+        return np.packbits(mask)
+
+    def select(self, filters):
+        # Boolean row mask for a frozen filter state, or None when nothing is filtered
+        if not filters:
+            return None
+        selection = None
+        for column, values in filters:
+            if column in DATE_FILTERS:
+                bitmap = self._date_bitmap(column, *values)
+            else:
+                bitmap = np.zeros_like(next(iter(self.bitmaps[column].values())))
+                for value in values:  # OR inside a column
+                    bitmap |= self.bitmaps[column][value]
+            selection = bitmap if selection is None else selection & bitmap  # AND across columns
+        return np.unpackbits(selection, count=self.n_rows).astype(bool)
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)  # Built once per dataset version and shared by every session.
+def _build_index(path, version):
+    cache_miss()
+    return FilterIndex(load_data(path))
+
+
+def get_filter_index(path=DATA_PATH):
+    with cache_lookup("filter_index"):
+        if OUT_OF_CORE:  # Only the categories and date bounds, from a streaming scan
+            return out_of_core.get_summary(CATEGORY_FILTERS, DATE_FILTERS)
+        if SHARED:  # Mapped from the published version (see shared_dataset.py)
+            return shared_dataset.shared_filter_index(path)
+        return _build_index(path, dataset_version(path))
+
+
+def freeze_filters(filters):
+    # Hashable filter state (used as cache key); empty selections are dropped
+    frozen = []
+    for column, values in sorted(filters.items()):
+        if column in DATE_FILTERS:
+            if values is not None:
+                frozen.append((column, tuple(values)))
+        elif values:
+            frozen.append((column, tuple(sorted(values))))
+    return tuple(frozen)
+
+
+def select_rows(filters, path=DATA_PATH):
+    # Mask of the rows matching a frozen filter state (None = every row)
+    return get_filter_index(path).select(filters)
+
+
+def count_rows(filters=(), path=DATA_PATH):
+    # Number of rows matching a frozen filter state
+    if OUT_OF_CORE:
+        return out_of_core.count_rows(filters)
+    mask = select_rows(filters, path)
+    return get_filter_index(path).n_rows if mask is None else int(mask.sum())
+
+
+def data_version(path=DATA_PATH):
+    # Version stamp of the data behind the queries (the scanned dataset in out-of-core mode)
+    if OUT_OF_CORE:
+        return out_of_core.source_version(out_of_core.scan_source())
+    return dataset_version(path)
+
+
+def filtered_data(filters, path=DATA_PATH):
+    data = load_data(path)
+    mask = select_rows(filters, path)
+    return data if mask is None else data[mask]
+
+
+def render_sidebar_filters(path=DATA_PATH):
+    # Sidebar widgets; returns the frozen filter state
+    index = get_filter_index(path)
+    filters = {}
+    with st.sidebar.expander("Filters", expanded=False):
+        for column in CATEGORY_FILTERS:
+            filters[column] = st.multiselect(column.strip(), index.categories[column], key=f"filter_{column}")
+        for column in DATE_FILTERS:
+            lower, upper = index.date_bounds(column)
+            selected = st.date_input(column, value=(lower, upper), min_value=lower, max_value=upper, key=f"filter_{column}")
+            # Only a complete range that differs from the full period filters the rows
+            if isinstance(selected, (tuple, list)) and len(selected) == 2 and tuple(selected) != (lower, upper):
+                filters[column] = (str(selected[0]), str(selected[1]))
+            else:
+                filters[column] = None
+    return freeze_filters(filters)
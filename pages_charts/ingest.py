@@ -0,0 +1,318 @@
+import os
+import sys
+import json
+import shutil
+import uuid
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pages_charts.aggregate_cube import CUBE_DIMENSIONS, CUBE_MEASURES, CUBE_SKETCH_K
+from pages_charts.calendar_rollup import ROLLUP_COLUMNS, ROLLUP_FILE, daily_rollup, load_rollup, merge_rollups, save_rollup
+from pages_charts.data_loader import BASE_DIR, DATA_PATH, PARTITIONS_DIR
+from pages_charts.quantile_sketch import SKETCH_FILE, group_sketches, load_sketches, merge_sketch_maps, save_sketches
+
+# ------------- Incremental Ingest ----------
+# Replaces the preprocessing cells of sales_prep_feat_eng.ipynb:
+#   python -m pages_charts.ingest [raw.csv] [--full] [--chunksize N]
+#
+# The raw CRM export is streamed in chunks (bounded memory), transformed with the
+# notebook rules and written as parquet partitioned by Close Date month
+# (data/partitions/close_month=YYYY-MM/). A state file keeps the Close Date
+# watermark and a digest of the rows of every partition:
+#   - rows closed after the watermark are new and appended to their partition;
+#   - rows at/before the watermark are only hashed; a partition is rewritten only
+#     when its digest changed (edited or deleted rows in the export).
+# The state also keeps the size and a hash of the bytes of the export already
+# ingested: when the new export starts with the same bytes (rows appended only),
+# just the appended bytes are parsed; any other change is one full pass.
+# Each partition also keeps KLL quantile sketches of the cube measures per cube
+# cell (_sketches.json): new rows are merged into them, rewritten partitions are
+# re-sketched. The out-of-core aggregate cube merges them instead of sketching the
+# scanned rows, and model training takes its bin edges from them.
+# The daily Won/Lost rollup of the partition (_daily_rollup.json, see
+# calendar_rollup.py) is kept up to date the same way.
+# Finally the partitions are compacted into data/sales_preprocessed_data.parquet,
+# the file read by the dashboard. That is a full parquet-to-parquet copy of the
+# partitions (no CSV parsing), skipped when the run found no new or changed rows;
+# QUERY_MODE=out_of_core reads the partitions directly (--no-compact).
+
+# File name of the CRM export read by sales_prep_feat_eng.ipynb (spelling included)
+RAW_PATH = os.environ.get("SALES_RAW_PATH", os.path.join(BASE_DIR, "data", "sales_origiinal_data.csv"))
+
+STATE_PATH = os.path.join(PARTITIONS_DIR, "_ingest_state.json")
+
+CHUNK_SIZE = 100_000
+
+FILLNA_COLUMNS = ["Segment", "Lead Source", "Type", "Primary Campaign Source", "Close Reason", "Business Type"]
+
+PARTITION_COLUMN = "close_month"
+
+# Storage schema of the processed data (same columns/types as the notebook output)
+STRING_COLUMNS = [
+    "Opportunity Name", " Account Name", " Account Type", "Stage", "Opportunity Owner", "Country",
+    "Region", "Segment", "Lead Source", "Type", "Primary Campaign Source", "Close Reason", "Business Type",
+]
+
+OUTPUT_COLUMNS = [
+    "Opportunity Name", "Created Date", "Close Date", " Account Name", " Account Type", " Opp Value (EUR)",
+    "Stage", "Opportunity Owner", "Country", "Region", "Segment", "Lead Source", "Type",
+    "Primary Campaign Source", "Close Reason", "Business Type", "Deal Opened (Days)",
+]
+
+
+def transform_chunk(chunk):
+    # Same rules as the notebook, applied to one chunk of raw rows
+    chunk = chunk.copy()
+    for column in FILLNA_COLUMNS:
+        chunk[column] = chunk[column].fillna("Unknow")
+
+    chunk[" Opp Value (EUR)"] = pd.to_numeric(chunk[" Opp Value (EUR)"], errors="coerce")
+    chunk["Created Date"] = pd.to_datetime(chunk["Created Date"], format="%d/%m/%Y", errors="coerce")
+    chunk["Close Date"] = pd.to_datetime(chunk["Close Date"], format="%m/%d/%Y", errors="coerce")
+
+    # Time to close in days; negative durations (and missing dates) are removed
+    days = (chunk["Close Date"] - chunk["Created Date"]).dt.days
+    chunk = chunk[days >= 0].copy()
+    chunk["Deal Opened (Days)"] = days[days >= 0].astype("int64")
+
+    for column in STRING_COLUMNS:
+        chunk[column] = chunk[column].astype(object).where(chunk[column].notna(), None)
+    return chunk[OUTPUT_COLUMNS].reset_index(drop=True)
+
+
+def read_raw_chunks(raw_path, chunksize=CHUNK_SIZE, offset=0):
+    # Every column is read as text, so all chunks share the same schema. offset: byte position
+    # of a row start to read from (the column names still come from the header line)
+    columns = list(pd.read_csv(raw_path, dtype=str, nrows=0).columns)
+    with open(raw_path, "rb") as file:
+        file.seek(offset)
+        if offset and not file.read(1):  # Nothing after the offset
+            return
+        file.seek(offset)
+        header = {"header": None, "names": columns} if offset else {}
+        yield from pd.read_csv(file, dtype=str, chunksize=chunksize, **header)
+
+
+def raw_digests(raw_path, prefix_size):
+    # (hash of the first prefix_size bytes, hash of the whole file, whether it ends a line)
+    prefix, whole = hashlib.sha1(), hashlib.sha1()
+    last = b""
+    with open(raw_path, "rb") as file:
+        position = 0
+        while block := file.read(1 << 20):
+            if position < prefix_size:
+                prefix.update(block[:prefix_size - position])
+            whole.update(block)
+            position += len(block)
+            last = block[-1:]
+    return prefix.hexdigest(), whole.hexdigest(), last == b"\n"
+
+
+def partition_keys(chunk):
+    return chunk["Close Date"].dt.strftime("%Y-%m")
+
+
+def row_hashes(chunk):
+    return pd.util.hash_pandas_object(chunk, index=False).to_numpy(dtype=np.uint64)
+
+
+def _add_digests(digests, keys, hashes):
+    # Order-independent digest per partition: (row count, sum of row hashes mod 2**64)
+    frame = pd.DataFrame({"key": keys.to_numpy(), "hash": hashes})
+    for key, group in frame.groupby("key"):
+        count, total = digests.get(key, (0, 0))
+        total = (total + int(group["hash"].to_numpy().sum(dtype=np.uint64))) % 2**64
+        digests[key] = (count + len(group), total)
+
+
+def _write_part(chunk, partition_dir, name):
+    os.makedirs(partition_dir, exist_ok=True)
+    table = pa.Table.from_pandas(chunk, preserve_index=False)
+    pq.write_table(table, os.path.join(partition_dir, f"{name}.parquet"))
+
+
+def _partition_dir(root, key):
+    return os.path.join(root, f"{PARTITION_COLUMN}={key}")
+
+
+def load_state(state_path=STATE_PATH):
+    if not os.path.exists(state_path):
+        return {"watermark": None, "partitions": {}}
+    with open(state_path) as file:
+        return json.load(file)
+
+
+def save_state(state, state_path=STATE_PATH):
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(state, file, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def _rewrite_partitions(raw_path, keys, partitions_dir, chunksize):
+    # Second pass over the raw file, only for partitions whose old rows changed
+    staging = os.path.join(partitions_dir, f"_staging-{uuid.uuid4().hex}")
+    for number, raw in enumerate(read_raw_chunks(raw_path, chunksize)):
+        chunk = transform_chunk(raw)
+        chunk_keys = partition_keys(chunk)
+        for key, part in chunk.groupby(chunk_keys[chunk_keys.isin(keys)]):
+            _write_part(part, _partition_dir(staging, key), f"part-{number:05d}")
+    for key in keys:
+        target = _partition_dir(partitions_dir, key)
+        shutil.rmtree(target, ignore_errors=True)
+        if os.path.exists(_partition_dir(staging, key)):
+            os.replace(_partition_dir(staging, key), target)
+    shutil.rmtree(staging, ignore_errors=True)
+
+
+def chunk_sketches(chunk):
+    # {measure: {cube cell: sketch}} of a chunk of processed rows (same k as the cube sketches)
+    return {measure: group_sketches(chunk, CUBE_DIMENSIONS, measure, CUBE_SKETCH_K) for measure in CUBE_MEASURES}
+
+
+def _merge_chunk_sketches(sketches, chunk):
+    for measure, cells in chunk_sketches(chunk).items():
+        stored = sketches.setdefault(measure, {})
+        for key, sketch in cells.items():
+            if key in stored:
+                stored[key].merge(sketch)
+            else:
+                stored[key] = sketch
+
+
+def _update_sketches(partitions_dir, new_sketches, rebuilt):
+    # New rows are merged into the stored sketches; rewritten partitions are sketched again
+    for key in rebuilt:
+        partition_dir = _partition_dir(partitions_dir, key)
+        if os.path.exists(partition_dir):
+            rows = ds.dataset(partition_dir, format="parquet").to_table(columns=CUBE_DIMENSIONS + CUBE_MEASURES).to_pandas()
+            save_sketches(os.path.join(partition_dir, SKETCH_FILE), chunk_sketches(rows))
+    for key, sketches in new_sketches.items():
+        if key in rebuilt:
+            continue
+        path = os.path.join(_partition_dir(partitions_dir, key), SKETCH_FILE)
+        stored = load_sketches(path)
+        merged = {measure: merge_sketch_maps([stored.get(measure, {}), sketches[measure]]) for measure in sketches}
+        save_sketches(path, merged)
+
+
+def _update_rollups(partitions_dir, new_rollups, rebuilt):
+    # Same as the sketches: new rows are added to the stored rollup, rewritten partitions are rolled up again
+    for key in rebuilt:
+        partition_dir = _partition_dir(partitions_dir, key)
+        if os.path.exists(partition_dir):
+            rows = ds.dataset(partition_dir, format="parquet").to_table(columns=ROLLUP_COLUMNS).to_pandas()
+            save_rollup(os.path.join(partition_dir, ROLLUP_FILE), daily_rollup(rows))
+    for key, rollups in new_rollups.items():
+        if key in rebuilt:
+            continue
+        path = os.path.join(_partition_dir(partitions_dir, key), ROLLUP_FILE)
+        stored = load_rollup(path)
+        save_rollup(path, merge_rollups(rollups if stored is None else [stored] + rollups))
+
+
+def compact(partitions_dir=PARTITIONS_DIR, output_path=DATA_PATH):
+    # Streams the partitions into the single parquet file read by the dashboard
+    dataset = ds.dataset(partitions_dir, format="parquet", partitioning="hive")  # "_" files/dirs are ignored
+    scanner = dataset.scanner(columns=OUTPUT_COLUMNS)
+    tmp_path = f"{output_path}.tmp"
+    with pq.ParquetWriter(tmp_path, scanner.projected_schema) as writer:
+        for batch in scanner.to_batches():
+            writer.write_batch(batch)
+    os.replace(tmp_path, output_path)  # The data loader sees a new dataset version
+
+
+def ingest(raw_path=RAW_PATH, partitions_dir=PARTITIONS_DIR, output_path=DATA_PATH, full=False, chunksize=CHUNK_SIZE):
+    state_path = os.path.join(partitions_dir, os.path.basename(STATE_PATH))
+    if full:
+        shutil.rmtree(partitions_dir, ignore_errors=True)
+    os.makedirs(partitions_dir, exist_ok=True)
+
+    state = load_state(state_path)
+    watermark = pd.Timestamp(state["watermark"]) if state["watermark"] else None
+    run_id = uuid.uuid4().hex[:8]
+
+    stored = {key: tuple(value) for key, value in state["partitions"].items()}
+    raw = state.get("raw")  # {"size", "digest"} of the export ingested last, when it ended a line
+    prefix_digest, raw_digest, whole_lines = raw_digests(raw_path, raw["size"] if raw else 0)
+    offset = raw["size"] if raw and prefix_digest == raw["digest"] else 0
+
+    # Digests of the rows at/before the watermark, and of all rows, per partition. Rows before
+    # the offset were all ingested and are at/before the watermark: their digests are the stored ones.
+    old_digests = dict(stored) if offset else {}
+    all_digests = dict(stored) if offset else {}
+    new_sketches = {}  # partition -> sketches of its new rows
+    new_rollups = {}  # partition -> daily rollups of its new rows
+    new_rows = 0
+    max_close = watermark
+
+    for number, rows in enumerate(read_raw_chunks(raw_path, chunksize, offset)):
+        chunk = transform_chunk(rows)
+        if chunk.empty:
+            continue
+        keys = partition_keys(chunk)
+        hashes = row_hashes(chunk)
+        _add_digests(all_digests, keys, hashes)
+
+        is_new = chunk["Close Date"] > watermark if watermark is not None else np.ones(len(chunk), dtype=bool)
+        is_new = np.asarray(is_new)
+        if (~is_new).any():
+            _add_digests(old_digests, keys[~is_new], hashes[~is_new])
+
+        new_chunk = chunk[is_new]
+        for key, part in new_chunk.groupby(keys[is_new]):
+            _write_part(part, _partition_dir(partitions_dir, key), f"part-{run_id}-{number:05d}")
+            _merge_chunk_sketches(new_sketches.setdefault(key, {}), part)
+            new_rollups.setdefault(key, []).append(daily_rollup(part))
+        new_rows += len(new_chunk)
+
+        chunk_max = chunk["Close Date"].max()
+        max_close = chunk_max if max_close is None else max(max_close, chunk_max)
+
+    # Partitions whose previously ingested rows are not the same anymore
+    changed = sorted(key for key in set(stored) | set(old_digests) if stored.get(key) != old_digests.get(key))
+    if changed:
+        _rewrite_partitions(raw_path, changed, partitions_dir, chunksize)
+    _update_sketches(partitions_dir, new_sketches, changed)
+    _update_rollups(partitions_dir, new_rollups, changed)
+
+    state = {
+        "watermark": max_close.isoformat() if max_close is not None else None,
+        "partitions": {key: list(value) for key, value in sorted(all_digests.items())},
+        "raw": {"size": os.path.getsize(raw_path), "digest": raw_digest} if whole_lines else None,
+    }
+    save_state(state, state_path)
+
+    if output_path and (new_rows or changed or not os.path.exists(output_path)):
+        compact(partitions_dir, output_path)
+
+    read = f"appended bytes {offset:,}+" if offset else "whole export"
+    print(f"Ingested {new_rows} new rows, rewrote {len(changed)} changed partitions ({read}, watermark {state['watermark']})")
+    return {"new_rows": new_rows, "changed_partitions": changed, "watermark": state["watermark"], "offset": offset}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental ingest of the raw CRM export")
+    parser.add_argument("raw_path", nargs="?", default=RAW_PATH)
+    parser.add_argument("--full", action="store_true", help="Rebuild every partition from scratch")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--no-compact", action="store_true", help="Do not rewrite data/sales_preprocessed_data.parquet")
+    parser.add_argument("--train", action="store_true", help="Then train the stage model on the new part files (see model_training.py)")
+    parser.add_argument("--publish", action="store_true", help="Then publish the new version for QUERY_MODE=shared (see shared_dataset.py)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.raw_path):
+        sys.exit(f"Raw file not found: {args.raw_path}")
+    ingest(args.raw_path, full=args.full, chunksize=args.chunksize, output_path=None if args.no_compact else DATA_PATH)
+    if args.train:
+        from pages_charts.model_training import refresh
+
+        refresh(full=args.full)
+    if args.publish and not args.no_compact:
+        from pages_charts.shared_dataset import publish
+
+        print(f"Published {publish(DATA_PATH)}")
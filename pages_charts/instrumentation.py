@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import pandas as pd
+import streamlit as st
+
+# ------------- Hot-Path Instrumentation ----------
+# Every rerun of app_st.py collects:
+#   - timing spans (data load, figure load per file, aggregations, chart emission),
+#     nested like the calls that opened them;
+#   - hit / miss counters of the caches (a lookup is a miss when the cached body ran);
+#   - memory: resident size sampled at every span boundary, and how much the rerun
+#     raised the peak resident size of the process.
+# The summary of a rerun is logged as one JSON line (logger "pages_charts.instrumentation";
+# PERF_LOG=stderr or PERF_LOG=<file> attaches a handler) and shown in a developer
+# panel when the page URL has ?perf=1. Outside a rerun (CLI, builds, benchmarks)
+# spans are no-ops. Page sections are fragments (see fragment()): a section rerun
+# by its own widgets is logged as a rerun of its own.
+
+logger = logging.getLogger(__name__)
+
+PERF_LOG = os.environ.get("PERF_LOG", "")
+
+PANEL_QUERY_PARAM = "perf"
+
+HISTORY_SIZE = 20  # Reruns kept in the session for the panel
+
+_local = threading.local()  # Streamlit runs each session's script in its own thread
+
+_running = set()  # Script threads between start_rerun() and finish_rerun()
+
+
+def _configure_logging():
+    if not PERF_LOG or logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr) if PERF_LOG in ("1", "stderr") else logging.FileHandler(PERF_LOG)
+    handler.setFormatter(logging.Formatter("%(message)s"))  # One JSON object per line
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+_configure_logging()
+
+
+def _rss_bytes():
+    # Current resident set size (Linux), None elsewhere
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _max_rss_bytes():
+    # Peak resident set size of the process so far
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Bytes on macOS, KiB on Linux
+
+
+class RerunMetrics:
+
+    def __init__(self):
+        self.timestamp = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        self.page = None
+        self.spans = []  # {"name", "depth", "ms", ...fields}, in opening order
+        self.cache = {}  # cache name -> {"hits": n, "misses": n}
+        self.total_ms = None
+        self._start = time.perf_counter()
+        self._open = []  # Spans not closed yet (innermost last)
+        self._rss_start = self._rss_peak = _rss_bytes()
+        self._max_rss_start = _max_rss_bytes()
+
+    def sample_memory(self):
+        rss = _rss_bytes()
+        if rss is not None and (self._rss_peak is None or rss > self._rss_peak):
+            self._rss_peak = rss
+
+    def to_dict(self):
+        def mb(value):
+            return None if value is None else round(value / 1e6, 1)
+
+        max_rss = _max_rss_bytes()
+        return {
+            "timestamp": self.timestamp,
+            "page": self.page,
+            "total_ms": self.total_ms,
+            "spans": self.spans,
+            "cache": self.cache,
+            "memory": {
+                "rss_start_mb": mb(self._rss_start),
+                "rss_peak_mb": mb(self._rss_peak),
+                "max_rss_mb": mb(max_rss),
+                "max_rss_growth_mb": mb(max_rss - self._max_rss_start) if max_rss is not None else None,
+            },
+        }
+
+
+def start_rerun():
+    # Called at the top of app_st.py; the spans of this thread are collected from now on
+    _local.metrics = RerunMetrics()
+    _running.add(threading.current_thread())
+    return _local.metrics
+
+
+def reruns_running():
+    # Whether a session script is running (a script thread that stopped mid-rerun no longer counts)
+    for thread in list(_running):
+        if not thread.is_alive():
+            _running.discard(thread)
+    return bool(_running)
+
+
+def current_rerun():
+    return getattr(_local, "metrics", None)
+
+
+@contextmanager
+def span(name, **fields):
+    metrics = current_rerun()
+    if metrics is None:
+        yield None
+        return
+    record = {"name": name, "depth": len(metrics._open), **fields}
+    metrics.spans.append(record)
+    metrics._open.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["ms"] = round((time.perf_counter() - start) * 1000, 3)
+        metrics._open.remove(record)
+        metrics.sample_memory()
+
+
+@contextmanager
+def cache_lookup(name, **fields):
+    # Span around the lookup of a cached resource; cache_miss() inside marks it as a miss
+    with span(name, cache=name, **fields) as record:
+        if record is None:
+            yield
+            return
+        record["hit"] = True
+        try:
+            yield
+        finally:
+            counters = current_rerun().cache.setdefault(name, {"hits": 0, "misses": 0})
+            counters["hits" if record["hit"] else "misses"] += 1
+
+
+def cache_miss():
+    # Called by the body of a cached function: the innermost open lookup missed
+    metrics = current_rerun()
+    if metrics is None:
+        return
+    for record in reversed(metrics._open):
+        if "hit" in record:
+            record["hit"] = False
+            return
+
+
+def finish_rerun(page=None):
+    # Closes the rerun of this thread and logs its summary as one JSON line
+    metrics = current_rerun()
+    _running.discard(threading.current_thread())
+    if metrics is None:
+        return None
+    _local.metrics = None
+    metrics.page = page
+    metrics.total_ms = round((time.perf_counter() - metrics._start) * 1000, 3)
+    metrics.sample_memory()
+    summary = metrics.to_dict()
+    logger.info(json.dumps(summary, default=str))
+    return summary
+
+
+def fragment(name, run_every=None):
+    # st.fragment decorator for a page section: a widget of the section (or the run_every
+    # timer) reruns the section only. Such a partial rerun is logged as its own rerun ("<name> (fragment)").
+    def decorate(function):
+        @st.fragment(run_every=run_every)
+        @functools.wraps(function)
+        def run(*args, **kwargs):
+            partial = current_rerun() is None  # Inside a full rerun, app_st.py has started the metrics
+            if partial:
+                start_rerun()
+            try:
+                with span("section", section=name):
+                    return function(*args, **kwargs)
+            finally:
+                if partial:
+                    finish_rerun(f"{name} (fragment)")
+        return run
+    return decorate
+
+
+# ---- Developer panel ----
+
+def panel_enabled():
+    return st.query_params.get(PANEL_QUERY_PARAM, "0") not in ("", "0", "false")
+
+
+def render_perf_panel(summary):
+    # Hidden panel (?perf=1): spans, cache counters and memory of the last rerun, plus recent reruns
+    history = st.session_state.setdefault("perf_history", [])
+    history.append({"time": summary["timestamp"][11:23], "page": summary["page"], "total_ms": summary["total_ms"],
+                    **{key: value for key, value in summary["memory"].items() if key in ("rss_peak_mb", "max_rss_growth_mb")}})
+    del history[:-HISTORY_SIZE]
+
+    with st.expander("Performance (developer)", expanded=True):
+        memory = summary["memory"]
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Rerun", f"{summary['total_ms']:.0f} ms")
+        col2.metric("Peak RSS", f"{memory['rss_peak_mb']} MB")
+        col3.metric("Process peak growth", f"{memory['max_rss_growth_mb']} MB")
+        hits = sum(counter["hits"] for counter in summary["cache"].values())
+        misses = sum(counter["misses"] for counter in summary["cache"].values())
+        col4.metric("Cache hits / misses", f"{hits} / {misses}")
+
+        spans = pd.DataFrame(summary["spans"], dtype=object)
+        spans = spans.where(spans.notna(), "")  # Fields that only some spans have
+        if not spans.empty:
+            spans.insert(0, "span", ["· " * depth + name for depth, name in zip(spans.pop("depth"), spans.pop("name"))])
+            st.markdown("**Spans** (nested in call order)")
+            st.dataframe(spans.astype(str), use_container_width=True, hide_index=True)
+        if summary["cache"]:
+            st.markdown("**Caches**")
+            st.dataframe(pd.DataFrame(summary["cache"]).T, use_container_width=True)
+        st.markdown("**Recent reruns**")
+        st.dataframe(pd.DataFrame(history[::-1]), use_container_width=True, hide_index=True)
@@ -0,0 +1,185 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import numpy as np
+import pyarrow.parquet as pq
+from pages_charts.data_loader import BASE_DIR, PARTITIONS_DIR
+from pages_charts.quantile_sketch import KLLSketch, load_partition_sketches
+from pages_charts.stage_model import (
+    CATEGORICAL_FEATURES, CLASSES, FORMAT_VERSION, INPUT_COLUMNS, MODEL_PATH, N_BINS, NUMERIC_FEATURES,
+    FeaturePipeline, StageModel, auc_score, save_model, snapshot_examples,
+)
+
+# ------------- Incremental Model Training ----------
+#   python -m pages_charts.model_training [--partitions DIR] [--full]
+#   (or python -m pages_charts.ingest --train after a new export)
+#
+# Trains the stage model (see stage_model.py) from the Close Date month partitions
+# written by ingest.py, streaming every parquet file in record batches. The model
+# is made of counts, so the checkpoint keeps the counts of every part file:
+#   - files already in the checkpoint (same size and modification time) are skipped;
+#   - new files are trained and their counts added;
+#   - files that were removed or rewritten have their counts dropped.
+# A refresh therefore reads only the new part files: its cost grows with the new
+# data, not with the history. The checkpoint is saved after every file, so an
+# interrupted refresh resumes where it stopped.
+#
+# The quantile bin edges of the numeric features are fixed by the first training
+# (from the partition KLL sketches, or one streaming pass without them), and the
+# vocabularies only grow, so stored counts stay valid. Before new files are
+# trained, the current model scores their snapshots ("prequential" accuracy / AUC
+# on data it has not seen), which is the quality figure shown on the Prediction page.
+
+CHECKPOINT_PATH = os.path.join(BASE_DIR, "models", "stage_model_checkpoint.json")
+
+BATCH_ROWS = 64 * 1024
+
+TRAINING_COLUMNS = INPUT_COLUMNS + ["Deal Opened (Days)", "Stage"]
+
+# Sketched cube measure of each numeric feature (see ingest.py); the ages of the snapshots
+# lie within the times to close, whose quantiles give the age bins
+SKETCH_MEASURES = {" Opp Value (EUR)": " Opp Value (EUR)", "Age (Days)": "Deal Opened (Days)"}
+
+
+def part_files(partitions_dir=PARTITIONS_DIR):
+    # {path relative to the partitions: size-mtime fingerprint} of the parquet part files
+    files = {}
+    for path in sorted(glob.glob(os.path.join(partitions_dir, "*=*", "*.parquet"))):
+        stat = os.stat(path)
+        files[os.path.relpath(path, partitions_dir)] = f"{stat.st_size}-{stat.st_mtime_ns}"
+    return files
+
+
+def read_batches(path, columns=TRAINING_COLUMNS):
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=BATCH_ROWS, columns=list(columns)):
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+
+def _quantile_edges(sketch, n_bins=N_BINS):
+    if not sketch.n:
+        return []
+    return np.unique(sketch.quantiles(np.linspace(0, 1, n_bins + 1)[1:-1])).tolist()
+
+
+def initial_pipeline(partitions_dir=PARTITIONS_DIR, n_bins=N_BINS):
+    # Empty vocabularies and the bin edges of the whole history
+    sketches = load_partition_sketches(partitions_dir)
+    merged = {}
+    if all(SKETCH_MEASURES[name] in sketches for name in NUMERIC_FEATURES):
+        for name in NUMERIC_FEATURES:
+            merged[name] = KLLSketch()
+            for sketch in sketches[SKETCH_MEASURES[name]].values():
+                merged[name].merge(sketch)
+    else:  # No sketches (e.g. synthetic partitions): one pass over the two numeric columns
+        merged = {name: KLLSketch() for name in NUMERIC_FEATURES}
+        for path in part_files(partitions_dir):
+            for batch in read_batches(os.path.join(partitions_dir, path), list(SKETCH_MEASURES.values())):
+                for name in NUMERIC_FEATURES:
+                    merged[name].update(batch[SKETCH_MEASURES[name]].to_numpy(dtype="float64"))
+    edges = {name: _quantile_edges(merged[name], n_bins) for name in NUMERIC_FEATURES}
+    return FeaturePipeline({name: [] for name in CATEGORICAL_FEATURES}, edges)
+
+
+def load_checkpoint(path=CHECKPOINT_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        checkpoint = json.load(file)
+    return checkpoint if checkpoint.get("format_version") == FORMAT_VERSION else None
+
+
+def save_checkpoint(checkpoint, path=CHECKPOINT_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_path, path)
+
+
+def total_model(pipeline, files):
+    # Sum of the counts of every trained file
+    model = StageModel(pipeline)
+    for entry in files.values():
+        model.merge(StageModel.from_counts(pipeline, entry))
+    return model
+
+
+def refresh(partitions_dir=PARTITIONS_DIR, checkpoint_path=CHECKPOINT_PATH, model_path=MODEL_PATH, full=False):
+    checkpoint = None if full else load_checkpoint(checkpoint_path)
+    if checkpoint is None:
+        pipeline = initial_pipeline(partitions_dir)
+        checkpoint = {"format_version": FORMAT_VERSION, "pipeline": pipeline.to_dict(), "files": {}}
+    pipeline = FeaturePipeline.from_dict(checkpoint["pipeline"])
+    files = checkpoint["files"]
+
+    current = part_files(partitions_dir)
+    dropped = [path for path, entry in files.items() if current.get(path) != entry["fingerprint"]]
+    for path in dropped:
+        del files[path]
+    new = [path for path, fingerprint in current.items() if path not in files]
+
+    start = time.perf_counter()
+    model = total_model(pipeline, files)  # Scores the new rows before they are learned
+    evaluate = model.class_counts.sum() > 0
+    labels, probabilities = [], []
+    new_rows = 0
+    for path in new:
+        file_model = StageModel(pipeline)
+        closed_rows = 0
+        for batch in read_batches(os.path.join(partitions_dir, path)):
+            closed_rows += int(np.isin(batch["Stage"].astype(str), CLASSES).sum())
+            features, stages = snapshot_examples(batch)  # Weekly snapshots of the closed rows
+            if evaluate:
+                probabilities.append(model.resize().predict_proba(features))
+                labels.append(stages == CLASSES[1])
+            pipeline.extend(features)
+            file_model.resize().partial_fit(features, stages)
+            new_rows += len(batch)
+        files[path] = {"fingerprint": current[path], "closed_rows": closed_rows, **file_model.counts_to_dict()}
+        checkpoint["pipeline"] = pipeline.to_dict()
+        save_checkpoint(checkpoint, checkpoint_path)  # Progress survives an interruption
+
+    model = total_model(pipeline, files)
+    model.metadata = {
+        "trained_rows": sum(entry["closed_rows"] for entry in files.values()),
+        "snapshots": int(model.class_counts.sum()),
+        "trained_files": len(files),
+        "incremental": {"new_files": len(new), "dropped_files": len(dropped), "new_rows": new_rows},
+    }
+    labels = np.concatenate(labels) if labels else np.zeros(0, dtype=bool)
+    if labels.any() and not labels.all():  # Both classes among the new rows
+        probabilities = np.concatenate(probabilities)
+        checkpoint["prequential"] = {
+            "rows": int(len(labels)),
+            "accuracy": round(float(((probabilities >= 0.5) == labels).mean()), 4),
+            "auc": round(auc_score(labels, probabilities), 4),
+        }
+    if "prequential" in checkpoint:  # Figures of the last refresh that had new rows to score
+        model.metadata["prequential"] = checkpoint["prequential"]
+    save_checkpoint(checkpoint, checkpoint_path)
+    if new or dropped or not os.path.exists(model_path):
+        save_model(model, model_path)
+
+    print(f"Trained {len(new)} new files ({new_rows:,} rows) in {time.perf_counter() - start:.1f}s, "
+          f"dropped {len(dropped)}; model of {model.metadata['trained_rows']:,} closed rows "
+          f"({model.metadata['snapshots']:,} snapshots) -> {model_path}")
+    return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental training of the stage model over the parquet partitions")
+    parser.add_argument("--partitions", default=PARTITIONS_DIR)
+    parser.add_argument("--full", action="store_true", help="Ignore the checkpoint and train every file again")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--output", default=MODEL_PATH)
+    args = parser.parse_args()
+
+    if not part_files(args.partitions):
+        sys.exit(f"No parquet partitions in {args.partitions} (run python -m pages_charts.ingest)")
+    model = refresh(args.partitions, args.checkpoint, args.output, full=args.full)
+    if "prequential" in model.metadata:
+        print("Accuracy on the new data before training:", model.metadata["prequential"])
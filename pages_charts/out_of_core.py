@@ -0,0 +1,154 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import streamlit as st
+from pages_charts.data_loader import DATA_PATH, DATE_COLUMNS, PARTITIONS_DIR, SCHEMA, apply_schema, dataset_version
+
+# ------------- Out-of-Core Query Mode ----------
+# Used when QUERY_MODE=out_of_core (see data_loader.py). The data is scanned as a
+# pyarrow dataset: the Close Date month partitions written by ingest.py when they
+# exist, else the compacted parquet file. Filters are pushed down to the scan
+# (partitions / row groups are skipped from their statistics) and only the columns
+# a query needs are read, one record batch at a time. The engines (profile, cube)
+# aggregate batch by batch and merge the partial results, so the full table is
+# never materialized.
+
+SCAN_BATCH_ROWS = 64 * 1024
+
+PARTITION_COLUMN = "close_month"
+
+
+def scan_source():
+    # Partitioned dataset when ingest.py wrote one, else the single parquet file
+    if glob.glob(os.path.join(PARTITIONS_DIR, f"{PARTITION_COLUMN}=*")):
+        return PARTITIONS_DIR
+    return DATA_PATH
+
+
+def source_version(source):
+    if os.path.isdir(source):
+        # The ingest state file is rewritten by every ingest run
+        return dataset_version(os.path.join(source, "_ingest_state.json"))
+    return dataset_version(source)
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)  # Dataset discovery (file listing, schema) once per version.
+def _open_dataset(source, version):
+    if os.path.isdir(source):
+        return ds.dataset(source, format="parquet", partitioning="hive")
+    return ds.dataset(source, format="parquet")
+
+
+def open_dataset(source=None):
+    source = source or scan_source()
+    return _open_dataset(source, source_version(source))
+
+
+def filter_expression(filters, partitioned=False):
+    # pyarrow expression of a frozen filter state (see filters.py / data_table.py)
+    expression = None
+    for column, values in filters:
+        if column in DATE_COLUMNS:
+            start, end = pd.Timestamp(values[0]), pd.Timestamp(values[1]) + pd.Timedelta(days=1)
+            condition = (ds.field(column) >= pa.scalar(start, pa.timestamp("ns"))) & (ds.field(column) < pa.scalar(end, pa.timestamp("ns")))
+            if partitioned and column == "Close Date":  # Partition pruning
+                condition &= (ds.field(PARTITION_COLUMN) >= start.strftime("%Y-%m")) & (ds.field(PARTITION_COLUMN) <= values[1][:7])
+        else:
+            condition = ds.field(column).isin(list(values))
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def scanner(columns, filters=(), source=None):
+    source = source or scan_source()
+    dataset = open_dataset(source)
+    expression = filter_expression(filters, partitioned=os.path.isdir(source))
+    return dataset.scanner(columns=list(columns), filter=expression, batch_size=SCAN_BATCH_ROWS)
+
+
+def scan_batches(columns, filters=(), source=None):
+    # Typed pandas frames of the selected rows, one record batch at a time
+    for batch in scanner(columns, filters, source).to_batches():
+        if batch.num_rows:
+            yield apply_schema(batch.to_pandas())
+
+
+def scan_rows(columns, filters=(), source=None):
+    # Selected rows of a few columns only (projection + predicate pushdown)
+    frame = scanner(columns, filters, source).to_table().to_pandas()
+    return apply_schema(frame)
+
+
+def empty_frame(columns, source=None):
+    # Typed frame with the columns and no rows (e.g. when the filters select nothing)
+    table = open_dataset(source).schema.empty_table().select(list(columns))
+    return apply_schema(table.to_pandas())
+
+
+def count_rows(filters=(), source=None):
+    source = source or scan_source()
+    return open_dataset(source).count_rows(filter=filter_expression(filters, partitioned=os.path.isdir(source)))
+
+
+def scan_page(filters, sort_by, ascending, page, page_size, source=None):
+    # (rows of one page, total): only the sort column is read to order the selected rows
+    order = scan_order(filters, sort_by, ascending, source)
+    positions = order[page * page_size:(page + 1) * page_size]
+    rows = scanner(list(SCHEMA), filters, source).take(pa.array(positions, pa.int64())).to_pandas()
+    return apply_schema(rows).set_index(pd.Index(positions)), len(order)
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _scan_order(source, version, filters, sort_by, ascending):
+    if not sort_by:
+        return np.arange(count_rows(filters, source))
+    column = scan_rows([sort_by], filters, source)[sort_by]
+    return column.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+
+
+def scan_order(filters, sort_by, ascending, source=None):
+    # Positions (within the selected rows) in display order
+    source = source or scan_source()
+    return _scan_order(source, source_version(source), filters, sort_by, ascending)
+
+
+class DatasetSummary:
+    # Categories and date bounds of the filter columns, collected in one streaming pass
+    # (same interface as FilterIndex for the sidebar widgets)
+
+    def __init__(self, batches, category_columns, date_columns):
+        categories = {column: set() for column in category_columns}
+        bounds = {column: [] for column in date_columns}
+        self.n_rows = 0
+        for batch in batches:
+            self.n_rows += len(batch)
+            for column in category_columns:
+                categories[column].update(batch[column].dropna().unique())
+            for column in date_columns:
+                bounds[column] += [batch[column].min(), batch[column].max()]
+        self.categories = {column: sorted(values) for column, values in categories.items()}
+        self.bounds = {column: (min(dates).date(), max(dates).date()) for column, dates in bounds.items()}
+
+    def date_bounds(self, column):
+        return self.bounds[column]
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _build_summary(source, version, category_columns, date_columns):
+    columns = list(category_columns) + list(date_columns)
+    return DatasetSummary(scan_batches(columns, (), source), category_columns, date_columns)
+
+
+def get_summary(category_columns, date_columns=(), source=None):
+    source = source or scan_source()
+    return _build_summary(source, source_version(source), tuple(category_columns), tuple(date_columns))
+
+
+if __name__ == "__main__":
+    # This will execute when the script is run directly
+    print("Source:", scan_source())
+    print("Rows:", count_rows())
+    print("Closed Won rows:", count_rows((("Stage", ("Closed Won",)),)))
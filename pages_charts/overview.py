@@ -1,20 +1,31 @@
 import plotly.express as px
 import pandas as pd
-import os
-from pages_charts.charts_config import elegant_colors, colors_won_vs_lost, data
-print("Current working directory:", os.getcwd())
+from pages_charts.charts_config import elegant_colors, colors_won_vs_lost, profile_labels
+from pages_charts.profile_engine import get_profile
 
-fig_dist_won_lost = px.histogram(data, 
-                  x='Stage',
-                  title='Distribution of Won vs Lost Opportunities',
-                  color='Stage',
-                  text_auto=True,
-                  color_discrete_sequence=["red", "blue"]
-                  )  # Mostra os valores em cima das barras
 
-fig_dist_won_lost.update_traces(textposition='outside')
+def build_fig_dist_won_lost(profile):
+    # Stage totals from the profile engine
+    fig = px.bar(profile["All"],
+                 x='Stage',
+                 y='count',
+                 labels=profile_labels,
+                 title='Distribution of Won vs Lost Opportunities',
+                 color='Stage',
+                 text_auto=True,
+                 color_discrete_sequence=["red", "blue"]
+                 )  # Mostra os valores em cima das barras
+
+    fig.update_traces(textposition='outside')
+    return fig
+
+
+# Builders of every chart of the Home page (name of the chart artifact -> builder)
+OVERVIEW_BUILDERS = {
+    "fig_dist_won_lost": build_fig_dist_won_lost,
+}
 
 if __name__ == "__main__":
     # This will execute when the script is run directly
-    
-    print(data.head())  # You can replace this with other code you need to execute
+
+    print(get_profile()["All"])  # You can replace this with other code you need to execute
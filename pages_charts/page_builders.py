@@ -0,0 +1,80 @@
+import importlib
+import streamlit as st
+from pages_charts.data_loader import DATA_PATH
+from pages_charts.filters import data_version
+from pages_charts.aggregate_cube import get_cube
+from pages_charts.profile_engine import get_profile
+from pages_charts.calendar_rollup import GRANULARITIES, get_period_view
+from pages_charts.instrumentation import cache_lookup, cache_miss, span
+
+# ------------- Page Figures from the Builders ----------
+# When the sidebar filters are active, the figures of a page are rebuilt from the
+# selected rows instead of being read from the chart artifacts. "profile" builders
+# take the profile engine tables, "cube" builders (box plots) take the aggregate cube
+# of the selected rows: no builder reads rows.
+# The Time Analysis charts of the Profile page can also be shown per week, month,
+# quarter or year: those are built from the calendar rollup views.
+# The builder modules (and plotly.express) are imported on the first rebuild only.
+
+PAGE_BUILDERS = {
+    "Home | Overview": ("profile", "pages_charts.overview", "OVERVIEW_BUILDERS"),
+    "Profile | WON vs. LOST": ("profile", "pages_charts.profile_wl", "PROFILE_BUILDERS"),
+    "Average Ticket Analysis": ("cube", "pages_charts.average_ticket", "AVERAGE_TICKET_BUILDERS"),
+    "Average Time to Close": ("cube", "pages_charts.average_time", "AVERAGE_TIME_BUILDERS"),
+}
+
+
+def page_builders(page):
+    # (input kind, {artifact name: builder}) of a page
+    if page not in PAGE_BUILDERS:
+        return None, {}
+    kind, module_name, attribute = PAGE_BUILDERS[page]
+    return kind, getattr(importlib.import_module(module_name), attribute)
+
+
+def builder_input(kind, filters=(), path=DATA_PATH):
+    # Input of a "profile" or "cube" builder for a frozen filter state
+    if kind == "profile":
+        return get_profile(path, filters)
+    if kind == "cube":
+        return get_cube(path, filters)
+    raise ValueError(f"Unknown builder input: {kind!r}")
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)  # Per page and filter state, shared by every session.
+def _build_page_figures(path, version, page, filters):
+    cache_miss()
+    kind, builders = page_builders(page)
+    if not builders:
+        return {}
+    source = builder_input(kind, filters, path)
+    figures = {}
+    for name, build in builders.items():
+        with span("figure_build", figure=name):
+            figures[name] = build(source)
+    return figures
+
+
+def build_page_figures(page, filters, path=DATA_PATH):
+    with cache_lookup("page_figures", page=page):
+        return _build_page_figures(path, data_version(path), page, filters)
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)  # Per granularity and filter state, shared by every session.
+def _build_period_figures(path, version, granularity, filters):
+    cache_miss()
+    from pages_charts.profile_wl import period_count_bars, period_value_bars
+    dimension = GRANULARITIES[granularity][0]
+    with span("period_view", granularity=granularity):
+        tables = {dimension: get_period_view(granularity, path, filters)}
+    return {
+        "fig_wl_period": period_count_bars(tables, dimension),
+        "fig_wl_period_pct": period_count_bars(tables, dimension, pct=True),
+        "fig_period_value": period_value_bars(tables, dimension),
+        "fig_period_value_pct": period_value_bars(tables, dimension, pct=True),
+    }
+
+
+def build_period_figures(granularity, filters=(), path=DATA_PATH):
+    with cache_lookup("period_figures", granularity=granularity):
+        return _build_period_figures(path, data_version(path), granularity, filters)
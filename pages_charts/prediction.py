@@ -0,0 +1,83 @@
+import io
+import os
+import time
+import pandas as pd
+import streamlit as st
+from pages_charts.data_loader import dataset_version
+from pages_charts.instrumentation import span
+from pages_charts.stage_model import CLASSES, INPUT_COLUMNS, MODEL_PATH, get_model
+
+# ------------- Prediction Page ----------
+# Batch scoring of an uploaded file of open opportunities with the stage model
+# (see stage_model.py). The model is loaded once per process; an uploaded file is
+# read and scored once per (file, scoring date, model version) and the scored rows
+# are kept for the reruns of the session (sorting, download).
+
+UPLOAD_TYPES = ["csv", "parquet"]
+
+PROBABILITY_COLUMN = f"P({CLASSES[1]})"
+
+
+def read_upload(content, name):
+    if name.lower().endswith(".parquet"):
+        return pd.read_parquet(io.BytesIO(content))
+    return pd.read_csv(io.BytesIO(content))
+
+
+@st.cache_data(show_spinner=False, max_entries=8)  # Per uploaded file, scoring date and model version.
+def _score_upload(file_id, name, as_of, model_version, _content):
+    data = read_upload(_content, name)
+    start = time.perf_counter()
+    scored = get_model().score(data, as_of)
+    seconds = time.perf_counter() - start
+    return scored, scored.to_csv(index=False).encode(), seconds
+
+
+def render_prediction_page(key="prediction"):
+    if not os.path.exists(MODEL_PATH):
+        st.warning("The stage model is not trained yet: run `python -m pages_charts.stage_model`.")
+        return
+    model = get_model()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Trained on", f"{model.metadata.get('trained_rows', 0):,} closed opportunities")
+    # Batch training: held-out rows; incremental training: new rows scored before being learned
+    quality, label = (model.metadata["holdout"], "Holdout") if "holdout" in model.metadata else (model.metadata.get("prequential"), "New data")
+    if quality:
+        col2.metric(f"{label} accuracy", f"{quality['accuracy']:.1%}", help=f"{quality['rows']:,} weekly snapshots of open opportunities")
+        col3.metric(f"{label} AUC", f"{quality['auc']:.3f}")
+
+    with st.expander("Expected file"):
+        st.markdown(
+            "A CSV or parquet file with one open opportunity per row and the columns "
+            + ", ".join(f"`{column.strip()}`" for column in INPUT_COLUMNS)
+            + ". Other columns are kept in the output. The age of each opportunity is counted"
+            " from its Created Date to the scoring date; unknown categories and missing values are accepted."
+        )
+
+    as_of = st.date_input("Scoring date", value=pd.Timestamp.today().date(), key=f"{key}_as_of")
+    upload = st.file_uploader("Opportunities to score", type=UPLOAD_TYPES, key=f"{key}_upload")
+    if upload is None:
+        return
+
+    with span("score_upload", file=upload.name):
+        try:
+            scored, csv, seconds = _score_upload(upload.file_id, upload.name, str(as_of), dataset_version(MODEL_PATH), upload.getvalue())
+        except ValueError as error:  # Missing columns / unreadable file
+            st.error(f"{upload.name}: {error}")
+            return
+
+    won = int((scored["Predicted Stage"] == CLASSES[1]).sum())
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Opportunities scored", f"{len(scored):,}", help=f"Scored in {seconds * 1000:.0f} ms")
+    col2.metric("Predicted won", f"{won:,} ({won / max(len(scored), 1):.1%})")
+    col3.metric(f"Mean {PROBABILITY_COLUMN}", f"{scored[PROBABILITY_COLUMN].mean():.1%}" if len(scored) else "—")
+
+    st.dataframe(
+        scored,
+        use_container_width=True,
+        column_config={
+            column: st.column_config.ProgressColumn(column, min_value=0.0, max_value=1.0, format="%.3f")
+            for column in (PROBABILITY_COLUMN, f"P({CLASSES[0]})")
+        },
+    )
+    st.download_button("Download the scored file (CSV)", csv, file_name=f"{os.path.splitext(upload.name)[0]}_scored.csv", mime="text/csv", key=f"{key}_download")
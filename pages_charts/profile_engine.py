@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from pages_charts.data_loader import DATA_PATH, OUT_OF_CORE, dataset_version
+from pages_charts.filters import filtered_data
+from pages_charts import out_of_core
+from pages_charts.instrumentation import cache_lookup, cache_miss
+
+# ------------- Won/Lost Profile Engine ----------
+# Counts, within-group percentages and EUR sums of Stage against every profile
+# dimension, computed with np.bincount on integer-coded columns (one pass over the
+# rows per dimension). The chart builders of profile_wl.py consume these small
+# tables instead of the raw rows.
+
+STAGE_COLUMN = "Stage"
+
+VALUE_COLUMN = " Opp Value (EUR)"
+
+CLOSED_STAGES = ["Closed Lost", "Closed Won"]
+
+PROFILE_DIMENSIONS = [
+    "All",
+    " Account Type",
+    "Country",
+    "Segment",
+    "Type",
+    "Lead Source",
+    "Close Reason",
+    "Close Month",
+    "Close Quarter",
+]
+
+
+def _encode(series):
+    # (integer codes with -1 for missing, labels) of a column
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories
+    codes, labels = pd.factorize(series, sort=True)
+    return codes, pd.Index(labels)
+
+
+def _encode_period(dates, freq):
+    # Close Date -> month / quarter codes; labels are period-end dates (like pd.Grouper(freq="ME"/"QE"))
+    year = dates.dt.year.to_numpy()
+    if freq == "month":
+        period = year * 12 + dates.dt.month.to_numpy() - 1
+        per_year, offset = 12, pd.offsets.MonthEnd(0)
+    else:
+        period = year * 4 + dates.dt.quarter.to_numpy() - 1
+        per_year, offset = 4, pd.offsets.QuarterEnd(0)
+    valid = ~np.isnan(period)
+    if not valid.any():
+        return np.full(len(dates), -1), pd.DatetimeIndex([])
+    start = int(np.nanmin(period))
+    codes = np.where(valid, period - start, -1).astype(np.int64)
+    months_per_period = 12 // per_year
+    labels = [
+        pd.Timestamp(year=(start + i) // per_year, month=((start + i) % per_year) * months_per_period + 1, day=1) + offset
+        for i in range(int(np.nanmax(period)) - start + 1)
+    ]
+    return codes, pd.DatetimeIndex(labels)
+
+
+def _dimension_codes(data, dimension):
+    if dimension == "All":  # Stage totals
+        return np.zeros(len(data), dtype=np.int64), pd.Index(["All"])
+    if dimension == "Close Month":
+        return _encode_period(data["Close Date"], "month")
+    if dimension == "Close Quarter":
+        return _encode_period(data["Close Date"], "quarter")
+    return _encode(data[dimension])
+
+
+def profile_table(dimension_codes, dimension_labels, stage_codes, stage_labels, values, dimension):
+    # Stage x dimension table (count, EUR sum and percentages) from integer codes
+    n_stages = len(stage_labels)
+    n_cells = len(dimension_labels) * n_stages
+    valid = (dimension_codes >= 0) & (stage_codes >= 0)
+    cell = dimension_codes[valid] * n_stages + stage_codes[valid]
+
+    counts = np.bincount(cell, minlength=n_cells).reshape(len(dimension_labels), n_stages)
+    eur = np.bincount(cell, weights=values[valid], minlength=n_cells).reshape(len(dimension_labels), n_stages)
+    return table_from_counts(counts, eur, dimension_labels, stage_labels, dimension)
+
+
+def table_from_counts(counts, eur, dimension_labels, stage_labels, dimension):
+    # Long table of the observed cells with the within-dimension and within-stage shares
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pct_dim = counts / counts.sum(axis=1, keepdims=True) * 100
+        pct_stage = counts / counts.sum(axis=0, keepdims=True) * 100
+        eur_pct_dim = eur / eur.sum(axis=1, keepdims=True) * 100
+        eur_pct_stage = eur / eur.sum(axis=0, keepdims=True) * 100
+
+    dim_index, stage_index = np.nonzero(counts)  # Only observed combinations (like observed=True)
+    return pd.DataFrame({
+        dimension: np.asarray(dimension_labels)[dim_index],
+        STAGE_COLUMN: np.asarray(stage_labels)[stage_index],
+        "count": counts[dim_index, stage_index],
+        "eur": eur[dim_index, stage_index],
+        "pct_within_dimension": pct_dim[dim_index, stage_index],
+        "pct_within_stage": pct_stage[dim_index, stage_index],
+        "eur_pct_within_dimension": eur_pct_dim[dim_index, stage_index],
+        "eur_pct_within_stage": eur_pct_stage[dim_index, stage_index],
+    })
+
+
+# Row columns read by build_profile()
+PROFILE_COLUMNS = [STAGE_COLUMN, VALUE_COLUMN, "Close Date"] + [d for d in PROFILE_DIMENSIONS if d not in ("All", "Close Month", "Close Quarter")]
+
+
+def build_profile(data, dimensions=PROFILE_DIMENSIONS):
+    # {dimension: table} for Stage against every profile dimension
+    stage_codes, stage_labels = _encode(data[STAGE_COLUMN])
+    # The time analysis only considers closed deals (Closed Won and Closed Lost)
+    closed = data[STAGE_COLUMN].isin(CLOSED_STAGES).to_numpy()
+    closed_stage_codes = np.where(closed, stage_codes, -1)
+    values = np.nan_to_num(data[VALUE_COLUMN].to_numpy(dtype="float64"))
+
+    profile = {}
+    for dimension in dimensions:
+        codes, labels = _dimension_codes(data, dimension)
+        stages = closed_stage_codes if dimension in ("Close Month", "Close Quarter") else stage_codes
+        profile[dimension] = profile_table(codes, labels, stages, stage_labels, values, dimension)
+    return profile
+
+
+def merge_profiles(profiles):
+    # Adds up the counts and EUR sums of partial profiles (e.g. one per record batch)
+    merged = {}
+    for dimension in profiles[0]:
+        cells = pd.concat([profile[dimension] for profile in profiles], ignore_index=True)
+        cells = cells.groupby([dimension, STAGE_COLUMN], sort=True)[["count", "eur"]].sum()
+        counts = cells["count"].unstack(fill_value=0)
+        eur = cells["eur"].unstack(fill_value=0.0)
+        merged[dimension] = table_from_counts(counts.to_numpy(), eur.to_numpy(), counts.index, counts.columns, dimension)
+    return merged
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)  # Built once per dataset version and filter state, shared by every session.
+def _build_cached(path, version, filters):
+    cache_miss()
+    return build_profile(filtered_data(filters, path))
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _scan_cached(source, version, filters):
+    # Out-of-core: one partial profile per record batch of the selected rows
+    cache_miss()
+    partials = [build_profile(batch) for batch in out_of_core.scan_batches(PROFILE_COLUMNS, filters, source)]
+    return merge_profiles(partials) if partials else build_profile(out_of_core.empty_frame(PROFILE_COLUMNS, source))
+
+
+def get_profile(path=DATA_PATH, filters=()):
+    # Profile tables of the rows selected by a frozen filter state (see filters.py)
+    with cache_lookup("profile", filters=len(filters)):
+        if OUT_OF_CORE:
+            source = out_of_core.scan_source()
+            return _scan_cached(source, out_of_core.source_version(source), filters)
+        return _build_cached(path, dataset_version(path), filters)
+
+
+if __name__ == "__main__":
+    # This will execute when the script is run directly
+    for dimension, table in get_profile().items():
+        print(table.head(), "\n")
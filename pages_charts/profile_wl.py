@@ -1,92 +1,113 @@
 import plotly.express as px
 import pandas as pd
-from pages_charts.charts_config import elegant_colors, colors_won_vs_lost, data
+from pages_charts.charts_config import elegant_colors, colors_won_vs_lost, profile_labels
+from pages_charts.profile_engine import get_profile
 
 # ======= Won vs. Lost Profile Analysis Charts ============
+# Every chart is built from the small Stage x dimension tables of the profile
+# engine (counts, percentages and EUR sums), never from the raw rows.
 
 ### -----------  Account Type --------------
-fig_wl_acc_type_count = px.histogram(data, 
-                  x=' Account Type',
-                  color='Stage',
-                  title='Distribution of Won vs Lost Opportunities by Account Type',
-                  barmode='group',    # Para agrupar as barras lado a lado
-                  text_auto=True,
-                  color_discrete_sequence=colors_won_vs_lost
-                  )     # Mostra os valores em cima das barras
-
-fig_wl_acc_type_count.update_traces(textposition='outside')
-fig_wl_acc_type_count.update_layout(
-    width=1200,
-    height=700,
-    xaxis_title="Account Type",
-    yaxis_title="Count",
-    legend_title="Stage"
-)
-
-fig_wl_acc_type_pct = px.histogram(data, 
-                  x=' Account Type',
-                  color='Stage',
-                  title='Distribution of Won vs Lost Opportunities by Account Type',
-                  barmode='group',    # Para agrupar as barras lado a lado
-                  text_auto=True,
-                  color_discrete_sequence=colors_won_vs_lost
-                  )     # Mostra os valores em cima das barras
-
-fig_wl_acc_type_pct.update_traces(textposition='outside')
-fig_wl_acc_type_pct.update_layout(
-    width=1200,
-    height=700,
-    xaxis_title="Account Type (%)",
-    yaxis_title="Count",
-    legend_title="Stage"
-)
+def build_fig_wl_acc_type_count(profile):
+    table = profile[" Account Type"]
+    fig = px.bar(table,
+                 x=' Account Type',
+                 y='count',
+                 labels=profile_labels,
+                 color='Stage',
+                 title='Distribution of Won vs Lost Opportunities by Account Type',
+                 barmode='group',    # Para agrupar as barras lado a lado
+                 text_auto=True,
+                 color_discrete_sequence=colors_won_vs_lost
+                 )     # Mostra os valores em cima das barras
+
+    fig.update_traces(textposition='outside')
+    fig.update_layout(
+        width=1200,
+        height=700,
+        xaxis_title="Account Type",
+        yaxis_title="Count",
+        legend_title="Stage"
+    )
+    return fig
+
+
+def build_fig_wl_acc_type_pct(profile):
+    table = profile[" Account Type"]
+    fig = px.bar(table,
+                 x=' Account Type',
+                 y='pct_within_dimension',
+                 labels=profile_labels,
+                 color='Stage',
+                 title='Percentage of Won vs Lost Opportunities by Account Type',
+                 barmode='group',    # Para agrupar as barras lado a lado
+                 text_auto='.2f',
+                 color_discrete_sequence=colors_won_vs_lost
+                 )     # Mostra os valores em cima das barras
+
+    fig.update_traces(textposition='outside')
+    fig.update_layout(
+        width=1200,
+        height=700,
+        xaxis_title="Account Type",
+        yaxis_title="Percentage (%)",
+        legend_title="Stage"
+    )
+    return fig
 
 
 ### -----------  Country --------------
 
-fig_wl_country = px.histogram(data, 
-                  x='Country',
-                  color='Stage',
-                  title='Distribution of Won vs Lost Opportunities by Country',
-                  barmode='group',    # Para agrupar as barras lado a lado
-                  text_auto=True,
-                  color_discrete_sequence=colors_won_vs_lost
-                  )     # Mostra os valores em cima das barras
-
-fig_wl_country.update_traces(textposition='outside')
-fig_wl_country.update_layout(
-    width=1200,
-    height=700,
-    xaxis_title="Country",
-    yaxis_title="Count",
-    legend_title="Stage"
-)
-
-# Count occurrences of each stage per country
-data_grouped = data.groupby(['Country', 'Stage']).size().reset_index(name='count')
-
-# Calculate proportions
-data_grouped['percentage'] = data_grouped.groupby('Country')['count'].transform(lambda x: x / x.sum() * 100)
-
-# Create stacked bar chart for proportions
-fig_wl_country_pct = px.bar(data_grouped, 
-             x='Country', 
-             y='percentage', 
-             color='Stage', 
-             title='Proportion of Won vs Lost Opportunities by Country',
-             text_auto='.2f',  # Show percentage labels
-             color_discrete_sequence=colors_won_vs_lost,
-             barmode='stack')  # Stack bars to represent proportions
-
-# Update layout for better readability
-fig_wl_country_pct.update_layout(
-    width=1200,
-    height=700,
-    xaxis_title="Country",
-    yaxis_title="Percentage (%)",
-    legend_title="Stage",
-    yaxis=dict(tickformat=".1f")  # Format y-axis as percentage
-)
+def build_fig_wl_country(profile):
+    table = profile["Country"]
+    fig = px.bar(table,
+                 x='Country',
+                 y='count',
+                 labels=profile_labels,
+                 color='Stage',
+                 title='Distribution of Won vs Lost Opportunities by Country',
+                 barmode='group',    # Para agrupar as barras lado a lado
+                 text_auto=True,
+                 color_discrete_sequence=colors_won_vs_lost
+                 )     # Mostra os valores em cima das barras
+
+    fig.update_traces(textposition='outside')
+    fig.update_layout(
+        width=1200,
+        height=700,
+        xaxis_title="Country",
+        yaxis_title="Count",
+        legend_title="Stage"
+    )
+    return fig
+
+
+def build_fig_wl_country_pct(profile):
+    # Proportion of each stage within each country
+    table = profile["Country"]
+
+    # Create stacked bar chart for proportions
+    fig = px.bar(table,
+                 x='Country',
+                 y='pct_within_dimension',
+                 labels=profile_labels,
+                 color='Stage',
+                 title='Proportion of Won vs Lost Opportunities by Country',
+                 text_auto='.2f',  # Show percentage labels
+                 color_discrete_sequence=colors_won_vs_lost,
+                 barmode='stack')  # Stack bars to represent proportions
+
+    # Update layout for better readability
+    fig.update_layout(
+        width=1200,
+        height=700,
+        xaxis_title="Country",
+        yaxis_title="Percentage (%)",
+        legend_title="Stage",
+        yaxis=dict(tickformat=".1f")  # Format y-axis as percentage
+    )
+    return fig
+
 
 ### -----------  Segment --------------
 
@@ -95,133 +116,285 @@ fig_wl_country_pct.update_layout(
 segment_order = ["Segment 1", "Segment 2", "Segment 3", "Segment 4", "Unknow"]
 stage_order = ["Closed Lost", "Closed Won"]  # Ensure Lost is before Won
 
-# Histogram for absolute count
-fig_wl_segment = px.histogram(data, 
-                  x='Stage',
-                  color='Segment',
-                  title='Distribution of Won vs Lost Opportunities by Segment',
-                  barmode='group',    
-                  color_discrete_sequence=elegant_colors,
-                  text_auto=True,
-                  category_orders={"Segment": segment_order, "Stage": stage_order}  # Enforce segment and stage order
-                  )     
-
-fig_wl_segment.update_traces(textposition='outside')
-fig_wl_segment.update_layout(
-    width=1200,
-    height=700,
-    xaxis_title="Stage",
-    yaxis_title="Count",
-    legend_title="Segment"
-)
-
-# -------------------- #
-# Calculate the percentage of each segment within each stage
-data_percentage = data.groupby(['Stage', 'Segment']).size().reset_index(name='count')
-
-# Normalize to percentage
-data_percentage['percentage'] = data_percentage.groupby('Stage')['count'].transform(lambda x: x / x.sum() * 100)
-
-# Histogram for proportion (percentage)
-fig_wl_segment_pct = px.bar(data_percentage, 
-             x='Stage', 
-             y='percentage', 
-             color='Segment', 
-             title='Proportion of Won vs Lost Opportunities by Segment',
-             text_auto='.2f',  
-             barmode='stack',  
-             color_discrete_sequence=elegant_colors,  
-             category_orders={"Segment": segment_order, "Stage": stage_order}  # Enforce segment and stage order
-             )
-
-fig_wl_segment_pct.update_traces(textposition='inside')
-fig_wl_segment_pct.update_layout(
-    width=1200,
-    height=700,
-    xaxis_title="Stage",
-    yaxis_title="Percentage",
-    legend_title="Segment",
-    yaxis=dict(tickformat=".1f%")  
-)
+
+def build_fig_wl_segment(profile):
+    # Bars for absolute count
+    table = profile["Segment"]
+    fig = px.bar(table,
+                 x='Stage',
+                 y='count',
+                 labels=profile_labels,
+                 color='Segment',
+                 title='Distribution of Won vs Lost Opportunities by Segment',
+                 barmode='group',
+                 color_discrete_sequence=elegant_colors,
+                 text_auto=True,
+                 category_orders={"Segment": segment_order, "Stage": stage_order}  # Enforce segment and stage order
+                 )
+
+    fig.update_traces(textposition='outside')
+    fig.update_layout(
+        width=1200,
+        height=700,
+        xaxis_title="Stage",
+        yaxis_title="Count",
+        legend_title="Segment"
+    )
+    return fig
+
+
+def build_fig_wl_segment_pct(profile):
+    # Percentage of each segment within each stage
+    table = profile["Segment"]
+
+    fig = px.bar(table,
+                 x='Stage',
+                 y='pct_within_stage',
+                 labels=profile_labels,
+                 color='Segment',
+                 title='Proportion of Won vs Lost Opportunities by Segment',
+                 text_auto='.2f',
+                 barmode='stack',
+                 color_discrete_sequence=elegant_colors,
+                 category_orders={"Segment": segment_order, "Stage": stage_order}  # Enforce segment and stage order
+                 )
+
+    fig.update_traces(textposition='inside')
+    fig.update_layout(
+        width=1200,
+        height=700,
+        xaxis_title="Stage",
+        yaxis_title="Percentage",
+        legend_title="Segment",
+        yaxis=dict(tickformat=".1f%")
+    )
+    return fig
 
 
 ### -----------  Time Analysis --------------
+# Only closed deals (Closed Won and Closed Lost) are counted by the engine. The
+# period charts take any period table of the profile layout: the Close Month /
+# Close Quarter tables of the profile, or the calendar rollup views (Profile page
+# granularity selector, see calendar_rollup.py).
+
+# Period dimension -> (title adjective, axis label)
+PERIOD_NAMES = {
+    "Close Day": ("Daily", "Day"),
+    "Close Week": ("Weekly", "Week"),
+    "Close Month": ("Monthly", "Month"),
+    "Close Quarter": ("Quarterly", "Quarter"),
+    "Close Year": ("Yearly", "Year"),
+}
+
+
+def _period_table(profile, dimension):
+    return profile[dimension].rename(columns={
+        dimension: 'Close Date',
+        'count': 'Count',
+        'pct_within_dimension': 'Percentage',
+    })
+
+
+def period_count_bars(profile, dimension, pct=False):
+    # Stacked WON vs. LOST deal counts (or shares) per period
+    adjective, period = PERIOD_NAMES[dimension]
+    fig = px.bar(
+        _period_table(profile, dimension),
+        x='Close Date',
+        y='Percentage' if pct else 'Count',
+        color='Stage',
+        title=f"{adjective} Proportional Comparison of WON vs. LOST Deals ({'Percentage' if pct else 'Counts'})",
+        labels={'Close Date': period, 'Count': 'Number of Deals', 'Percentage': 'Percentage (%)'},
+        barmode='stack',
+        color_discrete_sequence=["red", "blue"],
+        text_auto='.1f' if pct else True
+    )
+    fig.update_layout(width=1200, height=600)
+    return fig
+
+
+def build_fig_wl_month(profile):
+    return period_count_bars(profile, "Close Month")
+
+
+def build_fig_wl_month_pct(profile):
+    return period_count_bars(profile, "Close Month", pct=True)
+
+
+def build_fig_wl_quarter(profile):
+    return period_count_bars(profile, "Close Quarter")
+
+
+def build_fig_wl_quarter_pct(profile):
+    return period_count_bars(profile, "Close Quarter", pct=True)
+
+
+### -----------  Time Analysis in EUR (€) --------------
+
+def _period_value_table(profile, dimension):
+    # Sums of float32 values: rounded to the 3 decimals of the data for the bar labels
+    return profile[dimension].round({'eur': 3}).rename(columns={
+        dimension: 'Close Date',
+        'eur': 'Total Deal Value (EUR)',
+        'eur_pct_within_dimension': 'Percentage (%)',
+    })
+
+
+def period_value_bars(profile, dimension, pct=False):
+    # Stacked WON vs. LOST deal value (or value shares) per period
+    adjective, period = PERIOD_NAMES[dimension]
+    fig = px.bar(
+        _period_value_table(profile, dimension),
+        x='Close Date',
+        y='Percentage (%)' if pct else 'Total Deal Value (EUR)',
+        color='Stage',
+        title=f"{adjective} Proportional Comparison of WON vs. LOST Deals ({'Percentage' if pct else 'Total Value'})",
+        labels={'Close Date': period},
+        barmode='stack',
+        color_discrete_sequence=colors_won_vs_lost,
+        text_auto='.1f' if pct else True
+    )
+    fig.update_layout(width=1200, height=600)
+    return fig
+
+
+def build_fig_month_value(profile):
+    return period_value_bars(profile, "Close Month")
+
+
+def build_fig_month_value_pct(profile):
+    return period_value_bars(profile, "Close Month", pct=True)
+
+
+def build_fig_quarter_value(profile):
+    return period_value_bars(profile, "Close Quarter")
+
+
+def build_fig_quarter_value_pct(profile):
+    return period_value_bars(profile, "Close Quarter", pct=True)
+
+
+### -----------  Won / Lost by Account Type (Pies) --------------
+
+def _stage_pie(profile, stage, title):
+    table = profile[" Account Type"]
+    fig = px.pie(table[table['Stage'] == stage],
+                 names=' Account Type',
+                 values='count',
+                 title=title,
+                 hole=0.4,
+                 labels=profile_labels,
+                 color_discrete_sequence=elegant_colors)
+    fig.update_traces(textinfo='percent+label')
+    fig.update_layout(width=800, height=600)
+    return fig
+
+
+def build_fig_won_wl_acc_type_pct(profile):
+    return _stage_pie(profile, "Closed Won", "Distribution of WON Opportunities by Account Type")
+
+
+def build_fig_lost_wl_acc_type_pct(profile):
+    return _stage_pie(profile, "Closed Lost", "Distribution of LOST Opportunities by Account Type")
+
+
+### -----------  Close Reason / Type of Business / Lead Source --------------
+# Same two charts for each dimension: counts per Stage (grouped bars) and the
+# share of each category within the Stage.
+
+def _stage_count_bars(profile, dimension, title):
+    fig = px.bar(profile[dimension],
+                 x='Stage',
+                 y='count',
+                 labels=profile_labels,
+                 color=dimension,
+                 title=title,
+                 barmode='group',
+                 text_auto=True,
+                 category_orders={"Stage": stage_order})
+    fig.update_traces(textposition='outside')
+    fig.update_layout(
+        width=1200,
+        height=700,
+        xaxis_title="Stage",
+        yaxis_title="Count",
+        legend_title=dimension
+    )
+    return fig
+
+
+def _stage_share_bars(profile, dimension, title, barmode):
+    fig = px.bar(profile[dimension],
+                 x='Stage',
+                 y='pct_within_stage',
+                 labels=profile_labels,
+                 color=dimension,
+                 title=title,
+                 barmode=barmode,
+                 text_auto='.2f',
+                 category_orders={"Stage": stage_order})
+    fig.update_layout(
+        width=1200,
+        height=700,
+        xaxis_title="Stage",
+        yaxis_title="Percentage (%)",
+        legend_title=dimension,
+        yaxis=dict(tickformat=".1f")
+    )
+    return fig
+
+
+def build_fig_wl_close_reason_count(profile):
+    return _stage_count_bars(profile, "Close Reason", "Distribution of Won vs Lost Opportunities by Close Reason")
+
+
+def build_fig_wl_close_reason_pct(profile):
+    return _stage_share_bars(profile, "Close Reason", "Distribution of Close Reasons Within Won vs Lost Opportunities (%)", "group")
+
+
+def build_fig_wl_type_business_count(profile):
+    return _stage_count_bars(profile, "Type", "Distribution of Opportunity Types in Won vs Lost")
+
+
+def build_fig_wl_type_business_pct(profile):
+    return _stage_share_bars(profile, "Type", "Proportion of Opportunity Types in Won vs Lost", "stack")
+
 
-# Filter data to include only closed deals (Closed Won and Closed Lost)
-closed_data = data[data["Stage"].isin(["Closed Won", "Closed Lost"])].copy()
-
-# ---------------------------
-# Monthly Aggregation
-# ---------------------------
-# Aggregate by month and stage (counts)
-monthly = closed_data.groupby([pd.Grouper(key='Close Date', freq='M'), 'Stage']).size().reset_index(name='Count')
-# Calculate percentage per month
-monthly['Percentage'] = monthly.groupby('Close Date')['Count'].transform(lambda x: x / x.sum() * 100)
-
-# Create monthly count plot (stacked bar)
-fig_wl_month = px.bar(
-    monthly, 
-    x='Close Date', 
-    y='Count', 
-    color='Stage',
-    title="Monthly Proportional Comparison of WON vs. LOST Deals (Counts)",
-    labels={'Close Date': 'Month', 'Count': 'Number of Deals'},
-    barmode='stack',
-    color_discrete_sequence=["red", "blue"],
-    text_auto=True
-)
-fig_wl_month.update_layout(width=1200, height=600)
-
-# Create monthly percentage plot (stacked bar)
-fig_wl_month_pct = px.bar(
-    monthly, 
-    x='Close Date', 
-    y='Percentage', 
-    color='Stage',
-    title="Monthly Proportional Comparison of WON vs. LOST Deals (Percentage)",
-    labels={'Close Date': 'Month', 'Percentage': 'Percentage (%)'},
-    barmode='stack',
-    color_discrete_sequence=["red", "blue"],
-    text_auto='.1f'
-)
-fig_wl_month_pct.update_layout(width=1200, height=600)
-
-# ---------------------------
-# Quarterly Aggregation
-# ---------------------------
-# Aggregate by quarter and stage (counts)
-quarterly = closed_data.groupby([pd.Grouper(key='Close Date', freq='Q'), 'Stage']).size().reset_index(name='Count')
-# Calculate percentage per quarter
-quarterly['Percentage'] = quarterly.groupby('Close Date')['Count'].transform(lambda x: x / x.sum() * 100)
-
-# Create quarterly count plot (stacked bar)
-fig_wl_quarter = px.bar(
-    quarterly, 
-    x='Close Date', 
-    y='Count', 
-    color='Stage',
-    title="Quarterly Proportional Comparison of WON vs. LOST Deals (Counts)",
-    labels={'Close Date': 'Quarter', 'Count': 'Number of Deals'},
-    barmode='stack',
-    color_discrete_sequence=["red", "blue"],
-    text_auto=True
-)
-fig_wl_quarter.update_layout(width=1200, height=600)
-
-# Create quarterly percentage plot (stacked bar)
-fig_wl_quarter_pct = px.bar(
-    quarterly, 
-    x='Close Date', 
-    y='Percentage', 
-    color='Stage',
-    title="Quarterly Proportional Comparison of WON vs. LOST Deals (Percentage)",
-    labels={'Close Date': 'Quarter', 'Percentage': 'Percentage (%)'},
-    barmode='stack',
-    color_discrete_sequence=["red", "blue"],
-    text_auto='.1f'
-)
-fig_wl_quarter_pct.update_layout(width=1200, height=600)
+def build_fig_wl_lead_source(profile):
+    return _stage_count_bars(profile, "Lead Source", "Distribution of Won vs Lost Opportunities by Lead Source")
+
+
+def build_fig_wl_lead_source_pct(profile):
+    return _stage_share_bars(profile, "Lead Source", "Proportion of Lead Sources in Won vs Lost Opportunities", "stack")
+
+
+# Builders of every chart of the Profile page (name of the chart artifact -> builder)
+PROFILE_BUILDERS = {
+    "fig_wl_close_reason_count": build_fig_wl_close_reason_count,
+    "fig_wl_close_reason_pct": build_fig_wl_close_reason_pct,
+    "fig_wl_acc_type_count": build_fig_wl_acc_type_count,
+    "fig_wl_acc_type_pct": build_fig_wl_acc_type_pct,
+    "fig_won_wl_acc_type_pct": build_fig_won_wl_acc_type_pct,
+    "fig_lost_wl_acc_type_pct": build_fig_lost_wl_acc_type_pct,
+    "fig_wl_country": build_fig_wl_country,
+    "fig_wl_country_pct": build_fig_wl_country_pct,
+    "fig_wl_segment": build_fig_wl_segment,
+    "fig_wl_segment_pct": build_fig_wl_segment_pct,
+    "fig_wl_month": build_fig_wl_month,
+    "fig_wl_quarter": build_fig_wl_quarter,
+    "fig_wl_month_pct": build_fig_wl_month_pct,
+    "fig_wl_quarter_pct": build_fig_wl_quarter_pct,
+    "fig_month_value": build_fig_month_value,
+    "fig_quarter_value": build_fig_quarter_value,
+    "fig_month_value_pct": build_fig_month_value_pct,
+    "fig_quarter_value_pct": build_fig_quarter_value_pct,
+    "fig_wl_type_business_count": build_fig_wl_type_business_count,
+    "fig_wl_type_business_pct": build_fig_wl_type_business_pct,
+    "fig_wl_lead_source": build_fig_wl_lead_source,
+    "fig_wl_lead_source_pct": build_fig_wl_lead_source_pct,
+}
 
 if __name__ == "__main__":
     # This will execute when the script is run directly
-    print(data.head())  # You can replace this with other code you need to execute
+    for dimension, table in get_profile().items():
+        print(table.head())  # You can replace this with other code you need to execute
@@ -0,0 +1,297 @@
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+import pandas as pd
+import pyarrow as pa
+from pages_charts.data_loader import DATA_PATH
+from pages_charts.filters import CATEGORY_FILTERS, DATE_FILTERS, data_version, freeze_filters, get_filter_index
+from pages_charts.profile_engine import PROFILE_DIMENSIONS, get_profile
+from pages_charts.aggregate_cube import CUBE_DIMENSIONS, get_cube
+from pages_charts.calendar_rollup import GRANULARITIES, get_period_view
+from pages_charts.cohort_engine import COHORT_METRICS, get_cohorts
+
+# ------------- Headless Query API ----------
+#   python -m pages_charts.query_api [--host 127.0.0.1] [--port 8502]
+#
+# Local HTTP service over the same engines and caches as app_st.py, for consumers
+# that are not the Streamlit UI. GET endpoints (one table each):
+#   /profile?dimension=Country            Won/Lost counts, EUR and percentages (profile engine)
+#   /describe?measure=ticket&by=Country   describe() statistics of the EUR value ("ticket") or the
+#                                         days to close ("time") by Stage and cube dimensions
+#   /period?granularity=Week              Won/Lost by Close Date period (calendar rollup)
+#   /cohorts?metric=win_rate              cohort x days-open grid, or metric=funnel
+#   /schema                               endpoints, dimensions, filter values, dataset version
+# Filters use the sidebar columns: Country=Country 1&Country=Country 2 (any of),
+# Account Type=Top 1 (names and values are matched without their leading spaces),
+# Close Date=2024-01-01,2024-03-31 (inclusive range). format=json (default) or
+# format=arrow (Arrow IPC stream, also chosen by an Accept header).
+# Responses are kept in an in-process LRU keyed by (endpoint, normalized query,
+# format, dataset version): a repeated query is answered from the encoded bytes,
+# and a new dataset version is picked up by the next request. Requests are served
+# by one thread per connection (HTTP/1.1 keep-alive).
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8502
+
+RESPONSE_CACHE_ENTRIES = 4096
+
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+
+MEASURES = {"ticket": " Opp Value (EUR)", "time": "Deal Opened (Days)"}
+
+FORMATS = {"json": "application/json", "arrow": ARROW_TYPE}
+
+# Endpoint -> (parameter, allowed values, default)
+ENDPOINTS = {
+    "/profile": ("dimension", PROFILE_DIMENSIONS, "All"),
+    "/describe": ("measure", list(MEASURES), "ticket"),
+    "/period": ("granularity", list(GRANULARITIES), "Month"),
+    "/cohorts": ("metric", list(COHORT_METRICS) + ["funnel"], "win_rate"),
+}
+
+FILTER_COLUMNS = {column.strip(): column for column in CATEGORY_FILTERS + DATE_FILTERS}
+
+
+class QueryError(ValueError):
+    pass
+
+
+# ---- Queries ----
+
+def _choice(value, allowed, name):
+    # Allowed value, matched without the leading spaces of the column names
+    names = {item.strip(): item for item in allowed}
+    if value.strip() not in names:
+        raise QueryError(f"Unknown {name} {value!r}: expected one of {', '.join(names)}")
+    return names[value.strip()]
+
+
+def parse_query(endpoint, params, path=DATA_PATH):
+    # (endpoint parameters, frozen filters) of the parameters of a request; raises QueryError
+    if endpoint not in ENDPOINTS:
+        raise QueryError(f"Unknown endpoint {endpoint}")
+    name, allowed, default = ENDPOINTS[endpoint]
+    options = {name: default}
+    filters = {}
+    categories = get_filter_index(path).categories
+    for key, value in params:
+        if key == "format":
+            continue
+        if key == name:
+            options[name] = _choice(value, allowed, name)
+        elif key == "by" and endpoint == "/describe":
+            options["by"] = tuple(_choice(column, CUBE_DIMENSIONS, "dimension") for column in value.split(","))
+        elif key.strip() in FILTER_COLUMNS:
+            column = FILTER_COLUMNS[key.strip()]
+            if column in DATE_FILTERS:
+                try:
+                    start, end = (str(pd.Timestamp(part).date()) for part in value.split(","))
+                except ValueError:
+                    raise QueryError(f"{key}: expected a range start,end (e.g. 2024-01-01,2024-03-31)") from None
+                filters[column] = (start, end)
+            else:
+                labels = {category.strip(): category for category in categories[column]}  # Same matching as the names
+                if value.strip() not in labels:
+                    raise QueryError(f"Unknown {key} {value!r}")
+                filters.setdefault(column, []).append(labels[value.strip()])
+        else:
+            raise QueryError(f"Unknown parameter {key!r}")
+    if endpoint == "/describe":  # Stage first, like the pages
+        options["by"] = ("Stage",) + tuple(column for column in options.get("by", ()) if column != "Stage")
+    return options, freeze_filters(filters)
+
+
+def run_query(endpoint, options, filters, path=DATA_PATH):
+    # Result table of a parsed query, from the cached engines
+    if endpoint == "/profile":
+        return get_profile(path, filters)[options["dimension"]]
+    if endpoint == "/describe":
+        return get_cube(path, filters).describe(MEASURES[options["measure"]], list(options["by"]))
+    if endpoint == "/period":
+        return get_period_view(options["granularity"], path, filters)
+    cohorts = get_cohorts(path, filters)
+    return cohorts.funnel() if options["metric"] == "funnel" else cohorts.grid(options["metric"])
+
+
+def schema(path=DATA_PATH):
+    index = get_filter_index(path)
+    return {
+        "version": data_version(path),
+        "endpoints": {endpoint: {"parameter": name, "values": [value.strip() for value in allowed], "default": default}
+                      for endpoint, (name, allowed, default) in ENDPOINTS.items()},
+        "describe_by": [column.strip() for column in CUBE_DIMENSIONS],
+        "filters": {column.strip(): ([category.strip() for category in index.categories[column]] if column in CATEGORY_FILTERS else "start,end")
+                    for column in CATEGORY_FILTERS + DATE_FILTERS},
+        "formats": list(FORMATS),
+    }
+
+
+# ---- Encoding ----
+
+def _flat_frame(table):
+    # Named index levels become columns; column labels become strings
+    frame = table.reset_index(drop=isinstance(table.index, pd.RangeIndex) and table.index.name is None)
+    frame.columns = [str(column).strip() for column in frame.columns]
+    return frame
+
+
+def encode(table, fmt, metadata):
+    frame = _flat_frame(table)
+    if fmt == "arrow":
+        arrow = pa.Table.from_pandas(frame, preserve_index=False)
+        arrow = arrow.replace_schema_metadata({"query": json.dumps(metadata)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, arrow.schema) as writer:
+            writer.write_table(arrow)
+        return sink.getvalue().to_pybytes()
+    header = json.dumps({**metadata, "rows": len(frame)})[:-1]
+    return f'{header}, "data": {frame.to_json(orient="records", date_format="iso")}}}'.encode()
+
+
+# ---- Response cache ----
+
+class ResponseCache:
+    # LRU of encoded responses: key -> (body, content type, etag)
+
+    def __init__(self, max_entries=RESPONSE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class QueryService:
+
+    def __init__(self, path=DATA_PATH, max_entries=RESPONSE_CACHE_ENTRIES):
+        self.path = path
+        self.cache = ResponseCache(max_entries)
+
+    def respond(self, endpoint, query, accept=""):
+        # (body, content type, etag) of a GET request; raises QueryError
+        params = parse_qsl(query, keep_blank_values=True)
+        fmt = dict(params).get("format") or ("arrow" if ARROW_TYPE in accept else "json")
+        if fmt not in FORMATS:
+            raise QueryError(f"Unknown format {fmt!r}: expected json or arrow")
+        version = data_version(self.path)
+        raw_key = (endpoint, query, fmt, version)  # Same request text: no parsing at all
+        entry = self.cache.get(raw_key)
+        if entry is None:
+            options, filters = parse_query(endpoint, params, self.path)
+            key = (endpoint, tuple(sorted(options.items())), filters, fmt, version)  # Same query, written differently
+            entry = self.cache.get(key)
+            if entry is None:
+                start = time.perf_counter()
+                table = run_query(endpoint, options, filters, self.path)
+                metadata = {"endpoint": endpoint, **{name: list(value) if isinstance(value, tuple) else value.strip()
+                                                      for name, value in options.items()},
+                            "filters": {column.strip(): [value.strip() for value in values] for column, values in filters},
+                            "version": version}
+                body = encode(table, fmt, metadata)
+                etag = '"' + hashlib.sha1(repr(key).encode()).hexdigest()[:20] + '"'
+                entry = (body, FORMATS[fmt], etag)
+                self.cache.put(key, entry)
+                logger.info("%s %s: %d bytes in %.1f ms", endpoint, query, len(body), (time.perf_counter() - start) * 1000)
+            self.cache.put(raw_key, entry)
+        return entry
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive connections
+    disable_nagle_algorithm = True  # Headers and body are separate writes: no delayed-ACK stall per response
+    server_version = "SalesQueryAPI"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        endpoint = url.path.rstrip("/") or "/schema"
+        try:
+            if endpoint == "/schema":
+                self._send(200, json.dumps(schema(self.server.service.path)).encode(), FORMATS["json"])
+                return
+            body, content_type, etag = self.server.service.respond(endpoint, url.query, self.headers.get("Accept", ""))
+        except QueryError as error:
+            status = 404 if str(error).startswith("Unknown endpoint") else 400
+            self._send(status, json.dumps({"error": str(error)}).encode(), FORMATS["json"])
+            return
+        except Exception as error:
+            logger.exception("%s failed", self.path)
+            self._send(500, json.dumps({"error": str(error)}).encode(), FORMATS["json"])
+            return
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, b"", content_type, etag)
+        else:
+            self._send(200, body, content_type, etag)
+
+    def _send(self, status, body, content_type, etag=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def make_server(host="127.0.0.1", port=DEFAULT_PORT, path=DATA_PATH):
+    # Threaded server (port=0 picks a free port: server.server_address)
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    server.service = QueryService(path)
+    return server
+
+
+def warm_up(path=DATA_PATH):
+    # Builds the engines of the unfiltered queries before the first request
+    get_profile(path)
+    get_cube(path)
+    get_period_view("Month", path)
+    get_cohorts(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the sales aggregates over local HTTP (JSON / Arrow)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--path", default=DATA_PATH)
+    parser.add_argument("--no-warm-up", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    if not args.no_warm_up:
+        start = time.perf_counter()
+        warm_up(args.path)
+        logger.info("Engines ready in %.1fs", time.perf_counter() - start)
+    server = make_server(args.host, args.port, args.path)
+    logger.info("Serving on http://%s:%d/schema", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
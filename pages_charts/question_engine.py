@@ -0,0 +1,508 @@
+import re
+import sys
+import time
+import calendar
+import numpy as np
+import pandas as pd
+import streamlit as st
+from pages_charts.data_loader import DATA_PATH, OUT_OF_CORE, dataset_version
+from pages_charts.filters import data_version, filtered_data
+from pages_charts import out_of_core
+from pages_charts.aggregate_cube import AggregateCube
+from pages_charts.instrumentation import cache_lookup, cache_miss, span
+
+# ------------- Question Engine ----------
+#   python -m pages_charts.question_engine "win rate for Segment 2 in Q1"
+#
+# Answers structured sales questions offline, for the Agent Assistant page:
+#   "win rate for Segment 2 in Q1", "median opp value lost in Country 5",
+#   "top close reasons for Small accounts", "average days to close by segment".
+# A question is parsed with local rules into a Query (metric, measure, filters,
+# group-by, ranking): the dimension values are matched against the labels of the
+# dataset, the rest against a small keyword list. Queries run on a question cube,
+# an AggregateCube (see aggregate_cube.py) over Stage, Account Type, Country,
+# Segment, Type, Lead Source, Close Reason and the close year / quarter / month:
+# counts, sums, means, std and min / max are exact. Medians and percentiles come
+# from the merged KLL sketches of the selected cells (k = CUBE_SKETCH_K = 1000): exact
+# (interpolated like pandas) for selections of up to about k values, otherwise the
+# rank of the answer is within about +-0.4% of the asked one (a median lies between
+# the 49.6th and 50.4th percentiles). No row is read to answer a question.
+# Questions worded differently but parsed to the same Query share one cached
+# answer, keyed by the canonical query, the dataset version and the sidebar filters.
+
+VALUE_MEASURE = " Opp Value (EUR)"
+
+DAYS_MEASURE = "Deal Opened (Days)"
+
+COUNT_MEASURE = DAYS_MEASURE  # Never missing: its cell counts are the row counts
+
+WON, LOST = "Closed Won", "Closed Lost"
+
+PERIOD_DIMENSIONS = ["Close Year", "Close Quarter", "Close Month"]
+
+QUESTION_DIMENSIONS = ["Stage", " Account Type", "Country", "Segment", "Type", "Lead Source", "Close Reason"] + PERIOD_DIMENSIONS
+
+# Row columns read to build the question cube
+ROW_COLUMNS = QUESTION_DIMENSIONS[:-len(PERIOD_DIMENSIONS)] + ["Close Date", VALUE_MEASURE, DAYS_MEASURE]
+
+MONTHS = list(calendar.month_name)[1:]
+
+# Words naming a dimension (plural first), e.g. "by country", "top close reasons", "Small accounts"
+DIMENSION_WORDS = {
+    "Stage": ["stages", "stage"],
+    " Account Type": ["account types", "account type", "accounts", "account"],
+    "Country": ["countries", "country"],
+    "Segment": ["segments", "segment"],
+    "Type": ["business types", "business type", "types", "type"],
+    "Lead Source": ["lead sources", "lead source", "sources", "source", "channels", "channel"],
+    "Close Reason": ["close reasons", "close reason", "reasons", "reason"],
+    "Close Year": ["years", "year"],
+    "Close Quarter": ["quarters", "quarter"],
+    "Close Month": ["months", "month"],
+}
+
+# Word naming a dimension -> dimension, and the words longest first (e.g. "account types" before "accounts")
+WORD_DIMENSIONS = {word: dimension for dimension, words in DIMENSION_WORDS.items() for word in words}
+
+ANY_DIMENSION_WORD = "|".join(sorted(WORD_DIMENSIONS, key=len, reverse=True))
+
+RANKING_PATTERN = r"\b(?:top|best|bottom|worst) (\d{1,3})\b"
+
+STAGE_WORDS = {
+    WON: r"won|win|wins|winning|successful",
+    LOST: r"lost|lose|loss|losses|losing|failed",
+}
+
+STATISTIC_WORDS = [
+    (r"median", 0.5),
+    (r"average|avg|mean|typical", "mean"),
+    (r"total|sum|revenue", "sum"),
+    (r"maximum|max|largest|biggest", "max"),
+    (r"minimum|min|smallest", "min"),
+    (r"standard deviation|std|spread", "std"),
+]
+
+MEASURE_WORDS = {
+    DAYS_MEASURE: r"days|day|time to close|time|duration|cycle|age|how long|long",
+    VALUE_MEASURE: r"opp value|opportunity value|deal value|deal size|value|values|ticket|eur|amount|revenue",
+}
+
+EXAMPLE_QUESTIONS = [
+    "Win rate for Segment 2 in Q1",
+    "Median opp value lost in Country 5",
+    "Top close reasons for Small accounts",
+    "Average days to close won deals by account type",
+    "Which country has the best win rate?",
+    "How many New Business opportunities were lost in March?",
+    "90th percentile opp value by segment",
+    "Total revenue won per quarter",
+]
+
+DEFAULT_TOP = 5
+
+MIN_RANKED_SUPPORT = 30  # Smaller groups are left out of "best / worst" rankings
+
+
+def normalize(text):
+    # Lower case words and numbers only: "Win rate, Segment 2?" -> "win rate segment 2"
+    text = str(text).lower().replace("€", " eur ")
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def with_close_periods(data):
+    # Adds the close year / quarter / month labels of the question cube
+    dates = data["Close Date"]
+    return data.assign(**{
+        "Close Year": dates.dt.strftime("%Y"),
+        "Close Quarter": "Q" + dates.dt.quarter.astype("Int64").astype("string"),
+        "Close Month": dates.dt.month_name(),
+    })
+
+
+def build_question_cube(data):
+    return AggregateCube.from_data(with_close_periods(data), QUESTION_DIMENSIONS, [VALUE_MEASURE, DAYS_MEASURE])
+
+
+def cube_vocabulary(cube):
+    cells = cube.cells[COUNT_MEASURE]
+    return Vocabulary({dimension: [str(label) for label in cells.index.unique(dimension)] for dimension in QUESTION_DIMENSIONS})
+
+
+# ---- Queries ----
+
+class Query:
+
+    def __init__(self, metric, measure=None, statistic=None, where=(), by=None, descending=None, limit=None):
+        self.metric = metric  # "count", "win_rate", "loss_rate" or "statistic"
+        self.measure = measure
+        self.statistic = statistic  # "mean", "sum", "min", "max", "std" or a quantile in (0, 1)
+        # Canonical filters: ((dimension, (labels...)), ...) in cube dimension order
+        self.where = tuple(sorted(((dimension, tuple(sorted(values))) for dimension, values in where),
+                                  key=lambda item: QUESTION_DIMENSIONS.index(item[0])))
+        self.by = by
+        self.descending = descending  # None: natural order of the groups
+        self.limit = limit
+
+    def key(self):
+        return (self.metric, self.measure, self.statistic, self.where, self.by, self.descending, self.limit)
+
+    @classmethod
+    def from_key(cls, key):
+        return cls(*key)
+
+    def metric_label(self):
+        if self.metric == "count":
+            return "Opportunities"
+        if self.metric in ("win_rate", "loss_rate"):
+            return "Win rate" if self.metric == "win_rate" else "Loss rate"
+        if isinstance(self.statistic, float):
+            statistic = "Median" if self.statistic == 0.5 else f"{self.statistic * 100:g}th percentile"
+        else:
+            statistic = {"mean": "Average", "sum": "Total", "min": "Minimum", "max": "Maximum", "std": "Std of"}[self.statistic]
+        return f"{statistic} {self.measure.strip()}"
+
+    def filter_label(self):
+        # "Segment 2, Q1, Small (Account Type)": the dimension is named when the labels do not
+        parts = []
+        for dimension, values in self.where:
+            text = " or ".join(value.strip() for value in values)
+            named = dimension == "Stage" or dimension in PERIOD_DIMENSIONS or all(normalize(dimension) in normalize(value) for value in values)
+            parts.append(text if named else f"{text} ({dimension.strip()})")
+        return ", ".join(parts)
+
+    def describe(self):
+        parts = [self.metric_label()]
+        if self.where:
+            parts.append(self.filter_label())
+        if self.by:
+            ranking = "" if self.descending is None else f" ({'top' if self.descending else 'bottom'} {self.limit})" if self.limit else ""
+            parts.append(f"by {self.by.strip()}{ranking}")
+        return " · ".join(parts)
+
+
+class Vocabulary:
+    # Phrases of the dimension labels of a dataset, and the questions parsed with them
+
+    def __init__(self, labels):
+        self.labels = labels  # {dimension: [labels]}
+        self.phrases = {}  # normalized phrase -> {dimension: [labels]}
+        for dimension, values in labels.items():
+            for label in values:
+                for phrase in _label_phrases(dimension, label):
+                    matches = self.phrases.setdefault(phrase, {}).setdefault(dimension, [])
+                    if label not in matches:
+                        matches.append(label)
+        phrases = sorted(self.phrases, key=len, reverse=True)  # Longest phrase first
+        self.pattern = re.compile(r"\b(" + "|".join(re.escape(phrase) for phrase in phrases) + r")\b") if phrases else None
+        self._queries = {}  # normalized question -> Query already parsed
+
+    def parse(self, question):
+        text = normalize(question)
+        if text not in self._queries:
+            self._queries[text] = parse_question(text, self)
+        return self._queries[text]
+
+
+def _label_phrases(dimension, label):
+    phrases = {normalize(label)}
+    if "/" in label:  # "Brand Recognition / Supplier Reputation" -> "brand recognition", "supplier reputation"
+        phrases.update(normalize(part) for part in label.split("/") if len(part.strip()) > 3)
+    if dimension == "Close Month":
+        phrases.add(normalize(label)[:3])
+    if normalize(label) == "unknow":  # Spelling of the missing values in the dataset
+        phrases.add("unknown")
+    phrases.discard("")
+    return phrases
+
+
+def _take(text, pattern):
+    # (text without the first match, match or None)
+    match = re.search(pattern, text)
+    if match is None:
+        return text, None
+    return f"{text[:match.start()]} | {text[match.end():]}", match
+
+
+def _words(words):
+    return r"\b(?:" + "|".join(words) + r")\b"
+
+
+def parse_question(text, vocabulary):
+    # Query of a normalized question, or None when nothing in it is understood
+    text = f" {text} "
+    metric = statistic = measure = descending = limit = None
+
+    text, match = _take(text, r"\bp(\d{1,2})\b|\b(\d{1,2})(?:st|nd|rd|th)? percentile\b")
+    if match:
+        statistic = int(match.group(1) or match.group(2)) / 100
+    text, match = _take(text, _words([r"win rate", r"winrate", r"won rate", r"win ratio", r"success rate", r"conversion rate", r"conversion", r"hit rate"]))
+    if match:
+        metric = "win_rate"
+    else:
+        text, match = _take(text, _words([r"loss rate", r"lost rate", r"lose rate", r"loss ratio"]))
+        metric = "loss_rate" if match else None
+    if metric is None and statistic is None:
+        for pattern, value in STATISTIC_WORDS:
+            text, match = _take(text, _words([pattern]))
+            if match:
+                statistic = value
+                if match.group(0) == "revenue":
+                    measure = VALUE_MEASURE
+                break
+    if metric is None:
+        for name, pattern in MEASURE_WORDS.items():
+            text, match = _take(text, _words([pattern]))
+            if match:
+                measure = name
+                break
+        text, match = _take(text, _words([r"how many", r"number of", r"count", r"volume"]))
+        if match and statistic is None and measure is None:
+            metric = "count"
+
+    # Dimension values, with an adjacent word naming their dimension ("Small accounts", "segment unknown").
+    # Matched before the rankings: "top 1 accounts" is the Top 1 account type, but a label that reads as
+    # a ranking of another dimension ("top 3 countries") is left to the ranking.
+    where = {}
+    position = 0
+    while vocabulary.pattern is not None:
+        match = vocabulary.pattern.search(text, position)
+        if match is None:
+            break
+        candidates = vocabulary.phrases[match.group(0)]
+        ranked = re.match(rf" ({ANY_DIMENSION_WORD})\b", text[match.end():])
+        if re.fullmatch(RANKING_PATTERN, match.group(0)) and ranked and WORD_DIMENSIONS[ranked.group(1)] not in candidates:
+            position = match.end()
+            continue
+        dimension = next((d for d in candidates if re.search(_words(DIMENSION_WORDS[d]), text)), next(iter(candidates)))
+        words = "|".join(DIMENSION_WORDS[dimension])
+        around = re.compile(rf"(?:\b(?:{words}) )?\b{re.escape(match.group(0))}\b(?: (?:{words})\b)?")
+        rest, _ = _take(text[position:], around)
+        text = text[:position] + rest
+        where.setdefault(dimension, [])
+        where[dimension] += [label for label in candidates[dimension] if label not in where[dimension]]
+
+    text, match = _take(text, RANKING_PATTERN)
+    if match:
+        limit = int(match.group(1))
+        descending = not match.group(0).startswith(("bottom", "worst"))
+    text, match = _take(text, _words([r"top", r"best", r"highest", r"most", r"largest", r"biggest", r"leading", r"main", r"greatest"]))
+    if match and descending is None:
+        descending = True
+    text, match = _take(text, _words([r"worst", r"lowest", r"least", r"bottom", r"fewest", r"smallest"]))
+    if match and descending is None:
+        descending = False
+
+    stages = []
+    for stage, pattern in STAGE_WORDS.items():
+        text, match = _take(text, _words([pattern]))
+        if match:
+            stages.append(stage)
+    if len(stages) == 1 and "Stage" not in where:
+        where["Stage"] = stages
+
+    by = singular = None
+    for dimension, words in DIMENSION_WORDS.items():
+        match = re.search(_words(words), text)
+        if match and (by is None or match.start() < by[1]):
+            by = (dimension, match.start())
+            singular = match.group(0) == words[-1]
+    by = by[0] if by else None
+
+    if metric is None:
+        if statistic is not None or measure is not None:
+            metric = "statistic"
+            statistic = "mean" if statistic is None else statistic
+            measure = measure or VALUE_MEASURE
+        elif where or by or stages:
+            metric = "count"
+        else:
+            return None
+    if metric in ("win_rate", "loss_rate"):
+        where.pop("Stage", None)  # A rate compares both stages
+    if by is None:
+        descending = limit = None
+    elif descending is not None and limit is None:
+        limit = 1 if singular else DEFAULT_TOP  # "best country" / "top close reasons"
+    return Query(metric, measure, statistic if metric == "statistic" else None, where.items(), by, descending, limit)
+
+
+# ---- Execution on the question cube ----
+
+def _select(cube, measure, where):
+    # Cells of a measure matching the filters
+    cells = cube.cells[measure]
+    mask = np.ones(len(cells), dtype=bool)
+    for dimension, values in where:
+        mask &= cells.index.get_level_values(dimension).isin(values)
+    return cells[mask]
+
+
+def _group_keys(cells, by):
+    return cells.index.get_level_values(by) if by else np.zeros(len(cells), dtype=int)
+
+
+def _rates(cube, query):
+    # (rate per group, support columns, detail per group)
+    cells = _select(cube, COUNT_MEASURE, query.where)
+    stages = cells.index.get_level_values("Stage")
+    frame = pd.DataFrame({
+        "group": _group_keys(cells, query.by),
+        "Won": np.where(stages == WON, cells["count"], 0),
+        "Closed": np.where(stages.isin([WON, LOST]), cells["count"], 0),
+    })
+    support = frame.groupby("group", sort=True)[["Won", "Closed"]].sum()
+    support = support[support["Closed"] > 0]
+    rate = support["Won"] / support["Closed"]
+    value = rate if query.metric == "win_rate" else 1 - rate
+    return value, support, [f"{won:,} won of {closed:,} closed" for won, closed in zip(support["Won"], support["Closed"])]
+
+
+def _statistics(cube, query):
+    if query.metric == "count":
+        cells = _select(cube, COUNT_MEASURE, query.where)
+        counts = cells["count"].groupby(_group_keys(cells, query.by)).sum()
+        counts = counts[counts > 0]
+        return counts, pd.DataFrame(index=counts.index), [None] * len(counts)  # The count is the answer: no detail
+
+    cells = _select(cube, query.measure, query.where)
+    groups = _group_keys(cells, query.by)
+    stats = cells.groupby(groups).agg({"count": "sum", "sum": "sum", "sumsq": "sum", "min": "min", "max": "max"})
+    stats = stats[stats["count"] > 0]
+    if isinstance(query.statistic, float):  # Merged sketches of the selected cells
+        quantiles = cube.quantiles(query.measure, [query.by] if query.by else [], [query.statistic], query.where)
+        value = quantiles.iloc[:, 0].reindex(stats.index)
+    elif query.statistic == "mean":
+        value = stats["sum"] / stats["count"]
+    elif query.statistic == "std":
+        variance = (stats["sumsq"] - stats["sum"] ** 2 / stats["count"]) / (stats["count"] - 1)
+        value = np.sqrt(variance.clip(lower=0))
+    else:
+        value = stats[query.statistic].astype("float64")
+    support = stats[["count"]].astype("int64").rename(columns={"count": "Opportunities"})
+    return value, support, [f"{count:,} opportunities" for count in support["Opportunities"]]
+
+
+def format_value(query, value):
+    if pd.isna(value):
+        return "—"
+    if query.metric in ("win_rate", "loss_rate"):
+        return f"{value:.1%}"
+    if query.metric == "count":
+        return f"{value:,.0f}"
+    return f"{value:,.2f} EUR" if query.measure == VALUE_MEASURE else f"{value:,.1f} days"
+
+
+def _natural_order(labels, dimension):
+    if dimension == "Close Month":
+        return sorted(labels, key=lambda label: MONTHS.index(label) if label in MONTHS else len(MONTHS))
+    return sorted(labels, key=str)
+
+
+def answer_query(cube, query):
+    # {"query", "text", "table"} of a Query on a question cube
+    compute = _rates if query.metric in ("win_rate", "loss_rate") else _statistics
+    value, support, details = compute(cube, query)
+    label = query.metric_label()
+    scope = f" for {query.filter_label()}" if query.where else ""
+    answer = {"query": query.describe(), "table": None}
+    if value.empty:
+        answer["text"] = f"No opportunities match{scope or ' the current filters'}."
+        return answer
+
+    if query.by is None:
+        detail = f" ({details[0]})" if details[0] else ""
+        answer["text"] = f"{label}{scope}: **{format_value(query, value.iloc[0])}**{detail}."
+        return answer
+
+    table = support.assign(value=value, detail=details)
+    if query.descending is None:
+        table = table.loc[_natural_order(list(table.index), query.by)]
+    else:
+        size = "Closed" if "Closed" in table else "Opportunities"  # Rows behind each rate / statistic
+        ranked = table[table[size] >= MIN_RANKED_SUPPORT] if size in table else table
+        table = (ranked if len(ranked) else table).sort_values("value", ascending=not query.descending, kind="stable").head(query.limit)
+    first, detail = table.index[0], table["detail"].iloc[0]
+    table = table.drop(columns="detail").rename(columns={"value": label})
+    table[label] = [format_value(query, item) for item in table[label]]
+    table.insert(0, query.by.strip(), [str(group).strip() for group in table.index])
+    answer["table"] = table.reset_index(drop=True)
+
+    if query.descending is not None and query.limit == 1:
+        extreme = "highest" if query.descending else "lowest"
+        detail = f", {detail}" if detail else ""
+        answer["text"] = f"{query.by.strip()} with the {extreme} {label.lower()}{scope}: **{str(first).strip()}** ({answer['table'][label].iloc[0]}{detail})."
+    else:
+        ranking = "" if query.descending is None else f"{'Top' if query.descending else 'Bottom'} {len(table)} "
+        answer["text"] = f"{ranking}{label} by {query.by.strip()}{scope}:"
+    return answer
+
+
+# ---- Cached cube, vocabulary and answers ----
+
+@st.cache_resource(show_spinner=False, max_entries=16)  # Built once per dataset version and filter state, shared by every session.
+def _build_cached(path, version, filters):
+    cache_miss()
+    return build_question_cube(filtered_data(filters, path)[ROW_COLUMNS])
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _scan_cached(source, version, filters):
+    # Out-of-core: the cube of each record batch is merged as the scan goes
+    cache_miss()
+    cube = build_question_cube(out_of_core.empty_frame(ROW_COLUMNS, source))
+    for batch in out_of_core.scan_batches(ROW_COLUMNS, filters, source):
+        cube.merge(build_question_cube(batch))
+    return cube
+
+
+def get_question_cube(path=DATA_PATH, filters=()):
+    # Question cube of the rows selected by a frozen filter state (see filters.py)
+    with cache_lookup("question_cube", filters=len(filters)):
+        if OUT_OF_CORE:
+            source = out_of_core.scan_source()
+            return _scan_cached(source, out_of_core.source_version(source), filters)
+        return _build_cached(path, dataset_version(path), filters)
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _vocabulary(path, version):
+    # Labels of the whole dataset: a value outside the sidebar filters is still understood
+    cache_miss()
+    return cube_vocabulary(get_question_cube(path))
+
+
+def get_vocabulary(path=DATA_PATH):
+    with cache_lookup("vocabulary"):
+        return _vocabulary(path, data_version(path))
+
+
+@st.cache_data(show_spinner=False, max_entries=512)  # Per canonical query, dataset version and filter state.
+def _cached_answer(query_key, version, filters, path):
+    cache_miss()
+    return answer_query(get_question_cube(path, filters), Query.from_key(query_key))
+
+
+def ask(question, path=DATA_PATH, filters=()):
+    # Answer of a question ({"query", "text", "table"}), None when it is not understood
+    with span("ask"):
+        query = get_vocabulary(path).parse(question)
+        if query is None:
+            return None
+        with cache_lookup("answer"):
+            return _cached_answer(query.key(), data_version(path), filters, path)
+
+
+if __name__ == "__main__":
+    # This will execute when the script is run directly
+    for question in sys.argv[1:] or EXAMPLE_QUESTIONS:
+        start = time.perf_counter()
+        answer = ask(question)
+        seconds = time.perf_counter() - start
+        print(f"Q: {question}  [{seconds * 1000:.1f} ms]")
+        if answer is None:
+            print("   (not understood)\n")
+            continue
+        print(f"   {answer['query']}\n   {answer['text']}")
+        if answer["table"] is not None:
+            print(answer["table"].to_string(index=False))
+        print()
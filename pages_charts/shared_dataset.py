@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import argparse
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+from pages_charts.data_loader import BASE_DIR, DATA_PATH, dataset_version, read_data
+from pages_charts.instrumentation import cache_miss, span
+
+# ------------- Shared Dataset ----------
+#   python -m pages_charts.shared_dataset [--path FILE]   (publishes the current version)
+#   QUERY_MODE=shared streamlit run app_st.py
+#
+# In "shared" query mode the typed sales frame and the filter index are not built by
+# every server process: they are published once per dataset version as Arrow IPC
+# files (data/.shared/<file>-<version>/) in the pandas memory layout (category codes,
+# int64 datetimes, numeric columns as stored), and every process memory-maps them.
+# The frame columns and index arrays are read-only views of the mapped files, so
+# the sessions and processes of a host share one copy in the OS page cache.
+# The version stamp is the dataset version of the parquet file. A version is
+# written to a staging directory renamed into place (atomic), under a lock file so
+# that one process publishes it while the others wait; readers switch on their
+# next rerun, and processes still mapping the previous version keep it until their
+# cache drops it. ingest.py --publish publishes ahead of the app. Only the last
+# KEEP_VERSIONS versions of a file are kept.
+
+SHARED_DIR = os.environ.get("SALES_SHARED_DIR", os.path.join(BASE_DIR, "data", ".shared"))
+
+KEEP_VERSIONS = 2
+
+LOCK_TIMEOUT = 300  # Seconds after which the lock of a publisher that died is taken over
+
+DATA_FILE = "sales.arrow"
+
+INDEX_DATES_FILE = "filter_dates.arrow"  # Row-length arrays of the filter index
+
+INDEX_BITMAPS_FILE = "filter_bitmaps.arrow"  # Packed bitmaps of the filter index
+
+
+# ---- Arrow IPC files of equal-length arrays ----
+
+def write_arrays(path, arrays, metadata):
+    # {name: numpy or Arrow array} -> uncompressed Arrow IPC file (required to map it without a copy)
+    table = pa.table({name: values if isinstance(values, pa.Array) else pa.array(values) for name, values in arrays.items()})
+    table = table.replace_schema_metadata({"shared": json.dumps(metadata)})
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def map_arrays(path):
+    # (memory-mapped table, metadata) of a file written by write_arrays
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table, json.loads(table.schema.metadata[b"shared"])
+
+
+def _array(table, name):
+    column = table.column(name)
+    return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+
+def _numpy(table, name):
+    return _array(table, name).to_numpy(zero_copy_only=True)
+
+
+# ---- Frame <-> arrays ----
+
+def frame_arrays(data):
+    # Columns of a typed frame in their pandas memory layout, and how to rebuild them
+    arrays, layout = {}, {}
+    for column in data.columns:
+        values = data[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            arrays[column] = values.cat.codes.to_numpy()
+            layout[column] = {"kind": "category", "categories": values.cat.categories.tolist()}
+        elif pd.api.types.is_datetime64_dtype(values.dtype):
+            arrays[column] = values.to_numpy().view("int64")  # NaT is the minimum int64
+            layout[column] = {"kind": "datetime", "dtype": str(values.dtype)}
+        elif pd.api.types.is_string_dtype(values.dtype):
+            arrays[column] = pa.array(values.to_numpy(dtype=object), type=pa.large_string(), from_pandas=True)
+            layout[column] = {"kind": "string"}
+        else:
+            arrays[column] = values.to_numpy()
+            layout[column] = {"kind": "numeric"}
+    return arrays, layout
+
+
+def frame_from_table(table, layout, columns=None):
+    # Frame whose columns are views of the table buffers (no copy, read-only)
+    arrays = {}
+    for column in columns or layout:
+        kind = layout[column]["kind"]
+        if kind == "string":
+            arrays[column] = pd.arrays.ArrowStringArray(pa.chunked_array([_array(table, column)]))
+        elif kind == "category":
+            dtype = pd.CategoricalDtype(layout[column]["categories"])
+            arrays[column] = pd.Categorical.from_codes(_numpy(table, column), dtype=dtype)
+        elif kind == "datetime":
+            arrays[column] = _numpy(table, column).view(layout[column]["dtype"])
+        else:
+            arrays[column] = _numpy(table, column)
+    return pd.DataFrame(arrays, copy=False)  # copy=False: the columns are not consolidated (copied) into blocks
+
+
+# ---- Publishing ----
+
+def version_dir(path, version, shared_dir=SHARED_DIR):
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]  # Several data files can be published
+    return os.path.join(shared_dir, f"{key}-{version}")
+
+
+def _write_version(path, directory):
+    from pages_charts.filters import DATE_FILTERS, FilterIndex  # (circular import)
+
+    data = read_data(path)
+    arrays, layout = frame_arrays(data)
+    write_arrays(os.path.join(directory, DATA_FILE), arrays, {"columns": layout})
+
+    index = FilterIndex(data)
+    dates = {}
+    for column in DATE_FILTERS:
+        dates[f"{column} order"] = index.date_order[column]
+        dates[f"{column} sorted"] = index.sorted_dates[column].view("int64")
+    write_arrays(os.path.join(directory, INDEX_DATES_FILE), dates, {"n_rows": index.n_rows, "columns": DATE_FILTERS})
+    bitmaps = {
+        f"{column}={code}": index.bitmaps[column][category]
+        for column, categories in index.categories.items()
+        for code, category in enumerate(categories)
+    }
+    write_arrays(os.path.join(directory, INDEX_BITMAPS_FILE), bitmaps, {"categories": index.categories})
+
+
+def _acquire_lock(lock_path, target):
+    # Lock file descriptor, or None when another process published the version meanwhile
+    while True:
+        try:
+            return os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if os.path.exists(target):
+                return None
+            try:
+                if time.time() - os.path.getmtime(lock_path) > LOCK_TIMEOUT:
+                    os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+            time.sleep(0.1)
+
+
+def _drop_old_versions(target, shared_dir=SHARED_DIR):
+    # Mapped files stay readable after removal (POSIX); elsewhere they are dropped on a later publish
+    key = os.path.basename(target).split("-", 1)[0]
+    versions = [entry.path for entry in os.scandir(shared_dir) if entry.is_dir() and entry.name.startswith(f"{key}-")]
+    versions.sort(key=os.path.getmtime, reverse=True)
+    for directory in versions[KEEP_VERSIONS:]:
+        if directory != target:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def publish(path=DATA_PATH, version=None, shared_dir=SHARED_DIR):
+    # Publishes a version of the data file once; returns its directory
+    version = version or dataset_version(path)
+    target = version_dir(path, version, shared_dir)
+    if os.path.exists(target):
+        return target
+    os.makedirs(shared_dir, exist_ok=True)
+    lock_path = f"{target}.lock"
+    lock = _acquire_lock(lock_path, target)
+    if lock is None:
+        return target
+    try:
+        if not os.path.exists(target):
+            staging = os.path.join(shared_dir, f"_staging-{uuid.uuid4().hex}")
+            os.makedirs(staging)
+            try:
+                with span("publish_shared", path=os.path.basename(path)):
+                    _write_version(path, staging)
+                os.rename(staging, target)  # Readers see a complete version or none
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+            _drop_old_versions(target, shared_dir)
+    finally:
+        os.close(lock)
+        os.remove(lock_path)
+    return target
+
+
+# ---- Mapped frame and filter index (one mapping per process and version) ----
+
+@st.cache_resource(show_spinner=False, max_entries=4)  # Views of the mapped file, shared by every session.
+def _map_data_cached(path, version, columns):
+    cache_miss()
+    table, metadata = map_arrays(os.path.join(publish(path, version), DATA_FILE))
+    return frame_from_table(table, metadata["columns"], columns)
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _map_index_cached(path, version):
+    cache_miss()
+    from pages_charts.filters import FilterIndex  # (circular import)
+
+    directory = publish(path, version)
+    dates, metadata = map_arrays(os.path.join(directory, INDEX_DATES_FILE))
+    bitmaps, bitmap_metadata = map_arrays(os.path.join(directory, INDEX_BITMAPS_FILE))
+    categories = bitmap_metadata["categories"]
+    return FilterIndex.from_parts(
+        metadata["n_rows"],
+        categories,
+        {column: {category: _numpy(bitmaps, f"{column}={code}") for code, category in enumerate(values)}
+         for column, values in categories.items()},
+        {column: _numpy(dates, f"{column} order") for column in metadata["columns"]},
+        {column: _numpy(dates, f"{column} sorted").view("datetime64[ns]") for column in metadata["columns"]},
+    )
+
+
+def shared_data(path=DATA_PATH, columns=None):
+    return _map_data_cached(path, dataset_version(path), columns)
+
+
+def shared_filter_index(path=DATA_PATH):
+    return _map_index_cached(path, dataset_version(path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish the processed dataset for QUERY_MODE=shared")
+    parser.add_argument("--path", default=DATA_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    directory = publish(args.path)
+    size = sum(entry.stat().st_size for entry in os.scandir(directory))
+    print(f"Published {directory} ({size / 1e6:.1f} MB) in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,342 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+import streamlit as st
+from pages_charts.data_loader import BASE_DIR, DATA_PATH, dataset_version, read_data
+from pages_charts.instrumentation import cache_lookup, cache_miss
+
+# ------------- Stage Prediction Model ----------
+#   python -m pages_charts.stage_model [--holdout 0.2]   # trains models/stage_model.json
+#
+# Win / loss model of an opportunity. The feature pipeline reuses the preprocessing
+# of sales_prep_feat_eng.ipynb (the "Unknow" fill of the text columns, numeric Opp
+# Value, parsed dates) and encodes every feature as a small integer code:
+#   - Country, Segment, Account Type, Type, Lead Source and the created month:
+#     position in the training vocabulary (0 = unknown / missing);
+#   - Opp Value and the age in days: quantile bin of the training data (0 = missing).
+# The age is the days between Created Date and the scoring date. The model scores
+# open opportunities, so it is trained on what they look like when scored: every
+# closed opportunity gives one training row per week end while it was open
+# (snapshot_examples), with its age at that date. The final time to close (Deal
+# Opened (Days)) only places the snapshots and is never a feature.
+#
+# The model is a categorical Naive Bayes: per class counts of every code, with
+# Laplace smoothing. Counts are additive, so models trained on separate batches
+# merge exactly. Scoring a batch is one table lookup per feature and a row sum of
+# log-odds (vectorized, no Python loop over rows). The artifact is a few KB of JSON
+# (vocabularies, bin edges, counts): loaded once per process, nothing is unpickled.
+
+MODEL_PATH = os.path.join(BASE_DIR, "models", "stage_model.json")
+
+FORMAT_VERSION = 2  # 2: age as of weekly snapshots (1 trained on the time to close)
+
+CLASSES = ["Closed Lost", "Closed Won"]  # Probabilities are reported for the positive (last) class
+
+TEXT_FEATURES = ["Country", "Segment", " Account Type", "Type", "Lead Source"]
+
+MONTH_FEATURE = "Created Month"
+
+NUMERIC_FEATURES = [" Opp Value (EUR)", "Age (Days)"]
+
+CATEGORICAL_FEATURES = TEXT_FEATURES + [MONTH_FEATURE]
+
+N_BINS = 16
+
+ALPHA = 1.0  # Laplace smoothing
+
+SNAPSHOT_DAYS = 7  # Training snapshots: every week end (Sunday)
+
+# Columns an uploaded file must have (names are matched without the surrounding spaces)
+INPUT_COLUMNS = TEXT_FEATURES + ["Created Date", " Opp Value (EUR)"]
+
+# Same fill as the notebook for the text columns
+FILL_VALUE = "Unknow"
+
+
+def _find_column(data, name):
+    # Column of `data` matching `name` once the surrounding spaces are removed
+    columns = {str(column).strip(): column for column in data.columns}
+    return columns.get(name.strip())
+
+
+def missing_columns(data):
+    return [name.strip() for name in INPUT_COLUMNS if _find_column(data, name) is None]
+
+
+def _clean_text(values):
+    # Stripped text, missing values filled as in the notebook; each distinct value is cleaned once
+    codes, uniques = pd.factorize(values)
+    cleaned = np.array([str(value).strip() for value in uniques] + [FILL_VALUE], dtype=object)
+    return pd.Series(cleaned[codes], index=values.index)  # Code -1 (missing) picks the fill value
+
+
+def _parse_dates(values):
+    # Parsed dates: native datetimes, ISO text (processed data) or dd/mm/yyyy (raw export)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    parsed = pd.to_datetime(values, format="ISO8601", errors="coerce")
+    if parsed.isna().mean() > 0.5:
+        parsed = pd.to_datetime(values, format="%d/%m/%Y", errors="coerce")
+    return parsed
+
+
+def feature_frame(data, as_of=None):
+    # Model features of a frame of opportunities (processed dataset or uploaded file)
+    missing = missing_columns(data)
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    features = pd.DataFrame(index=data.index)
+    for name in TEXT_FEATURES:
+        features[name] = _clean_text(data[_find_column(data, name)])
+    created = _parse_dates(data[_find_column(data, "Created Date")])
+    features[MONTH_FEATURE] = created.dt.month.astype("float64")
+    features[" Opp Value (EUR)"] = pd.to_numeric(data[_find_column(data, " Opp Value (EUR)")], errors="coerce")
+    as_of = pd.Timestamp(as_of) if as_of is not None else pd.Timestamp.today().normalize()
+    features["Age (Days)"] = (as_of - created).dt.days.astype("float64")
+    return features
+
+
+def snapshot_examples(data):
+    # (features, stages) of the training rows: one per closed opportunity and week end between
+    # its Created Date (included) and its close (excluded), aged as of that week end. An
+    # opportunity without Created Date gives one row of unknown age, as it would be scored.
+    features = feature_frame(data)
+    stages = data["Stage"].astype(str).to_numpy()
+    created = _parse_dates(data[_find_column(data, "Created Date")]).dt.normalize()
+    duration = pd.to_numeric(data[_find_column(data, "Deal Opened (Days)")], errors="coerce").to_numpy(dtype="float64")
+    first = ((6 - created.dt.dayofweek) % SNAPSHOT_DAYS).to_numpy(dtype="float64")  # Age at the first Sunday
+    closed = np.isin(stages, CLASSES)
+    n = np.where(first < duration, (duration - first - 1) // SNAPSHOT_DAYS + 1, 0)
+    n = np.where(created.isna().to_numpy(), 1, np.nan_to_num(n)).astype(np.int64) * closed
+    rows = np.repeat(np.arange(len(data)), n)
+    step = np.arange(len(rows)) - np.repeat(np.cumsum(n) - n, n)  # Snapshot number within the opportunity
+    examples = features.iloc[rows].reset_index(drop=True)
+    examples["Age (Days)"] = first[rows] + step * SNAPSHOT_DAYS
+    return examples, stages[rows]
+
+
+class FeaturePipeline:
+
+    def __init__(self, vocabularies, edges):
+        self.vocabularies = vocabularies  # categorical feature -> known values (code = position + 1)
+        self.edges = edges  # numeric feature -> inner bin edges (code = bin + 1)
+
+    @classmethod
+    def fit(cls, features, n_bins=N_BINS):
+        vocabularies = {name: sorted(features[name].dropna().unique().tolist()) for name in CATEGORICAL_FEATURES}
+        edges = {}
+        for name in NUMERIC_FEATURES:
+            values = features[name].to_numpy(dtype="float64")
+            values = values[~np.isnan(values)]
+            quantiles = np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1]) if values.size else []
+            edges[name] = np.unique(quantiles).tolist()
+        return cls(vocabularies, edges)
+
+    def extend(self, features):
+        # Appends the categories not seen yet (codes of the known ones do not change)
+        for name in CATEGORICAL_FEATURES:
+            known = set(self.vocabularies[name])
+            self.vocabularies[name] += sorted(value for value in features[name].dropna().unique().tolist() if value not in known)
+
+    @property
+    def features(self):
+        return CATEGORICAL_FEATURES + NUMERIC_FEATURES
+
+    def n_codes(self, name):
+        if name in self.vocabularies:
+            return len(self.vocabularies[name]) + 1
+        return len(self.edges[name]) + 2
+
+    def transform(self, features):
+        # (rows, features) matrix of integer codes
+        codes = np.zeros((len(features), len(self.features)), dtype=np.int32)
+        for i, name in enumerate(self.features):
+            if name in self.vocabularies:
+                codes[:, i] = pd.Categorical(features[name], categories=self.vocabularies[name]).codes + 1
+            else:
+                values = features[name].to_numpy(dtype="float64")
+                binned = np.searchsorted(self.edges[name], values, side="right") + 1
+                codes[:, i] = np.where(np.isnan(values), 0, binned)
+        return codes
+
+    def to_dict(self):
+        return {"vocabularies": self.vocabularies, "edges": self.edges}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state["vocabularies"], state["edges"])
+
+
+class StageModel:
+
+    def __init__(self, pipeline, counts=None, class_counts=None, metadata=None):
+        self.pipeline = pipeline
+        # feature -> (classes, codes) counts
+        self.counts = counts or {name: np.zeros((len(CLASSES), pipeline.n_codes(name))) for name in pipeline.features}
+        self.class_counts = np.zeros(len(CLASSES)) if class_counts is None else np.asarray(class_counts, dtype="float64")
+        self.metadata = metadata or {}
+        self._tables = None
+
+    def resize(self):
+        # Zero counts for the codes added to the pipeline since the counts were made
+        for name in self.pipeline.features:
+            missing = self.pipeline.n_codes(name) - self.counts[name].shape[1]
+            if missing > 0:
+                self.counts[name] = np.pad(self.counts[name], ((0, 0), (0, missing)))
+                self._tables = None
+        return self
+
+    def partial_fit(self, features, stages):
+        # Adds the counts of a batch of labelled rows (rows of other stages are ignored)
+        labels = pd.Categorical(stages, categories=CLASSES).codes
+        known = labels >= 0
+        codes = self.pipeline.transform(features[known])
+        labels = labels[known]
+        for i, name in enumerate(self.pipeline.features):
+            n_codes = self.pipeline.n_codes(name)
+            self.counts[name] += np.bincount(labels * n_codes + codes[:, i], minlength=len(CLASSES) * n_codes).reshape(len(CLASSES), n_codes)
+        self.class_counts += np.bincount(labels, minlength=len(CLASSES))
+        self._tables = None
+        return self
+
+    def merge(self, other):
+        # In-place merge of a model trained on other rows (same pipeline)
+        for name in self.pipeline.features:
+            self.counts[name] += other.counts[name]
+        self.class_counts += other.class_counts
+        self._tables = None
+        return self
+
+    def _log_odds_tables(self):
+        # (prior log-odds, flat table of per-code log-odds, offset of each feature in the table)
+        if self._tables is None:
+            tables = []
+            for name in self.pipeline.features:
+                smoothed = self.counts[name] + ALPHA
+                likelihood = np.log(smoothed / smoothed.sum(axis=1, keepdims=True))
+                tables.append(likelihood[1] - likelihood[0])
+            offsets = np.cumsum([0] + [len(table) for table in tables[:-1]])
+            prior = np.log((self.class_counts[1] + ALPHA) / (self.class_counts[0] + ALPHA))
+            self._tables = (prior, np.concatenate(tables), offsets)
+        return self._tables
+
+    def predict_proba(self, features):
+        # Probability of the positive class (Closed Won) for every row
+        prior, table, offsets = self._log_odds_tables()
+        log_odds = prior + table[self.pipeline.transform(features) + offsets].sum(axis=1)
+        return 1 / (1 + np.exp(-log_odds))
+
+    def score(self, data, as_of=None):
+        # Input rows with the per-row probabilities and the predicted stage
+        probability = self.predict_proba(feature_frame(data, as_of))
+        scored = data.copy()
+        scored[f"P({CLASSES[1]})"] = probability
+        scored[f"P({CLASSES[0]})"] = 1 - probability
+        scored["Predicted Stage"] = np.where(probability >= 0.5, CLASSES[1], CLASSES[0])
+        return scored
+
+    def counts_to_dict(self):
+        return {
+            "counts": {name: counts.astype(int).tolist() for name, counts in self.counts.items()},
+            "class_counts": self.class_counts.astype(int).tolist(),
+        }
+
+    @classmethod
+    def from_counts(cls, pipeline, state):
+        # Model with stored counts; counts made before the vocabularies grew are padded
+        counts = {name: np.asarray(values, dtype="float64") for name, values in state["counts"].items()}
+        return cls(pipeline, counts, state["class_counts"]).resize()
+
+    def to_dict(self):
+        return {
+            "format_version": FORMAT_VERSION,
+            "classes": CLASSES,
+            "pipeline": self.pipeline.to_dict(),
+            **self.counts_to_dict(),
+            "metadata": self.metadata,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        if state.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Model format version {state.get('format_version')}, expected {FORMAT_VERSION}. Retrain the model.")
+        model = cls.from_counts(FeaturePipeline.from_dict(state["pipeline"]), state)
+        model.metadata = state.get("metadata") or {}
+        return model
+
+
+def save_model(model, path=MODEL_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(model.to_dict(), file)
+    os.replace(tmp_path, path)  # Running apps pick up the new version on their next rerun
+
+
+def load_model(path=MODEL_PATH):
+    with open(path) as file:
+        return StageModel.from_dict(json.load(file))
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)  # Loaded once per artifact version, shared by every session.
+def _load_cached(path, version):
+    cache_miss()
+    return load_model(path)
+
+
+def get_model(path=MODEL_PATH):
+    # Shared model (raises FileNotFoundError when it was never trained)
+    with cache_lookup("model"):
+        return _load_cached(path, dataset_version(path))
+
+
+# ---- Training ----
+
+def auc_score(labels, scores):
+    # Area under the ROC curve (rank formulation, ties averaged)
+    labels = np.asarray(labels, dtype=bool)
+    ranks = pd.Series(scores).rank().to_numpy()
+    positives, negatives = labels.sum(), (~labels).sum()
+    return float((ranks[labels].sum() - positives * (positives + 1) / 2) / (positives * negatives))
+
+
+def train(data, holdout=0.2, seed=0):
+    # Model fitted on the snapshots of every closed row; the metrics come from a fit without the
+    # holdout opportunities, scored on their snapshots (open opportunities as of a week end)
+    stages = data["Stage"].astype(str).to_numpy()
+    test = np.random.default_rng(seed).random(len(data)) < holdout if holdout else np.zeros(len(data), dtype=bool)
+    examples = {part: snapshot_examples(data[mask]) for part, mask in (("train", ~test), ("test", test))}
+    features = pd.concat([examples["train"][0], examples["test"][0]], ignore_index=True)
+    labels = np.concatenate([examples["train"][1], examples["test"][1]])
+    pipeline = FeaturePipeline.fit(features)
+
+    metadata = {"trained_rows": int(np.isin(stages, CLASSES).sum()), "snapshots": len(features)}
+    if holdout:
+        evaluation = StageModel(pipeline).partial_fit(*examples["train"])
+        probability = evaluation.predict_proba(examples["test"][0])
+        actual = examples["test"][1] == CLASSES[1]
+        metadata["holdout"] = {
+            "rows": int(len(actual)),
+            "accuracy": round(float(((probability >= 0.5) == actual).mean()), 4),
+            "auc": round(auc_score(actual, probability), 4),
+        }
+    return StageModel(pipeline, metadata=metadata).partial_fit(features, labels)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the stage prediction model")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--holdout", type=float, default=0.2, help="Share of rows kept out to measure the model")
+    parser.add_argument("--output", default=MODEL_PATH)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.data):
+        sys.exit(f"Data file not found: {args.data}")
+    model = train(read_data(args.data), args.holdout)
+    save_model(model, args.output)
+    print(f"Trained on {model.metadata['trained_rows']} closed rows ({model.metadata['snapshots']} snapshots) -> {args.output}")
+    if "holdout" in model.metadata:
+        print("Holdout:", model.metadata["holdout"])
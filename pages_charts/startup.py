@@ -0,0 +1,267 @@
+import os
+import sys
+import ast
+import json
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import urllib.request
+
+# Base directory of the project (one level up from pages_charts/). Not imported from
+# data_loader: the server must start without loading pandas first.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ------------- Cold Start ----------
+#   python -m pages_charts.startup serve [streamlit options]   # instead of: streamlit run app_st.py
+#   python -m pages_charts.startup check [--budget 5.0]
+#
+# Importing the app modules does no data or figure work (checked below), and
+# plotly.express is only imported when a page rebuilds its figures. "serve" starts
+# the Streamlit server at once and warms the process up in a background thread:
+# the plotly template / validators (paid once per process by the first chart), the
+# data, the filter index, the aggregates, the page figures and the stage model.
+# Sessions that arrive during the warm-up wait on the same cache entries instead
+# of computing them twice, and the warm-up pauses between its steps while a session
+# script runs, so it does not compete with the page being rendered.
+# The warm-up starts once the server accepts connections, so it does not delay it.
+# "check" measures the startup in fresh processes and fails above the budget: the
+# budget runs from the "serve" process start to the end of the first page run of a
+# session opened on the server (websocket, as a browser does), not to the health check.
+
+APP_PATH = os.path.join(BASE_DIR, "app_st.py")
+
+STARTUP_BUDGET_SECONDS = 5.0  # Process start -> first page rendered through the server
+
+RESULT_PREFIX = "STARTUP_RESULT "
+
+HEALTH_PATH = "/_stcore/health"
+
+STREAM_PATH = "/_stcore/stream"  # Session websocket of the browser
+
+
+def app_modules(app_path=APP_PATH):
+    # Project modules imported by the app script
+    with open(app_path) as file:
+        tree = ast.parse(file.read())
+    return sorted({node.module for node in ast.walk(tree) if isinstance(node, ast.ImportFrom) and node.module.startswith("pages_charts")})
+
+
+def warm_up(yield_to_sessions=False):
+    # Pays the one-time costs of a process before the first session needs them. With
+    # yield_to_sessions, each step waits while a session script is running: on a small
+    # machine the warm-up would otherwise slow down the page being rendered.
+    import plotly.graph_objects as go
+    from pages_charts.instrumentation import reruns_running
+    from pages_charts.filters import get_filter_index
+    from pages_charts.data_loader import OUT_OF_CORE, load_data
+    from pages_charts.figure_registry import PAGE_FIGURES, get_registry
+    from pages_charts.aggregate_cube import get_cube
+    from pages_charts.profile_engine import get_profile
+    from pages_charts.calendar_rollup import get_daily_rollup
+    from pages_charts.cohort_engine import get_cohorts
+    from pages_charts.stage_model import MODEL_PATH, get_model
+    from pages_charts.question_engine import get_question_cube, get_vocabulary
+
+    steps = [go.Figure]  # Loads the default template and the layout validators
+    if not OUT_OF_CORE:
+        steps.append(load_data)
+    steps.append(get_filter_index)
+    # Most pages show artifacts only: keep them in the registry
+    steps += [lambda page=page: get_registry().page_figures(page) for page in PAGE_FIGURES]
+    steps += [get_cube, get_profile, get_daily_rollup, get_cohorts, get_question_cube, get_vocabulary]
+    if os.path.exists(MODEL_PATH):
+        steps.append(get_model)
+
+    start = time.perf_counter()
+    for step in steps:
+        while yield_to_sessions and reruns_running():
+            time.sleep(0.02)
+        step()
+    return time.perf_counter() - start
+
+
+def _wait_for_server(timeout=30):
+    from streamlit.runtime import Runtime, RuntimeState
+
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if Runtime.exists() and Runtime.instance().state != RuntimeState.INITIAL:
+            return
+        time.sleep(0.05)
+
+
+def start_warm_up(wait_for_server=True):
+    def run():
+        if wait_for_server:
+            _wait_for_server()
+        warm_up(yield_to_sessions=True)
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def serve(streamlit_args):
+    from streamlit.web import cli
+
+    start_warm_up()
+    sys.argv = ["streamlit", "run", APP_PATH, *streamlit_args]
+    sys.exit(cli.main())
+
+
+# ---- Measurements (fresh processes) ----
+
+def _run_python(code, timeout=300):
+    output = subprocess.run([sys.executable, "-c", code], cwd=BASE_DIR, capture_output=True, text=True, timeout=timeout)
+    lines = [line for line in output.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+    if output.returncode or not lines:
+        raise RuntimeError(f"Startup measurement failed:\n{output.stderr[-2000:]}")
+    return json.loads(lines[-1][len(RESULT_PREFIX):])
+
+
+def measure_import():
+    # Import time of the app modules (Streamlit is already loaded by the server), and
+    # the data / figure work they did at import time (must be none)
+    code = f"""
+import sys, time, json, importlib
+import streamlit
+from pages_charts.instrumentation import finish_rerun, start_rerun
+start_rerun()
+start = time.perf_counter()
+for name in {app_modules()!r}:
+    importlib.import_module(name)
+seconds = time.perf_counter() - start
+spans = finish_rerun()["spans"]
+print({RESULT_PREFIX!r} + json.dumps({{"seconds": seconds, "import_time_work": [span["name"] for span in spans], "plotly_express": "plotly.express" in sys.modules}}))
+"""
+    return _run_python(code)
+
+
+def import_failures(imports=None):
+    # [failures] of the app imports: data / figure work done at import time, plotly.express loaded
+    imports = imports or measure_import()
+    failures = []
+    if imports["import_time_work"]:
+        failures.append(f"Import-time work: {', '.join(imports['import_time_work'])}")
+    if imports["plotly_express"]:
+        failures.append("plotly.express is imported at startup")
+    return failures
+
+
+def measure_first_page(warm=False):
+    # Seconds of the first render of the Home page in a new process (optionally after the warm-up)
+    code = f"""
+import time, json
+from streamlit.testing.v1 import AppTest
+from pages_charts.startup import warm_up
+warm_seconds = warm_up() if {warm!r} else 0.0
+app = AppTest.from_file({APP_PATH!r}, default_timeout=600)
+start = time.perf_counter()
+app.run()
+seconds = time.perf_counter() - start
+if app.exception:
+    raise SystemExit(app.exception[0].message)
+print({RESULT_PREFIX!r} + json.dumps({{"seconds": seconds, "warm_up_seconds": warm_seconds}}))
+"""
+    return _run_python(code)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _first_page_run(port, timeout):
+    # Opens a session like a browser and runs the page; returns the exceptions it rendered
+    from tornado.ioloop import IOLoop
+    from tornado.websocket import websocket_connect
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    async def run():
+        connection = await websocket_connect(f"ws://127.0.0.1:{port}{STREAM_PATH}", subprotocols=["streamlit"])
+        request = BackMsg()
+        request.rerun_script.query_string = ""
+        await connection.write_message(request.SerializeToString(), binary=True)
+        exceptions = []
+        while True:
+            data = await connection.read_message()
+            if data is None:
+                raise RuntimeError("The server closed the session during the first page run")
+            message = ForwardMsg()
+            message.ParseFromString(data)
+            if message.WhichOneof("type") == "delta" and message.delta.new_element.WhichOneof("type") == "exception":
+                exceptions.append(message.delta.new_element.exception.message)
+            if message.WhichOneof("type") == "script_finished":
+                if message.script_finished != ForwardMsg.FINISHED_SUCCESSFULLY:
+                    exceptions.append(f"Script finished with status {message.script_finished}")
+                connection.close()
+                return exceptions
+
+    return IOLoop.current().run_sync(run, timeout=timeout)
+
+
+def measure_served(timeout=60):
+    # Seconds from "serve" process start to the first successful health check ("ready") and to
+    # the end of the first page run of a session ("first_page")
+    port = _free_port()
+    command = [sys.executable, "-m", "pages_charts.startup", "serve", "--server.headless", "true",
+               "--server.port", str(port), "--browser.gatherUsageStats", "false"]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = None
+        while ready is None and time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError("The server exited during startup")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{HEALTH_PATH}", timeout=1) as response:
+                    if response.status == 200:
+                        ready = time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        if ready is None:
+            raise TimeoutError(f"The server was not ready after {timeout}s")
+        exceptions = _first_page_run(port, timeout)
+        return {"ready": ready, "first_page": time.perf_counter() - start, "exceptions": exceptions}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def check_startup(budget=STARTUP_BUDGET_SECONDS):
+    # [failures] of the startup checks; prints the measurements
+    imports = measure_import()
+    served = measure_served()
+    cold = measure_first_page(warm=False)
+    warm = measure_first_page(warm=True)
+    print(f"Server ready:                 {served['ready'] * 1000:8.0f} ms")
+    print(f"First page served:            {served['first_page'] * 1000:8.0f} ms (budget {budget * 1000:.0f} ms)")
+    print(f"App module imports:           {imports['seconds'] * 1000:8.0f} ms")
+    print(f"First page, cold process:     {cold['seconds'] * 1000:8.0f} ms")
+    print(f"First page, after warm-up:    {warm['seconds'] * 1000:8.0f} ms (warm-up {warm['warm_up_seconds'] * 1000:.0f} ms)")
+
+    failures = import_failures(imports) + [f"First page: {message}" for message in served["exceptions"]]
+    if served["first_page"] > budget:
+        failures.append(f"First page served in {served['first_page']:.2f}s, budget {budget:.2f}s")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fast cold start of the dashboard")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("serve", help="Run the app with a background warm-up (extra options go to streamlit run)")
+    check = commands.add_parser("check", help="Measure the startup and compare it to the budget")
+    check.add_argument("--budget", type=float, default=STARTUP_BUDGET_SECONDS, help="Seconds until the first page is rendered through the server")
+    args, extra = parser.parse_known_args()
+
+    if args.command == "serve":
+        serve(extra)
+    failures = check_startup(args.budget)
+    if failures:
+        print("Startup budget exceeded:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("Startup within budget")
@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pages_charts.data_loader import BASE_DIR, read_data
+from pages_charts.ingest import OUTPUT_COLUMNS, _partition_dir, compact
+
+# ------------- Synthetic Sales Data ----------
+#   python -m pages_charts.synthetic ROWS [--output DIR] [--chunk-rows N] [--workers N] [--seed S] [--compact FILE]
+#
+# Learns from the real processed file:
+#   - the joint distribution of Stage, Country, Segment, Account Type, Type, Lead
+#     Source and Close Reason (observed combinations and their frequencies);
+#   - the other text columns conditionally on one parent column (Region | Country...);
+#   - Opp Value (EUR) | Stage x Account Type x Type and Deal Opened (Days) | Stage x
+#     close month as empirical quantile functions (groups with fewer than
+#     MIN_GROUP_ROWS rows fall back to their Stage), and Close Date | Stage as a day
+#     histogram. Created Date = Close Date - Deal Opened (Days): the export is a
+#     close-date cohort, so this keeps the dates inside the observed period.
+# Rows are generated in independent chunks (one seed each, so the output does not
+# depend on the number of workers) by a process pool, and every chunk is written
+# straight to the Close Date month partitions used by ingest.py. Memory stays
+# bounded by workers x chunk rows, whatever the total number of rows.
+
+SYNTHETIC_DIR = os.path.join(BASE_DIR, "data", "synthetic")
+
+JOINT_COLUMNS = ["Stage", "Country", "Segment", " Account Type", "Type", "Lead Source", "Close Reason"]
+
+# Other text columns: (column, parent column or None for the marginal distribution)
+DEPENDENT_COLUMNS = [
+    ("Region", "Country"),
+    ("Business Type", "Type"),
+    ("Opportunity Owner", "Country"),
+    ("Primary Campaign Source", "Lead Source"),
+    (" Account Name", " Account Type"),
+]
+
+VALUE_GROUP = ["Stage", " Account Type", "Type"]
+
+MIN_GROUP_ROWS = 50
+
+N_QUANTILES = 257
+
+CHUNK_ROWS = 1_000_000
+
+
+def _cdf_rows(counts):
+    # Row-normalized cumulative distributions of a [groups, values] count table
+    cdf = np.cumsum(counts, axis=1, dtype="float64")
+    cdf /= np.maximum(cdf[:, -1:], 1)
+    cdf[:, -1] = 1.0
+    return cdf
+
+
+def _sample_rows(cdf, groups, uniform):
+    # One value index per row from the distribution of its group (all groups in one searchsorted)
+    n_values = cdf.shape[1]
+    flat = (cdf + np.arange(len(cdf))[:, None]).ravel()
+    index = np.searchsorted(flat, uniform + groups, side="right") - groups * n_values
+    return np.clip(index, 0, n_values - 1)
+
+
+def _quantile_table(values, groups, n_groups, stage, n_stages):
+    # [groups, N_QUANTILES] empirical quantile functions and missing-value rates.
+    # The first n_stages groups are the Stage fallbacks, learned from every row of the Stage.
+    table = np.zeros((n_groups, N_QUANTILES))
+    missing = np.zeros(n_groups)
+    probabilities = np.linspace(0, 1, N_QUANTILES)
+    for group in range(n_groups):
+        group_values = values[stage == group] if group < n_stages else values[groups == group]
+        present = group_values[~np.isnan(group_values)]
+        if len(present):
+            table[group] = np.quantile(present, probabilities)
+        missing[group] = 1 - len(present) / max(len(group_values), 1)
+    return table, missing
+
+
+def _sample_quantiles(table, groups, uniform):
+    # Inverse-CDF sampling with linear interpolation between the stored quantiles
+    position = uniform * (table.shape[1] - 1)
+    lower = np.minimum(position.astype(np.int64), table.shape[1] - 2)
+    fraction = position - lower
+    return table[groups, lower] + fraction * (table[groups, lower + 1] - table[groups, lower])
+
+
+def _backoff_groups(fine_codes, stage_codes, n_stages):
+    # Group id per row: the fine group when it has enough rows, else its Stage (ids 0..n_stages-1)
+    fine_ids, fine_index, fine_counts = np.unique(fine_codes, return_inverse=True, return_counts=True)
+    supported = fine_counts >= MIN_GROUP_ROWS
+    group_of_fine = np.full(len(fine_ids), -1)
+    group_of_fine[supported] = n_stages + np.arange(supported.sum())
+    groups = group_of_fine[fine_index]
+    groups = np.where(groups < 0, stage_codes, groups)
+    return groups, fine_ids, group_of_fine, n_stages + int(supported.sum())
+
+
+class SyntheticModel:
+
+    def __init__(self, data):
+        self.categories = {}
+        codes = {}
+        for column in JOINT_COLUMNS + [column for column, _ in DEPENDENT_COLUMNS]:
+            values = data[column].astype("category")
+            self.categories[column] = list(values.cat.categories)
+            codes[column] = values.cat.codes.to_numpy().astype(np.int64)
+        self.n_source_rows = len(data)
+
+        # Joint distribution of the main categorical columns (-1 = missing is kept as a value)
+        joint = np.stack([codes[column] for column in JOINT_COLUMNS], axis=1)
+        self.combinations, counts = np.unique(joint, axis=0, return_counts=True)
+        self.combination_cdf = _cdf_rows(counts[None, :])
+
+        # Dependent text columns
+        self.dependents = {}
+        for column, parent in DEPENDENT_COLUMNS:
+            parent_codes = codes[parent] if parent else np.zeros(len(data), dtype=np.int64)
+            n_parents = len(self.categories[parent]) + 1 if parent else 1  # +1: missing parent (code -1, stored last)
+            table = np.zeros((n_parents, len(self.categories[column]) + 1))  # +1: missing value (stored last)
+            np.add.at(table, (parent_codes, codes[column]), 1)
+            self.dependents[column] = (parent, _cdf_rows(table))
+
+        stage = codes["Stage"]
+        self.n_stages = len(self.categories["Stage"])
+
+        # Opp Value | Stage x Account Type x Type (with backoff)
+        value_fine = np.zeros(len(data), dtype=np.int64)
+        for column in VALUE_GROUP:
+            value_fine = value_fine * (len(self.categories[column]) + 1) + codes[column]
+        value_groups, self.value_fine_ids, self.value_group_of_fine, n_value_groups = _backoff_groups(value_fine, stage, self.n_stages)
+        values = data[" Opp Value (EUR)"].to_numpy(dtype="float64")
+        self.value_quantiles, self.value_missing = _quantile_table(values, value_groups, n_value_groups, stage, self.n_stages)
+
+        # Close Date | Stage, as a day histogram from the first close day
+        close = data["Close Date"].to_numpy().astype("datetime64[D]")
+        self.first_close = close.min()
+        offsets = (close - self.first_close).astype(np.int64)
+        table = np.zeros((self.n_stages, offsets.max() + 1))
+        np.add.at(table, (stage, offsets), 1)
+        self.close_cdf = _cdf_rows(table)
+
+        # Deal Opened (Days) | Stage x close month (with backoff)
+        self.first_month = self.first_close.astype("datetime64[M]")
+        month = (close.astype("datetime64[M]") - self.first_month).astype(np.int64)
+        self.n_months = int(month.max()) + 1
+        days_groups, self.days_fine_ids, self.days_group_of_fine, n_days_groups = _backoff_groups(stage * self.n_months + month, stage, self.n_stages)
+        days = data["Deal Opened (Days)"].to_numpy(dtype="float64")
+        self.days_quantiles, _ = _quantile_table(days, days_groups, n_days_groups, stage, self.n_stages)
+
+    def _fine_to_group(self, fine, fine_ids, group_of_fine, stage):
+        position = np.clip(np.searchsorted(fine_ids, fine), 0, len(fine_ids) - 1)
+        groups = np.where(fine_ids[position] == fine, group_of_fine[position], -1)
+        return np.where(groups < 0, stage, groups)
+
+    def _dictionary(self, column, codes):
+        # Dictionary-encoded text column (code -1 or the "missing" slot -> null)
+        categories = self.categories[column]
+        mask = (codes < 0) | (codes >= len(categories))
+        return pa.DictionaryArray.from_arrays(pa.array(codes, pa.int32(), mask=mask), pa.array(categories, pa.string()))
+
+    def sample(self, n_rows, rng, first_id=0):
+        # pyarrow table of n_rows synthetic rows with the processed-data columns
+        columns = {}
+        combination = _sample_rows(self.combination_cdf, np.zeros(n_rows, dtype=np.int64), rng.random(n_rows))
+        codes = {column: self.combinations[combination, i] for i, column in enumerate(JOINT_COLUMNS)}
+        for column, parent in DEPENDENT_COLUMNS:
+            parent, cdf = self.dependents[column]
+            parent_codes = codes[parent] if parent else np.zeros(n_rows, dtype=np.int64)
+            parent_codes = np.where(parent_codes < 0, len(cdf) - 1, parent_codes)
+            codes[column] = _sample_rows(cdf, parent_codes, rng.random(n_rows))
+        stage = codes["Stage"]
+
+        value_fine = np.zeros(n_rows, dtype=np.int64)
+        for column in VALUE_GROUP:
+            value_fine = value_fine * (len(self.categories[column]) + 1) + codes[column]
+        value_groups = self._fine_to_group(value_fine, self.value_fine_ids, self.value_group_of_fine, stage)
+        values = np.round(_sample_quantiles(self.value_quantiles, value_groups, rng.random(n_rows)), 2)
+        value_missing = rng.random(n_rows) < self.value_missing[value_groups]
+
+        close = self.first_close + _sample_rows(self.close_cdf, stage, rng.random(n_rows))
+        month = (close.astype("datetime64[M]") - self.first_month).astype(np.int64)
+        days_groups = self._fine_to_group(stage * self.n_months + month, self.days_fine_ids, self.days_group_of_fine, stage)
+        days = np.maximum(np.round(_sample_quantiles(self.days_quantiles, days_groups, rng.random(n_rows))), 0).astype(np.int64)
+        created = close - days
+
+        ids = pa.array(np.arange(first_id, first_id + n_rows))
+        columns["Opportunity Name"] = pc.binary_join_element_wise("Opp ", pc.cast(ids, pa.string()), "")
+        columns["Created Date"] = pa.array(created.astype("datetime64[ns]"))
+        columns["Close Date"] = pa.array(close.astype("datetime64[ns]"))
+        columns[" Opp Value (EUR)"] = pa.array(values, mask=value_missing)
+        columns["Deal Opened (Days)"] = pa.array(days)
+        for column in codes:
+            columns[column] = self._dictionary(column, codes[column])
+        return pa.table({column: columns[column] for column in OUTPUT_COLUMNS})
+
+
+# ---- Parallel generation ----
+
+_worker_model = None
+
+
+def _init_worker(model):
+    global _worker_model
+    _worker_model = model
+
+
+def _write_chunk(number, n_rows, seed, first_id, output_dir):
+    # Generates one chunk and writes it to its Close Date month partitions
+    table = _worker_model.sample(n_rows, np.random.default_rng(seed), first_id)
+    month = pc.strftime(table["Close Date"], format="%Y-%m").to_numpy(zero_copy_only=False)
+    order = np.argsort(month, kind="stable")
+    table, month = table.take(order), month[order]
+    keys, starts = np.unique(month, return_index=True)
+    for key, start, stop in zip(keys, starts, list(starts[1:]) + [len(month)]):
+        partition_dir = _partition_dir(output_dir, key)
+        os.makedirs(partition_dir, exist_ok=True)
+        pq.write_table(table.slice(start, stop - start), os.path.join(partition_dir, f"part-{number:06d}.parquet"))
+    return n_rows
+
+
+def generate(n_rows, output_dir=SYNTHETIC_DIR, chunk_rows=CHUNK_ROWS, workers=None, seed=0, model=None):
+    model = model or SyntheticModel(read_data())
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+
+    sizes = [min(chunk_rows, n_rows - start) for start in range(0, n_rows, chunk_rows)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    first_ids = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+    workers = min(workers or os.cpu_count() or 1, len(sizes)) or 1
+
+    start = time.perf_counter()
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model,)) as pool:
+        futures = [pool.submit(_write_chunk, number, size, seeds[number], int(first_ids[number]), output_dir) for number, size in enumerate(sizes)]
+        for future in futures:
+            written += future.result()
+            print(f"\r{written:,} / {n_rows:,} rows", end="", flush=True)
+    print(f"\nGenerated {written:,} rows in {time.perf_counter() - start:.1f}s with {workers} processes -> {output_dir}")
+
+    # Same state file as ingest.py: it identifies the dataset version for the out-of-core mode
+    with open(os.path.join(output_dir, "_ingest_state.json"), "w") as file:
+        json.dump({"watermark": None, "partitions": {}, "synthetic": {"rows": n_rows, "seed": seed}}, file, indent=2)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic sales dataset with the distributions of the real one")
+    parser.add_argument("rows", type=int)
+    parser.add_argument("--output", default=SYNTHETIC_DIR, help="Partitioned output directory (replaced)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compact", metavar="FILE", help="Also write the rows to a single parquet file (like ingest.py)")
+    args = parser.parse_args()
+
+    generate(args.rows, args.output, args.chunk_rows, args.workers, args.seed)
+    if args.compact:
+        compact(args.output, args.compact)